@@ -34,6 +34,8 @@ limitations under the License.
 #include <sys/mman.h>
 #include <sys/stat.h>        /* For mode constants */
 #include <fcntl.h>           /* For O_* constants */
+// pro NAN
+#include <math.h>
 
 #include "KB_shm.h"
 
@@ -277,6 +279,577 @@ size_t KBStringSizeOf(KBString *kb_str)
 	return sizeOf;
 }
 
+/*       _\|/_
+         (o o)
+ +----oOO-{_}-OOo----------------------+
+ | Následují funkce pro typ KBLayouts. |
+ +------------------------------------*/
+/**
+ * Vrací název sloupce hlavičky ve tvaru "<TYPE>{FLAGS[PREFIX_OF_VALUE]}NAME" (typ je jen v prvním sloupci).
+ */
+static char * headColumnName(char *column)
+{
+	char *end;
+	
+	if (*column == '<' && (end = strchr(column, '>')) != NULL)
+	{
+		column = end + 1;
+	}
+	
+	if (*column == '{')
+	{
+		while (*column != '\0' && *column != '}')
+		{
+			// prefix hodnoty může obsahovat i znak '}'
+			if (*column == '[' && (end = strchr(column, ']')) != NULL)
+			{
+				column = end;
+			}
+			column++;
+		}
+		if (*column == '}')
+		{
+			column++;
+		}
+	}
+	
+	return column;
+}
+
+/**
+ * Zjistí zda-li je typem řádku hlavičky s prvním sloupcem \a column typ \a type.
+ */
+static bool headColumnHasType(char *column, char *type)
+{
+	size_t type_length = strlen(type);
+	
+	return column[0] == '<' && strncmp(column + 1, type, type_length) == 0 && column[type_length + 1] == '>';
+}
+
+int KBLayoutsInit(KBLayouts *layouts, KBStringVector *head, KBStringVector *data)
+{
+	char **names = NULL;
+	unsigned num_names = 0;
+	unsigned capacity = 0;
+	size_t names_length = 0;
+	String names_str;
+	unsigned type_name_id = 0;
+	TStrLen type_col = 0;
+	
+	KBLayoutsInitEmpty(layouts);
+	StringInitEmpty(&names_str);
+	
+	#define CHECK_M_FREE() \
+	{ \
+		free(names); \
+		deleteString(&names_str); \
+		deleteKBLayouts(layouts); \
+	}
+	
+	#define CHECK(cond) \
+	if ( cond ) \
+	{ \
+		perror( #cond ); \
+		CHECK_M_FREE(); \
+		return EXIT_FAILURE; \
+	}
+	
+	/* Různé názvy sloupců všech řádků hlavičky */
+	for (unsigned i=0; i < head->length; i++)
+	{
+		KBString *line = KBStringVectorAt(head, i);
+		capacity += line->num_offsets;
+	}
+	CHECK( (names = malloc( (capacity + 1) * sizeof(char *) )) == NULL );
+	
+	for (unsigned i=0; i < head->length; i++)
+	{
+		KBString *line = KBStringVectorAt(head, i);
+		for (TStrLen col=0; col < line->num_offsets; col++)
+		{
+			char *name = headColumnName(line->str + line->offsets[col]);
+			unsigned id = 0;
+			while (id < num_names && strcmp(names[id], name) != 0)
+				id++;
+			if (id == num_names)
+			{
+				names[num_names++] = name;
+				names_length += strlen(name) + 1;
+			}
+		}
+	}
+	
+	/* Názvy sloupců se uloží jako KBString s oddělovačem '\t' (offset každého názvu odpovídá jeho id) */
+	CHECK( (names_str.str = malloc( names_length + 1 )) == NULL );
+	names_str.capacity = names_length + 1;
+	for (unsigned id=0; id < num_names; id++)
+	{
+		size_t length = strlen(names[id]);
+		memcpy(names_str.str + names_str.length, names[id], length);
+		names_str.length += length;
+		names_str.str[names_str.length++] = '\t';
+	}
+	names_str.length -= (num_names > 0); // bez posledního oddělovače
+	names_str.str[names_str.length] = '\0';
+	if (names_str.length >= USHRT_MAX)
+	{
+		ERROR("Too long column names in the head!");
+		if (errno == 0) {errno = EOVERFLOW;}
+		CHECK_M_FREE();
+		return EXIT_FAILURE;
+	}
+	CHECK( KBStringInit(&layouts->column_names, &names_str, '\t') );
+	
+	/* Sloupce podle id názvu pro každé rozložení */
+	layouts->num_layouts = head->length;
+	CHECK( (layouts->columns = calloc( head->length * num_names + 1, sizeof(TStrLen) )) == NULL );
+	for (unsigned i=0; i < head->length; i++)
+	{
+		KBString *line = KBStringVectorAt(head, i);
+		for (TStrLen col=0; col < line->num_offsets; col++)
+		{
+			char *name = headColumnName(line->str + line->offsets[col]);
+			unsigned id = 0;
+			while (strcmp(names[id], name) != 0)
+				id++;
+			layouts->columns[i * num_names + id] = col + 1;
+			
+			if (strcmp(name, "TYPE") == 0)
+			{
+				type_name_id = id + 1;
+			}
+		}
+	}
+	
+	/* Sloupec s typem entity musí být u všech typů stejný */
+	for (unsigned i=0; type_name_id && i < head->length; i++)
+	{
+		TStrLen col = layouts->columns[i * num_names + type_name_id - 1];
+		if (col == 0)
+			continue;
+		if (type_col == 0)
+		{
+			type_col = col;
+		}
+		else if (type_col != col)
+		{
+			ERROR("TYPE column must be at same column for each type of entity in the head!");
+			if (errno == 0) {errno = EINVAL;}
+			CHECK_M_FREE();
+			return EXIT_FAILURE;
+		}
+	}
+	
+	/* Rozložení každého řádku dat (při více řádcích hlavičky se stejným typem platí poslední) */
+	layouts->num_data = data->length;
+	CHECK( (layouts->data_layouts = calloc( data->length + 1, sizeof(TLayout) )) == NULL );
+	for (unsigned i=0; type_col && i < data->length; i++)
+	{
+		KBString *line = KBStringVectorAt(data, i);
+		if (line->str == NULL || type_col > line->num_offsets)
+			continue;
+		
+		char *type = line->str + line->offsets[type_col - 1];
+		for (unsigned j=head->length; j > 0; j--)
+		{
+			KBString *head_line = KBStringVectorAt(head, j - 1);
+			if (headColumnHasType(head_line->str, type))
+			{
+				layouts->data_layouts[i] = j;
+				break;
+			}
+		}
+	}
+	
+	#undef CHECK
+	#undef CHECK_M_FREE
+	
+	free(names);
+	deleteString(&names_str);
+	
+	return EXIT_SUCCESS;
+}
+
+void KBLayoutsInitEmpty(KBLayouts *layouts)
+{
+	/* Inicializace dat */
+	KBStringInitEmpty(&layouts->column_names);
+	layouts->columns = NULL;
+	layouts->data_layouts = NULL;
+	layouts->num_layouts = 0;
+	layouts->num_data = 0;
+	layouts->is_offset = false;
+}
+
+void deleteKBLayouts(KBLayouts *layouts)
+{
+	if (layouts->is_offset)
+		return;
+	
+	deleteKBString(&layouts->column_names);
+	FREE(layouts->columns);
+	FREE(layouts->data_layouts);
+	layouts->num_layouts = 0;
+	layouts->num_data = 0;
+}
+
+void KBLayoutsCopyToShm(KBLayouts *dest, KBLayouts *source, void **freespace)
+{
+	size_t sizeOf = 0;
+	
+	/* Inicializace dat */
+	dest->num_layouts = source->num_layouts;
+	dest->num_data = source->num_data;
+	dest->is_offset = true;
+	
+	/* Zkopírování dat */
+	KBStringCopyToShm( &dest->column_names, &source->column_names, freespace );
+	
+	// matice sloupců
+	sizeOf = (dest->num_layouts) * (dest->column_names.num_offsets) * sizeof(TStrLen);
+	
+	dest->columns = OFFSET_GIVE(dest, *freespace);
+	*freespace = OFFSET_2_P( *freespace, sizeOf);
+	
+	memcpy( OFFSET_2_P( dest, dest->columns ), source->columns, sizeOf );
+	
+	// rozložení řádků dat
+	sizeOf = (dest->num_data) * sizeof(TLayout);
+	
+	dest->data_layouts = OFFSET_GIVE(dest, *freespace);
+	*freespace = OFFSET_2_P( *freespace, sizeOf);
+	
+	memcpy( OFFSET_2_P( dest, dest->data_layouts ), source->data_layouts, sizeOf );
+}
+
+size_t KBLayoutsSizeOf(KBLayouts *layouts)
+{
+	size_t sizeOf = 0;
+	
+	sizeOf += KBStringSizeOf( &layouts->column_names ); // názvy sloupců
+	sizeOf += (layouts->num_layouts) * (layouts->column_names.num_offsets) * sizeof(TStrLen); // matice sloupců
+	sizeOf += (layouts->num_data) * sizeof(TLayout); // rozložení řádků dat
+	
+	return sizeOf;
+}
+
+/*       _\|/_
+         (o o)
+ +----oOO-{_}-OOo-----------------------+
+ | Následují funkce pro typ KBNumerics. |
+ +-------------------------------------*/
+/**
+ * Zjistí zda-li má sloupec hlavičky \a column mezi příznaky příznak \a flag.
+ */
+static bool headColumnHasFlag(char *column, char flag)
+{
+	char *end;
+	
+	if (*column == '<' && (end = strchr(column, '>')) != NULL)
+	{
+		column = end + 1;
+	}
+	
+	if (*column != '{')
+	{
+		return false;
+	}
+	
+	for (column++; *column != '\0' && *column != '}' && *column != '['; column++)
+	{
+		if (*column == flag)
+		{
+			return true;
+		}
+	}
+	
+	return false;
+}
+
+/**
+ * Vrací hodnotu sloupce s id názvu \a name_id (od 0) na řádku dat \a line (od 0), NULL pokud jej řádek nemá.
+ */
+static char * layoutsDataValue(KBLayouts *layouts, KBStringVector *data, unsigned line, unsigned name_id)
+{
+	KBString *kb_str = KBStringVectorAt(data, line);
+	TLayout layout = layouts->data_layouts[line];
+	TStrLen col;
+	
+	if (layout == 0 || kb_str->str == NULL)
+	{
+		return NULL;
+	}
+	
+	col = layouts->columns[(layout - 1) * layouts->column_names.num_offsets + name_id];
+	if (col == 0 || col > kb_str->num_offsets)
+	{
+		return NULL;
+	}
+	
+	return kb_str->str + kb_str->offsets[col - 1];
+}
+
+/**
+ * Vrací typ čísla v neprázdném řetězci \a value (KB_NUMERIC_NONE pokud není číslem) a do \a number uloží jeho hodnotu.
+ */
+static TNumericType numericValue(char *value, TNumeric *number)
+{
+	int saved_errno = errno;
+	TNumericType type = KB_NUMERIC_NONE;
+	char *end;
+	
+	errno = 0;
+	number->i = strtoll(value, &end, 10);
+	if (end != value && *end == '\0' && errno == 0)
+	{
+		type = KB_NUMERIC_INT;
+	}
+	else
+	{
+		errno = 0;
+		number->f = strtod(value, &end);
+		if (end != value && *end == '\0' && errno == 0)
+		{
+			type = KB_NUMERIC_FLOAT;
+		}
+	}
+	
+	errno = saved_errno;
+	return type;
+}
+
+/**
+ * Zjistí typ sloupce s id názvu \a name_id (od 0) z příznaků v hlavičce \a head a z jeho hodnot v datech \a data.
+ * Typ nedeklarovaného sloupce se zjišťuje z hodnot, jen pokud je sloupec vyžádaný (\a requested).
+ */
+static TNumericType numericColumnType(KBLayouts *layouts, KBStringVector *head, KBStringVector *data, unsigned name_id, bool requested)
+{
+	unsigned num_names = layouts->column_names.num_offsets;
+	TNumericType type = KB_NUMERIC_INT;
+	bool declared = false;
+	bool has_value = false;
+	bool has_missing = false;
+	TNumeric number;
+	
+	/* Příznaky sloupce ve všech řádcích hlavičky */
+	for (unsigned i=0; i < layouts->num_layouts; i++)
+	{
+		KBString *line = KBStringVectorAt(head, i);
+		TStrLen col = layouts->columns[i * num_names + name_id];
+		if (col == 0)
+			continue;
+		
+		char *column = line->str + line->offsets[col - 1];
+		if (headColumnHasFlag(column, KB_FLAG_MULTIPLE_VALUES))
+		{
+			return KB_NUMERIC_NONE;
+		}
+		if (headColumnHasFlag(column, KB_FLAG_NUMERIC))
+		{
+			declared = true;
+		}
+	}
+	
+	/* Ostatní sloupce se neprocházejí (pole hodnot by se alokovalo pro každý číselně vypadající sloupec) */
+	if (!declared && !requested)
+	{
+		return KB_NUMERIC_NONE;
+	}
+	
+	/* Hodnoty sloupce (nedeklarovaný sloupec končí první hodnotou, která není číslem) */
+	for (unsigned i=0; i < data->length; i++)
+	{
+		char *value = layoutsDataValue(layouts, data, i, name_id);
+		if (value == NULL || *value == '\0')
+		{
+			has_missing = true;
+			continue;
+		}
+		
+		has_value = true;
+		switch (numericValue(value, &number))
+		{
+			case KB_NUMERIC_INT:
+				break;
+			case KB_NUMERIC_FLOAT:
+				type = KB_NUMERIC_FLOAT;
+				break;
+			default:
+				if (!declared)
+				{
+					return KB_NUMERIC_NONE;
+				}
+				type = KB_NUMERIC_FLOAT;
+				break;
+		}
+	}
+	
+	if (!has_value && !declared)
+	{
+		return KB_NUMERIC_NONE;
+	}
+	
+	/* Chybějící hodnota je NaN, které celé číslo nemá */
+	return has_missing ? KB_NUMERIC_FLOAT : type;
+}
+
+int KBNumericsInit(KBNumerics *numerics, KBLayouts *layouts, KBStringVector *head, KBStringVector *data, char **requested, unsigned num_requested)
+{
+	unsigned num_names = layouts->column_names.num_offsets;
+	unsigned *types = NULL;
+	
+	KBNumericsInitEmpty(numerics);
+	
+	#define CHECK_M_FREE() \
+	{ \
+		free(types); \
+		deleteKBNumerics(numerics); \
+	}
+	
+	#define CHECK(cond) \
+	if ( cond ) \
+	{ \
+		perror( #cond ); \
+		CHECK_M_FREE(); \
+		return EXIT_FAILURE; \
+	}
+	
+	/* Typ každého názvu sloupce */
+	CHECK( (types = calloc( num_names + 1, sizeof(unsigned) )) == NULL );
+	for (unsigned id=0; id < num_names; id++)
+	{
+		char *name = layouts->column_names.str + layouts->column_names.offsets[id];
+		bool is_requested = false;
+		for (unsigned r=0; r < num_requested && !is_requested; r++)
+			is_requested = (strcmp(requested[r], name) == 0);
+		
+		types[id] = numericColumnType(layouts, head, data, id, is_requested);
+		numerics->num_columns += (types[id] != KB_NUMERIC_NONE);
+	}
+	
+	numerics->num_data = data->length;
+	CHECK( (numerics->name_ids = calloc( numerics->num_columns + 1, sizeof(unsigned) )) == NULL );
+	CHECK( (numerics->types = calloc( numerics->num_columns + 1, sizeof(unsigned) )) == NULL );
+	CHECK( (numerics->values = calloc( (size_t)numerics->num_columns * (numerics->num_data + 1) + 1, sizeof(TNumeric) )) == NULL );
+	
+	/* Hodnoty číselných sloupců (calloc vynuloval celočíselné, desetinné sloupce jsou až do zápisu hodnoty NaN) */
+	for (unsigned id=0, n=0; id < num_names; id++)
+	{
+		if (types[id] == KB_NUMERIC_NONE)
+			continue;
+		
+		TNumeric *values = numerics->values + (size_t)n * (numerics->num_data + 1);
+		numerics->name_ids[n] = id + 1;
+		numerics->types[n] = types[id];
+		n++;
+		
+		if (types[id] == KB_NUMERIC_FLOAT)
+		{
+			for (unsigned i=0; i <= data->length; i++)
+				values[i].f = NAN;
+		}
+		
+		for (unsigned i=0; i < data->length; i++)
+		{
+			char *value = layoutsDataValue(layouts, data, i, id);
+			TNumeric number;
+			if (value == NULL || *value == '\0')
+				continue;
+			
+			switch (numericValue(value, &number))
+			{
+				case KB_NUMERIC_INT:
+					if (types[id] == KB_NUMERIC_INT)
+						values[i + 1].i = number.i;
+					else
+						values[i + 1].f = (double)number.i;
+					break;
+				case KB_NUMERIC_FLOAT:
+					values[i + 1].f = number.f;
+					break;
+				default:
+					values[i + 1].f = NAN;
+					break;
+			}
+		}
+	}
+	
+	#undef CHECK
+	#undef CHECK_M_FREE
+	
+	free(types);
+	
+	return EXIT_SUCCESS;
+}
+
+void KBNumericsInitEmpty(KBNumerics *numerics)
+{
+	/* Inicializace dat */
+	numerics->name_ids = NULL;
+	numerics->types = NULL;
+	numerics->values = NULL;
+	numerics->num_columns = 0;
+	numerics->num_data = 0;
+	numerics->is_offset = false;
+}
+
+void deleteKBNumerics(KBNumerics *numerics)
+{
+	if (numerics->is_offset)
+		return;
+	
+	FREE(numerics->name_ids);
+	FREE(numerics->types);
+	FREE(numerics->values);
+	numerics->num_columns = 0;
+	numerics->num_data = 0;
+}
+
+void KBNumericsCopyToShm(KBNumerics *dest, KBNumerics *source, void **freespace)
+{
+	size_t sizeOf = 0;
+	
+	/* Inicializace dat */
+	dest->num_columns = source->num_columns;
+	dest->num_data = source->num_data;
+	dest->is_offset = true;
+	
+	/* Zkopírování dat */
+	// hodnoty (zarovnané, aby je šlo číst přímo jako pole čísel)
+	*freespace = (void *)(((size_t)(*freespace) + sizeof(TNumeric) - 1) / sizeof(TNumeric) * sizeof(TNumeric));
+	sizeOf = (size_t)(dest->num_columns) * (dest->num_data + 1) * sizeof(TNumeric);
+	
+	dest->values = OFFSET_GIVE(dest, *freespace);
+	*freespace = OFFSET_2_P( *freespace, sizeOf);
+	
+	memcpy( OFFSET_2_P( dest, dest->values ), source->values, sizeOf );
+	
+	// id názvů sloupců
+	sizeOf = (dest->num_columns) * sizeof(unsigned);
+	
+	dest->name_ids = OFFSET_GIVE(dest, *freespace);
+	*freespace = OFFSET_2_P( *freespace, sizeOf);
+	
+	memcpy( OFFSET_2_P( dest, dest->name_ids ), source->name_ids, sizeOf );
+	
+	// typy sloupců
+	dest->types = OFFSET_GIVE(dest, *freespace);
+	*freespace = OFFSET_2_P( *freespace, sizeOf);
+	
+	memcpy( OFFSET_2_P( dest, dest->types ), source->types, sizeOf );
+}
+
+size_t KBNumericsSizeOf(KBNumerics *numerics)
+{
+	size_t sizeOf = 0;
+	
+	sizeOf += sizeof(TNumeric) - 1; // zarovnání hodnot
+	sizeOf += (size_t)(numerics->num_columns) * (numerics->num_data + 1) * sizeof(TNumeric); // hodnoty
+	sizeOf += 2 * (numerics->num_columns) * sizeof(unsigned); // id názvů a typy sloupců
+	
+	return sizeOf;
+}
+
 /*       _\|/_
          (o o)
  +----oOO-{_}-OOo------------------------+
@@ -295,8 +868,11 @@ int KBSharedMemInit(KBSharedMem *kb)
 		return EXIT_FAILURE;
 	}
 	
+	KBLayoutsInitEmpty(&kb->layouts);
+	KBNumericsInitEmpty(&kb->numerics);
 	kb->capacity = 0;
 	kb->version = NULL;
+	kb->format = KB_SHM_FORMAT;
 	return EXIT_SUCCESS;
 }
 
@@ -304,6 +880,8 @@ void deleteKBSharedMem(KBSharedMem *kb)
 {
 	deleteKBStringVector(&kb->head);
 	deleteKBStringVector(&kb->data);
+	deleteKBLayouts(&kb->layouts);
+	deleteKBNumerics(&kb->numerics);
 	kb->capacity = 0;
 	free(kb->version);
 }
@@ -313,8 +891,11 @@ size_t KBSharedMemSizeOf(KBSharedMem *kb)
 	size_t sizeOf = 0;
 	
 	sizeOf = sizeof(KBSharedMem);
+	sizeOf += (kb->version != NULL) ? strlen(kb->version) + 1 : 0;
 	sizeOf += KBStringVectorSizeOf(&kb->head);
 	sizeOf += KBStringVectorSizeOf(&kb->data);
+	sizeOf += KBLayoutsSizeOf(&kb->layouts);
+	sizeOf += KBNumericsSizeOf(&kb->numerics);
 	
 	return sizeOf;
 }
@@ -356,13 +937,24 @@ int copy_KB_to_shm(KBSharedMem **dest, KBSharedMem *source)
 	
 	/* Inicializace dat v sdílené paměti */
 	(*dest)->capacity = sizeOfKbShm;
-	(*dest)->version = source->version;
+	(*dest)->format = source->format;
 	
 	/* Kopírování dat */
 	freespace = (*dest);
 	freespace = OFFSET_2_P( freespace, sizeof(KBSharedMem) );
+	
+	// verze (řetězec musí být ve sdílené paměti, aby ji mohli číst i ostatní procesy)
+	if (source->version != NULL)
+	{
+		(*dest)->version = OFFSET_GIVE( (*dest), freespace );
+		strcpy( freespace, source->version );
+		freespace = OFFSET_2_P( freespace, strlen(source->version) + 1 );
+	}
+	
 	KBStringVectorCopyToShm( &(*dest)->head, &source->head, &freespace );
 	KBStringVectorCopyToShm( &(*dest)->data, &source->data, &freespace );
+	KBLayoutsCopyToShm( &(*dest)->layouts, &source->layouts, &freespace );
+	KBNumericsCopyToShm( &(*dest)->numerics, &source->numerics, &freespace );
 	
 #ifdef DEBUG
 	printf("version     = %s\n", source->version );
@@ -40,6 +40,17 @@ limitations under the License.
 #include "global.h"
 #define VERSION_SIZE 20
 
+/**
+ * Formát sdílené paměti (mění se s každou změnou struktur v ní uložených).
+ */
+#define KB_SHM_FORMAT 0x4B420004
+
+/**
+ * Příznaky sloupců v hlavičce ("<TYPE>{FLAGS[PREFIX_OF_VALUE]}NAME").
+ */
+#define KB_FLAG_MULTIPLE_VALUES 'm' /// Sloupec s více hodnotami oddělenými znakem '|'.
+#define KB_FLAG_NUMERIC 'n' /// Číselný sloupec (i když některé hodnoty nejsou čísla).
+
 /*       _\|/_
          (o o)
  +----oOO-{_}-OOo----+
@@ -54,6 +65,7 @@ extern int KB_shm_fd;
  | Struktury a výčtové typy |
  +-------------------------*/
 typedef unsigned short TStrLen;
+typedef unsigned TLayout;
 typedef struct SKBStringVector KBStringVector;
 typedef struct SKBString KBString;
 
@@ -77,6 +89,54 @@ struct SKBStringVector {
 	unsigned capacity;
 };
 
+/**
+ * Rozložení sloupců dat podle typů entit z hlavičky.
+ * Rozložením je řádek hlavičky s typem entity (číslováno od 1, 0 znamená neznámý typ)
+ * a id názvu sloupce je pořadí názvu v \a column_names (číslováno od 1).
+ */
+typedef struct {
+	KBString column_names; /// Různé názvy sloupců ze všech řádků hlavičky.
+	TStrLen *columns; /// Matice [rozložení][id názvu sloupce] -> sloupec dat (od 1, 0 pokud jej typ nemá).
+	TLayout *data_layouts; /// Rozložení každého řádku dat.
+	unsigned num_layouts;
+	unsigned num_data;
+	
+	bool is_offset; /// určuje zda-li ukazatele uvnitř jsou offsety.
+} KBLayouts;
+
+/**
+ * Typ hodnot číselného sloupce.
+ */
+typedef enum {
+	KB_NUMERIC_NONE = 0, /// Sloupec není číselný.
+	KB_NUMERIC_INT = 1, /// Celá čísla (long long), sloupec nemá žádnou chybějící hodnotu.
+	KB_NUMERIC_FLOAT = 2, /// Čísla s plovoucí řádovou čárkou (double), NaN pro chybějící hodnotu a hodnotu, která není číslem.
+} TNumericType;
+
+/**
+ * Hodnota číselného sloupce.
+ */
+typedef union {
+	long long i;
+	double f;
+} TNumeric;
+
+/**
+ * Číselné sloupce dat uložené jako pole hodnot indexovaná řádkem dat (od 1, prvek 0 je 0, u KB_NUMERIC_FLOAT NaN).
+ * Číselným je sloupec s příznakem KB_FLAG_NUMERIC, nebo vyžádaný sloupec, jehož všechny neprázdné hodnoty jsou čísla.
+ * Sloupec s chybějící hodnotou (prázdnou nebo u typu entity, který sloupec nemá) je typu KB_NUMERIC_FLOAT.
+ * Sloupec s příznakem KB_FLAG_MULTIPLE_VALUES číselný není.
+ */
+typedef struct {
+	unsigned *name_ids; /// Id názvu (od 1) každého číselného sloupce.
+	unsigned *types; /// TNumericType každého číselného sloupce.
+	TNumeric *values; /// Pole (num_data + 1) hodnot každého číselného sloupce za sebou.
+	unsigned num_columns;
+	unsigned num_data;
+	
+	bool is_offset; /// určuje zda-li ukazatele uvnitř jsou offsety.
+} KBNumerics;
+
 /**
  * Sdílená paměť
  * Ve sdílené paměti mají všechny ukazatele funkci offsetu od začátku sdílené paměti.
@@ -85,7 +145,10 @@ typedef struct {
 	KBStringVector head;
 	KBStringVector data;
 	size_t capacity;
-	char * version;
+	char * version; /// Řetězec s verzí KB (NULL pokud KB verzi nemá), ve sdílené paměti uložený hned za touto strukturou.
+	KBLayouts layouts;
+	unsigned format; /// KB_SHM_FORMAT démona, který paměť vytvořil.
+	KBNumerics numerics;
 } KBSharedMem;
 
 /*       _\|/_
@@ -160,6 +223,75 @@ void KBStringCopyToShm(KBString *dest, KBString *source, void **freespace);
  */
 size_t KBStringSizeOf(KBString *kb_str);
 
+/*       _\|/_
+         (o o)
+ +----oOO-{_}-OOo----------------------+
+ | Následují funkce pro typ KBLayouts. |
+ +------------------------------------*/
+/**
+ * Inicializuje KBLayouts \a layouts z hlavičky \a head pro každý řádek dat \a data.
+ * Typ řádku dat je ve sloupci, který má v hlavičce název "TYPE" (u všech typů stejný).
+ */
+int KBLayoutsInit(KBLayouts *layouts, KBStringVector *head, KBStringVector *data);
+
+/**
+ * Inicializuje prázdný KBLayouts \a layouts.
+ */
+void KBLayoutsInitEmpty(KBLayouts *layouts);
+
+/**
+ * "Destruktor" KBLayouts.
+ */
+void deleteKBLayouts(KBLayouts *layouts);
+
+/**
+ * Zkopíruje do nachystané sdílené paměti.
+ * @param dest Adresa do sdílené paměti.
+ * @param source Zdroj dat.
+ * @param freespace Ukazatel na volné místo ve sdílené paměti.
+ */
+void KBLayoutsCopyToShm(KBLayouts *dest, KBLayouts *source, void **freespace);
+
+/**
+ * Zjistí počet celé obsazené paměti bez sizeof(KBLayouts).
+ */
+size_t KBLayoutsSizeOf(KBLayouts *layouts);
+
+/*       _\|/_
+         (o o)
+ +----oOO-{_}-OOo-----------------------+
+ | Následují funkce pro typ KBNumerics. |
+ +-------------------------------------*/
+/**
+ * Inicializuje KBNumerics \a numerics z číselných sloupců dat \a data s rozložením \a layouts podle hlavičky \a head.
+ * Kromě sloupců s příznakem KB_FLAG_NUMERIC se číselnými stanou jen sloupce s názvy z \a requested
+ * (\a num_requested názvů), pokud jsou všechny jejich neprázdné hodnoty čísla.
+ */
+int KBNumericsInit(KBNumerics *numerics, KBLayouts *layouts, KBStringVector *head, KBStringVector *data, char **requested, unsigned num_requested);
+
+/**
+ * Inicializuje prázdný KBNumerics \a numerics.
+ */
+void KBNumericsInitEmpty(KBNumerics *numerics);
+
+/**
+ * "Destruktor" KBNumerics.
+ */
+void deleteKBNumerics(KBNumerics *numerics);
+
+/**
+ * Zkopíruje do nachystané sdílené paměti (hodnoty zarovná na velikost TNumeric).
+ * @param dest Adresa do sdílené paměti.
+ * @param source Zdroj dat.
+ * @param freespace Ukazatel na volné místo ve sdílené paměti.
+ */
+void KBNumericsCopyToShm(KBNumerics *dest, KBNumerics *source, void **freespace);
+
+/**
+ * Zjistí počet celé obsazené paměti bez sizeof(KBNumerics) (včetně zarovnání hodnot).
+ */
+size_t KBNumericsSizeOf(KBNumerics *numerics);
+
 /*       _\|/_
          (o o)
  +----oOO-{_}-OOo------------------------+
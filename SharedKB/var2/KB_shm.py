@@ -21,8 +21,12 @@ from KB_shm import *
 
 import os
 import re
-from ctypes import CDLL, c_char, c_char_p, c_int, c_uint, c_void_p, POINTER
-#from ctypes import byref
+from ctypes import CDLL, c_char, c_char_p, c_int, c_uint, c_ushort, c_size_t, c_void_p, c_double, c_longlong, POINTER, sizeof, byref
+try:
+	# Číselné sloupce jsou dostupné jen s NumPy.
+	import numpy
+except ImportError:
+	numpy = None
 
 # Pro debugování:
 import inspect
@@ -145,18 +149,113 @@ KBSharedMemDataAt.argtypes = [c_void_p, c_uint, c_uint]
 KBSharedMemDataAt.restype = c_void_p
 
 # Funkce pro získání verze
-
+'''
+print( KBSharedMemVersion( KB_shm_p ) )
+version = getVersionFromSrc( "KB-HEAD.all" )
+print( c_char_p( version ).value )
+freeVersion( version )
+'''
 KBSharedMemVersion = libKB_shm.KBSharedMemVersion
 KBSharedMemVersion.argtypes = [c_void_p]
-KBSharedMemVersion.restype = c_uint
+KBSharedMemVersion.restype = c_char_p
 
+# Vrací alokovaný řetězec, který je třeba uvolnit funkcí freeVersion.
 getVersionFromSrc = libKB_shm.getVersionFromSrc
 getVersionFromSrc.argtypes = [c_char_p]
-getVersionFromSrc.restype = c_int
+getVersionFromSrc.restype = c_void_p
 
 getVersionFromBin = libKB_shm.getVersionFromBin
 getVersionFromBin.argtypes = [c_char_p]
-getVersionFromBin.restype = c_int
+getVersionFromBin.restype = c_void_p
+
+freeVersion = libKB_shm.freeVersion
+freeVersion.argtypes = [c_void_p]
+freeVersion.restype = None
+
+# Funkce pro rozložení sloupců předpočítané démonem
+'''
+print( KBSharedMemFormat( KB_shm_p ) == KB_SHM_FORMAT )
+print( c_char_p( KBSharedMemColumnName( KB_shm_p, 1 ) ).value )
+print( KBSharedMemDataFor( KB_shm_p, 1, 1 ) )
+'''
+
+# Musí odpovídat KB_SHM_FORMAT z libKB_shm.h (starší démon rozložení sloupců nemá).
+KB_SHM_FORMAT = 0x4B420004
+
+KBSharedMemFormat = libKB_shm.KBSharedMemFormat
+KBSharedMemFormat.argtypes = [c_void_p]
+KBSharedMemFormat.restype = c_uint
+
+KBSharedMemColumnName = libKB_shm.KBSharedMemColumnName
+KBSharedMemColumnName.argtypes = [c_void_p, c_uint]
+KBSharedMemColumnName.restype = c_void_p
+
+KBSharedMemDataLayout = libKB_shm.KBSharedMemDataLayout
+KBSharedMemDataLayout.argtypes = [c_void_p, c_uint]
+KBSharedMemDataLayout.restype = c_uint
+
+# Vrací přímo řetězec, takže dataFor() vystačí s jediným voláním knihovny.
+KBSharedMemDataFor = libKB_shm.KBSharedMemDataFor
+KBSharedMemDataFor.argtypes = [c_void_p, c_uint, c_uint]
+KBSharedMemDataFor.restype = c_char_p
+
+# Funkce pro hromadné získání řetězců (jedno volání knihovny pro celý řádek nebo více sloupců)
+'''
+row = (c_char_p * 32)()
+print( row[:KBSharedMemDataRow( KB_shm_p, 1, row, 32 )] )
+'''
+KBSharedMemDataRow = libKB_shm.KBSharedMemDataRow
+KBSharedMemDataRow.argtypes = [c_void_p, c_uint, POINTER(c_char_p), c_uint]
+KBSharedMemDataRow.restype = c_uint
+
+KBSharedMemDataForColumns = libKB_shm.KBSharedMemDataForColumns
+KBSharedMemDataForColumns.argtypes = [c_void_p, c_uint, POINTER(c_uint), c_uint, POINTER(c_char_p)]
+KBSharedMemDataForColumns.restype = None
+
+KBSharedMemDataForLines = libKB_shm.KBSharedMemDataForLines
+KBSharedMemDataForLines.argtypes = [c_void_p, POINTER(c_uint), c_uint, c_uint, POINTER(c_char_p)]
+KBSharedMemDataForLines.restype = None
+
+# Funkce pro přístup k řetězcům bez kopírování (rozsah = offset od začátku sdílené paměti a délka v jednom čísle)
+'''
+span = KBSharedMemDataSpanAt( KB_shm_p, 1, 1 )
+offset = span >> KB_SPAN_LENGTH_BITS
+print( KB_shm.segment[offset:offset + (span & KB_SPAN_LENGTH_MASK)].tobytes() )
+'''
+# Musí odpovídat KB_SPAN_LENGTH_BITS z libKB_shm.h.
+KB_SPAN_LENGTH_BITS = sizeof(c_ushort) * 8
+KB_SPAN_LENGTH_MASK = (1 << KB_SPAN_LENGTH_BITS) - 1
+
+KBSharedMemDataSpanAt = libKB_shm.KBSharedMemDataSpanAt
+KBSharedMemDataSpanAt.argtypes = [c_void_p, c_uint, c_uint]
+KBSharedMemDataSpanAt.restype = c_size_t
+
+KBSharedMemDataSpanFor = libKB_shm.KBSharedMemDataSpanFor
+KBSharedMemDataSpanFor.argtypes = [c_void_p, c_uint, c_uint]
+KBSharedMemDataSpanFor.restype = c_size_t
+
+KBSharedMemDataSplitFor = libKB_shm.KBSharedMemDataSplitFor
+KBSharedMemDataSplitFor.argtypes = [c_void_p, c_uint, c_uint, c_char, POINTER(c_size_t), c_uint]
+KBSharedMemDataSplitFor.restype = c_uint
+
+# Funkce pro číselné sloupce uložené démonem jako pole čísel
+'''
+values = c_size_t(0)
+if KBSharedMemNumericFor( KB_shm_p, 1, byref(values) ) == KB_NUMERIC_FLOAT:
+	print( (c_double * (KBSharedMemDataCount( KB_shm_p ) + 1)).from_address( KB_shm_p.value + values.value )[1] )
+'''
+# Musí odpovídat TNumericType z libKB_shm.h.
+KB_NUMERIC_NONE = 0
+KB_NUMERIC_INT = 1
+KB_NUMERIC_FLOAT = 2
+
+KBSharedMemDataCount = libKB_shm.KBSharedMemDataCount
+KBSharedMemDataCount.argtypes = [c_void_p]
+KBSharedMemDataCount.restype = c_uint
+
+KBSharedMemNumericFor = libKB_shm.KBSharedMemNumericFor
+KBSharedMemNumericFor.argtypes = [c_void_p, c_uint, POINTER(c_size_t)]
+KBSharedMemNumericFor.restype = c_uint
 
 # Příklad použití:
 '''
@@ -245,7 +344,12 @@ class KB_shm(object):
 		self.headCol_Boost = {} # Slovník LINE:{COLUMN_NAME:COLUMN}
 		self.headColCnt_Boost = {} # Slovník LINE:COLUMN_COUNT(Počet sloupců na daném řádku)
 		self.headType_Boost = {} # Slovník LINE:(TYPE,SUBTYPE)
+		self.colNameId_Boost = {} # Slovník COLUMN_NAME:ID(Id názvu sloupce ve sdílené paměti pro dataForId)
+		self.colNameIds_Boost = {} # Slovník (COLUMN_NAME, ...):POLE ID(Pole id názvů sloupců pro dataForColumns)
+		self.maxColCnt = 0 # Největší počet sloupců na řádku hlavičky (velikost bufferu pro dataRow)
 		self.multivalue_delim = multivalue_delim
+		self.segment = None # Pohled (memoryview) do celé namapované paměti jen pro čtení
+		self.numeric_Boost = {} # Slovník COLUMN_NAME:NUMPY ARRAY(Hodnoty číselného sloupce indexované řádkem)
 		
 		self.data_type_col = None # Sloupec ve kterém je definován typ entity
 		
@@ -272,6 +376,9 @@ class KB_shm(object):
 			disconnectKB_shm(self.KB_shm_p, self.KB_shm_fd)
 			raise KbShmException("mmapKB_shm")
 		
+		# Pohledy do sdílené paměti jsou platné jen do odpojení (end).
+		self.segment = memoryview(buffer( (c_char * os.fstat(self.KB_shm_fd.value).st_size).from_address(self.KB_shm_p.value) ))
+		
 		self._alive = True
 		
 		self.prepareBoosts()
@@ -367,11 +474,43 @@ class KB_shm(object):
 			line += 1
 			text = self.headAt(line, 1)
 		
+		self.maxColCnt = max(self.headColCnt_Boost.itervalues()) if self.headColCnt_Boost else 0
+		
+		# Id názvů sloupců z rozložení předpočítaného démonem (démon staršího formátu je nemá).
+		self.colNameId_Boost = {}
+		self.colNameIds_Boost = {}
+		if KBSharedMemFormat( self.KB_shm_p ) == KB_SHM_FORMAT:
+			col_name_id = 1
+			text = c_char_p( KBSharedMemColumnName( self.KB_shm_p, col_name_id ) ).value
+			while text != None:
+				self.colNameId_Boost[text] = col_name_id
+				col_name_id += 1
+				text = c_char_p( KBSharedMemColumnName( self.KB_shm_p, col_name_id ) ).value
+		
+		# Číselné sloupce jako pole NumPy přímo nad sdílenou pamětí (jen pro čtení, platná do end()).
+		self.numeric_Boost = {}
+		if numpy is not None and self.colNameId_Boost:
+			count = KBSharedMemDataCount( self.KB_shm_p ) + 1
+			values = c_size_t(0)
+			for col_name, col_name_id in self.colNameId_Boost.iteritems():
+				numeric_type = KBSharedMemNumericFor( self.KB_shm_p, col_name_id, byref(values) )
+				if numeric_type == KB_NUMERIC_INT:
+					array = numpy.frombuffer( (c_longlong * count).from_address(self.KB_shm_p.value + values.value), dtype=numpy.int64 )
+				elif numeric_type == KB_NUMERIC_FLOAT:
+					array = numpy.frombuffer( (c_double * count).from_address(self.KB_shm_p.value + values.value), dtype=numpy.float64 )
+				else:
+					continue
+				array.flags.writeable = False
+				self.numeric_Boost[col_name] = array
+		
 		self._prepared = True
 	
 	def version(self):
+		'''
+		Vrátí verzi KB (řádek "VERSION=" na začátku KB), None pokud KB verzi nemá.
+		'''
 		assert self._alive
-		return c_uint( KBSharedMemVersion( self.KB_shm_p ) ).value
+		return KBSharedMemVersion( self.KB_shm_p )
 	
 	def headAt(self, line, col):
 		assert self._alive
@@ -533,12 +672,38 @@ class KB_shm(object):
 		assert self._alive
 		return c_char_p( KBSharedMemDataAt( self.KB_shm_p, line, col ) ).value
 	
+	def colNameId(self, col_name):
+		'''
+		colNameId("DATE OF BIRTH")
+		
+		@return
+			Vrátí id názvu sloupce \a col_name pro dataForId(). Nemá-li sloupec žádný typ entity nebo démon
+			rozložení sloupců nepředpočítal, vrátí None.
+		'''
+		assert self._alive and self._prepared
+		return self.colNameId_Boost.get(col_name)
+	
+	def dataForId(self, line, col_name_id):
+		'''
+		dataForId(10000, kb_shm.colNameId("DATE OF BIRTH"))
+		
+		Jediným voláním knihovny vrátí hodnotu sloupce podle rozložení sloupců typu entity na řádku \a line.
+		'''
+		assert self._alive
+		return KBSharedMemDataFor( self.KB_shm_p, line, col_name_id )
+	
 	def dataFor(self, line, col_name):
 		'''
 		dataFor(10000, "DATE OF BIRTH")
 		'''
 		assert self._alive
 		
+		if self.colNameId_Boost:
+			col_name_id = self.colNameId_Boost.get(col_name)
+			if col_name_id == None:
+				return None
+			return KBSharedMemDataFor( self.KB_shm_p, line, col_name_id )
+		
 		ent_type = self.dataType(line)
 		if ent_type == None:
 			return None
@@ -553,6 +718,171 @@ class KB_shm(object):
 		
 		return self.dataAt(line, col)
 	
+	def dataRow(self, line):
+		'''
+		dataRow(10000)
+		
+		@return
+			Vrátí seznam všech sloupců řádku \a line jediným voláním knihovny (pro neexistující řádek prázdný seznam).
+		'''
+		assert self._alive and self._prepared
+		
+		row = (c_char_p * self.maxColCnt)()
+		col_cnt = KBSharedMemDataRow( self.KB_shm_p, line, row, self.maxColCnt )
+		if col_cnt > self.maxColCnt:
+			# Řádek dat má více sloupců než kterýkoli řádek hlavičky.
+			row = (c_char_p * col_cnt)()
+			KBSharedMemDataRow( self.KB_shm_p, line, row, col_cnt )
+		return row[:col_cnt]
+	
+	def dataForColumns(self, line, col_names):
+		'''
+		dataForColumns(10000, ("NAME", "DATE OF BIRTH", "DATE OF DEATH"))
+		
+		@return
+			Vrátí tuple hodnot sloupců \a col_names řádku \a line jediným voláním knihovny (None pro sloupce, které typ entity nemá).
+		'''
+		assert self._alive and self._prepared
+		
+		if not self.colNameId_Boost:
+			return tuple(self.dataFor(line, col_name) for col_name in col_names)
+		
+		col_names = tuple(col_names)
+		col_name_ids = self.colNameIds_Boost.get(col_names)
+		if col_name_ids == None:
+			# Neznámé názvy sloupců mají id 0, pro které knihovna vrátí NULL.
+			col_name_ids = (c_uint * len(col_names))(*[self.colNameId_Boost.get(col_name, 0) for col_name in col_names])
+			self.colNameIds_Boost[col_names] = col_name_ids
+		
+		values = (c_char_p * len(col_names))()
+		KBSharedMemDataForColumns( self.KB_shm_p, line, col_name_ids, len(col_names), values )
+		return tuple(values)
+	
+	def dataForLines(self, lines, col_name):
+		'''
+		dataForLines([10000, 10001, 10002], "NAME")
+		
+		@return
+			Vrátí seznam hodnot sloupce \a col_name pro každý z řádků \a lines jediným voláním knihovny
+			(None pro řádky, jejichž typ entity sloupec nemá).
+		'''
+		assert self._alive and self._prepared
+		
+		if not self.colNameId_Boost:
+			return [self.dataFor(line, col_name) for line in lines]
+		
+		lines = list(lines)
+		values = (c_char_p * len(lines))()
+		KBSharedMemDataForLines( self.KB_shm_p, (c_uint * len(lines))(*lines), len(lines), self.colNameId_Boost.get(col_name, 0), values )
+		return list(values)
+	
+	def dataViewAt(self, line, col):
+		'''
+		dataViewAt(10000, 3)
+		
+		@return
+			Vrátí hodnotu sloupce \a col řádku \a line jako memoryview do sdílené paměti (bez kopírování, jen pro čtení,
+			platný do end()). Neexistuje-li sloupec, vrátí None.
+		'''
+		assert self._alive
+		
+		span = KBSharedMemDataSpanAt( self.KB_shm_p, line, col )
+		if span == 0:
+			return None
+		offset = span >> KB_SPAN_LENGTH_BITS
+		return self.segment[offset:offset + (span & KB_SPAN_LENGTH_MASK)]
+	
+	def dataViewFor(self, line, col_name):
+		'''
+		dataViewFor(10000, "TYPE")
+		
+		Jako dataFor(), ale vrátí memoryview do sdílené paměti (viz dataViewAt).
+		'''
+		assert self._alive and self._prepared
+		
+		col_name_id = self.colNameId_Boost.get(col_name)
+		if col_name_id == None:
+			if self.colNameId_Boost:
+				return None
+			# Démon bez rozložení sloupců.
+			col = self.headCol(self.dataType(line), self.dataSubtype(line), col_name)
+			return self.dataViewAt(line, col) if col else None
+		
+		span = KBSharedMemDataSpanFor( self.KB_shm_p, line, col_name_id )
+		if span == 0:
+			return None
+		offset = span >> KB_SPAN_LENGTH_BITS
+		return self.segment[offset:offset + (span & KB_SPAN_LENGTH_MASK)]
+	
+	def dataViewsFor(self, line, col_name, delim=None):
+		'''
+		dataViewsFor(10000, "NATIONALITY")
+		
+		@return
+			Vrátí seznam částí hodnoty sloupce \a col_name řádku \a line rozdělené oddělovačem \a delim (výchozí je
+			self.multivalue_delim) jako memoryview do sdílené paměti (viz dataViewAt). Pro chybějící nebo prázdnou
+			hodnotu vrátí prázdný seznam.
+		'''
+		assert self._alive and self._prepared
+		
+		if delim == None:
+			delim = self.multivalue_delim
+		
+		col_name_id = self.colNameId_Boost.get(col_name)
+		if col_name_id == None:
+			if self.colNameId_Boost:
+				return []
+			# Démon bez rozložení sloupců, části se dopočítají z pohledu na celou hodnotu.
+			view = self.dataViewFor(line, col_name)
+			if not view:
+				return []
+			parts = []
+			start = 0
+			for part in view.tobytes().split(delim):
+				parts.append(view[start:start + len(part)])
+				start += len(part) + len(delim)
+			return parts
+		
+		max_parts = 16
+		bounds = (c_size_t * (2 * max_parts))()
+		count = KBSharedMemDataSplitFor( self.KB_shm_p, line, col_name_id, delim, bounds, max_parts )
+		if count > max_parts:
+			bounds = (c_size_t * (2 * count))()
+			KBSharedMemDataSplitFor( self.KB_shm_p, line, col_name_id, delim, bounds, count )
+		return [self.segment[bounds[2*i]:bounds[2*i + 1]] for i in xrange(count)]
+	
+	def numericColumn(self, col_name):
+		'''
+		numericColumn("CONFIDENCE")
+		
+		@return
+			Vrátí hodnoty číselného sloupce \a col_name jako pole NumPy indexované řádkem nad sdílenou pamětí (jen pro
+			čtení, platné do end()). Celočíselný sloupec bez chybějících hodnot má typ int64 (prvek 0 je 0), ostatní
+			float64 s hodnotou NaN pro chybějící hodnotu a pro hodnotu, která není číslem (i v prvku 0). Není-li sloupec
+			číselný (nebo démon či NumPy číselné sloupce nepodporuje), vrátí None.
+		'''
+		assert self._alive and self._prepared
+		return self.numeric_Boost.get(col_name)
+	
+	@staticmethod
+	def viewEquals(view, string):
+		'''
+		Porovná pohled \a view (viz dataViewAt) s řetězcem \a string bez kopírování. Pohled None se nerovná ničemu.
+		'''
+		return view != None and view == string
+	
+	@staticmethod
+	def viewIn(view, strings):
+		'''
+		Zjistí bez kopírování, zda-li se pohled \a view (viz dataViewAt) rovná některému z řetězců \a strings.
+		'''
+		if view == None:
+			return False
+		for string in strings:
+			if view == string:
+				return True
+		return False
+	
 	def dataType(self, line):
 		assert self._alive and self._prepared
 		return self.dataAt(line, self.data_type_col)
@@ -567,29 +897,54 @@ class KB_shm(object):
 	
 	@staticmethod
 	def getVersionFromSrc(kb_path):
+		'''
+		Vrátí verzi textového souboru s KB \a kb_path (None pokud KB verzi nemá).
+		'''
 		assert isinstance(kb_path, str)
 		
-		kb_path = c_char_p(kb_path)
-		
-		status = c_int(0)
-		status = c_int( getVersionFromSrc(kb_path) )
-		if status.value < 0:
-			raise KbShmException("getVersionFromSrc: %s" % status.value)
-		else:
-			return status.value
+		version = getVersionFromSrc( c_char_p(kb_path) )
+		if version == None:
+			raise KbShmException("getVersionFromSrc: %s" % kb_path)
+		try:
+			return c_char_p(version).value or None
+		finally:
+			freeVersion(version)
 	
 	@staticmethod
 	def getVersionFromBin(kb_bin_path):
+		'''
+		Vrátí verzi binárního souboru s KB \a kb_bin_path (None pokud KB verzi nemá).
+		Binární soubor staršího formátu vyvolá KbShmException.
+		'''
 		assert isinstance(kb_bin_path, str)
 		
-		kb_bin_path = c_char_p(kb_bin_path)
+		version = getVersionFromBin( c_char_p(kb_bin_path) )
+		if version == None:
+			raise KbShmException("getVersionFromBin: %s" % kb_bin_path)
+		try:
+			return c_char_p(version).value or None
+		finally:
+			freeVersion(version)
+	
+	@staticmethod
+	def checkImage(kb_bin_path, kb_path):
+		'''
+		Zjistí, zda-li je binární soubor s KB \a kb_bin_path (vytvořený démonem) aktuální pro textový soubor s KB
+		\a kb_path, tj. má aktuální formát a stejnou verzi (pro KB bez verze musí být navíc novější). Aktuální binární
+		soubor lze připojit přímo přes KB_shm(kb_bin_path).start() bez démona (viz connectKB_shm v libKB_shm.h).
+		'''
+		if "/" not in kb_bin_path[1:] or not os.path.isfile(kb_bin_path):
+			return False
 		
-		status = c_int(0)
-		status = c_int( getVersionFromBin(kb_bin_path) )
-		if status.value < 0:
-			raise KbShmException("getVersionFromBin: %s" % status.value)
-		else:
-			return status.value
+		try:
+			version = KB_shm.getVersionFromBin(kb_bin_path)
+			if version != KB_shm.getVersionFromSrc(kb_path):
+				return False
+		except KbShmException:
+			return False
+		
+		# Stejně jako démon porovnává celé sekundy.
+		return version != None or int(os.stat(kb_bin_path).st_mtime) > int(os.stat(kb_path).st_mtime)
 #
 
 # konec souboru KB_shm.py
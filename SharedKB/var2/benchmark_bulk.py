@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Porovná získávání dat po jednotlivých sloupcích (jedno volání knihovny na
+# sloupec) s hromadnými funkcemi dataRow, dataForColumns a dataForLines.
+#
+# Příklad:
+#     ./benchmark_bulk.py -s /decipherKB-CZ-daemon_shm-999 -n 10000 -c "NAME,DATE OF BIRTH,DATE OF DEATH,GENDER,CONFIDENCE"
+
+import sys
+import time
+import argparse
+from KB_shm import *
+
+def measure(function, repeat):
+	''' Vrátí výsledek funkce a nejkratší dobu jejího běhu ze \a repeat opakování. '''
+	best = None
+	for i in xrange(repeat):
+		start = time.time()
+		result = function()
+		elapsed = time.time() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return result, best
+
+def main():
+	parser = argparse.ArgumentParser(description="Compares per-field access to SharedKB with bulk fetches.")
+	parser.add_argument("-s", "--shm-name", default="/decipherKB-CZ-daemon_shm-999", help="A name of the shared memory with KB.")
+	parser.add_argument("-n", "--lines", type=int, default=10000, help="A number of KB lines (from the first one).")
+	parser.add_argument("-c", "--columns", default="NAME,DATE OF BIRTH,DATE OF DEATH,GENDER,CONFIDENCE", help="Comma separated names of columns for the projection.")
+	parser.add_argument("-r", "--repeat", type=int, default=3, help="A number of repetitions (the best time is printed).")
+	arguments = parser.parse_args()
+
+	kb = KB_shm(arguments.shm_name)
+	kb.start()
+	try:
+		lines = range(1, arguments.lines + 1)
+		col_names = tuple(arguments.columns.split(","))
+
+		def row_per_field():
+			rows = []
+			for line in lines:
+				row = []
+				col = 1
+				text = kb.dataAt(line, col)
+				while text != None:
+					row.append(text)
+					col += 1
+					text = kb.dataAt(line, col)
+				rows.append(row)
+			return rows
+
+		def row_bulk():
+			return [kb.dataRow(line) for line in lines]
+
+		def columns_per_field():
+			return [tuple(kb.dataFor(line, col_name) for col_name in col_names) for line in lines]
+
+		def columns_bulk():
+			return [kb.dataForColumns(line, col_names) for line in lines]
+
+		def lines_per_field():
+			return [kb.dataFor(line, col_names[0]) for line in lines]
+
+		def lines_bulk():
+			return kb.dataForLines(lines, col_names[0])
+
+		print("\t".join(["fetch", "per-field [s]", "bulk [s]", "speedup"]))
+		for name, per_field, bulk in [("whole row", row_per_field, row_bulk), ("columns of a line", columns_per_field, columns_bulk), ("column of lines", lines_per_field, lines_bulk)]:
+			expected, per_field_time = measure(per_field, arguments.repeat)
+			result, bulk_time = measure(bulk, arguments.repeat)
+			if result != expected:
+				sys.stderr.write("ERROR: %s: bulk fetch differs from per-field fetch\n" % name)
+				exit(1)
+			print("\t".join([name, "%.3f" % per_field_time, "%.3f" % bulk_time, "%.1fx" % (per_field_time / bulk_time if bulk_time else 0.0)]))
+	finally:
+		kb.end()
+
+if __name__ == "__main__":
+	main()
+
+# konec souboru benchmark_bulk.py
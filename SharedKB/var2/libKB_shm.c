@@ -161,7 +161,171 @@ char * KBSharedMemDataAt(KBSharedMem *kb, unsigned line, TStrLen col)
 
 char * KBSharedMemVersion(KBSharedMem *kb)
 {
-	return kb->version;
+	if (kb->format != KB_SHM_FORMAT || kb->version == NULL)
+	{
+		return NULL;
+	}
+	
+	return OFFSET_2_P( kb, kb->version );
+}
+
+unsigned KBSharedMemFormat(KBSharedMem *kb)
+{
+	return kb->format;
+}
+
+char * KBSharedMemColumnName(KBSharedMem *kb, unsigned col_name_id)
+{
+	if (col_name_id == 0 || col_name_id > kb->layouts.column_names.num_offsets)
+	{
+		return NULL;
+	}
+	
+	return KBStringAt(&kb->layouts.column_names, col_name_id-1);
+}
+
+TLayout KBSharedMemDataLayout(KBSharedMem *kb, unsigned line)
+{
+	KBLayouts *layouts = &kb->layouts;
+	
+	if (line == 0 || line > layouts->num_data)
+	{
+		return 0;
+	}
+	
+	return ((TLayout *)OFFSET_2_P( layouts, layouts->data_layouts ))[line-1];
+}
+
+char * KBSharedMemDataFor(KBSharedMem *kb, unsigned line, unsigned col_name_id)
+{
+	KBLayouts *layouts = &kb->layouts;
+	unsigned num_names = layouts->column_names.num_offsets;
+	TLayout layout = KBSharedMemDataLayout(kb, line);
+	TStrLen col;
+	
+	if (layout == 0 || col_name_id == 0 || col_name_id > num_names)
+	{
+		return NULL;
+	}
+	
+	col = ((TStrLen *)OFFSET_2_P( layouts, layouts->columns ))[(layout-1) * num_names + col_name_id-1];
+	if (col == 0)
+	{
+		return NULL;
+	}
+	
+	return KBStringVectorDataAt(&kb->data, line-1, col-1);
+}
+
+unsigned KBSharedMemDataRow(KBSharedMem *kb, unsigned line, char **dest, unsigned dest_length)
+{
+	KBString *string;
+	
+	if (line == 0 || (string = KBStringVectorAt(&kb->data, line-1)) == NULL)
+	{
+		return 0;
+	}
+	
+	for (TStrLen col=0; col < string->num_offsets && col < dest_length; col++)
+	{
+		dest[col] = KBStringAt(string, col);
+	}
+	
+	return string->num_offsets;
+}
+
+void KBSharedMemDataForColumns(KBSharedMem *kb, unsigned line, unsigned *col_name_ids, unsigned count, char **dest)
+{
+	for (unsigned i=0; i < count; i++)
+	{
+		dest[i] = KBSharedMemDataFor(kb, line, col_name_ids[i]);
+	}
+}
+
+void KBSharedMemDataForLines(KBSharedMem *kb, unsigned *lines, unsigned count, unsigned col_name_id, char **dest)
+{
+	for (unsigned i=0; i < count; i++)
+	{
+		dest[i] = KBSharedMemDataFor(kb, lines[i], col_name_id);
+	}
+}
+
+/**
+ * Vrací rozsah řetězce \a str v \a kb (0 pro NULL).
+ */
+static TSpan KBSharedMemSpan(KBSharedMem *kb, char *str)
+{
+	if (str == NULL)
+	{
+		return 0;
+	}
+	
+	return ((size_t)OFFSET_GIVE(kb, str) << KB_SPAN_LENGTH_BITS) | (TStrLen)strlen(str);
+}
+
+TSpan KBSharedMemDataSpanAt(KBSharedMem *kb, unsigned line, unsigned col)
+{
+	return KBSharedMemSpan(kb, KBSharedMemDataAt(kb, line, col));
+}
+
+TSpan KBSharedMemDataSpanFor(KBSharedMem *kb, unsigned line, unsigned col_name_id)
+{
+	return KBSharedMemSpan(kb, KBSharedMemDataFor(kb, line, col_name_id));
+}
+
+unsigned KBSharedMemDataSplitFor(KBSharedMem *kb, unsigned line, unsigned col_name_id, char delim, size_t *bounds, unsigned dest_length)
+{
+	char *str = KBSharedMemDataFor(kb, line, col_name_id);
+	char *start = str;
+	unsigned count = 0;
+	
+	if (str == NULL || *str == '\0')
+	{
+		return 0;
+	}
+	
+	for (char *c = str; ; c++)
+	{
+		if (*c == delim || *c == '\0')
+		{
+			if (count < dest_length)
+			{
+				bounds[2*count] = (size_t)OFFSET_GIVE(kb, start);
+				bounds[2*count + 1] = (size_t)OFFSET_GIVE(kb, c);
+			}
+			count++;
+			
+			if (*c == '\0')
+				break;
+			start = c + 1;
+		}
+	}
+	
+	return count;
+}
+
+unsigned KBSharedMemDataCount(KBSharedMem *kb)
+{
+	return kb->layouts.num_data;
+}
+
+unsigned KBSharedMemNumericFor(KBSharedMem *kb, unsigned col_name_id, size_t *values)
+{
+	KBNumerics *numerics = &kb->numerics;
+	unsigned *name_ids = OFFSET_2_P( numerics, numerics->name_ids );
+	
+	for (unsigned n=0; n < numerics->num_columns; n++)
+	{
+		if (name_ids[n] == col_name_id)
+		{
+			TNumeric *column_values = (TNumeric *)OFFSET_2_P( numerics, numerics->values ) + (size_t)n * (numerics->num_data + 1);
+			*values = (size_t)OFFSET_GIVE( kb, column_values );
+			return ((unsigned *)OFFSET_2_P( numerics, numerics->types ))[n];
+		}
+	}
+	
+	*values = 0;
+	return KB_NUMERIC_NONE;
 }
 
 /*       _\|/_
@@ -197,6 +361,19 @@ int disconnectKBSharedMem(KBSharedMem **dest, int *KB_shm_fd)
 
 
 
+/**
+ * Otevře READ_ONLY sdílenou paměť nebo binární soubor s KB podle názvu \a kb_shm_name.
+ */
+static int openKB_shm(char *kb_shm_name)
+{
+	if (kb_shm_name[0] != '\0' && strchr(kb_shm_name + 1, '/') != NULL)
+	{
+		return open(kb_shm_name, O_RDONLY);
+	}
+	
+	return shm_open(kb_shm_name, O_RDONLY, 0);
+}
+
 int checkKB_shm(char *kb_shm_name)
 {
 	int KB_shm_fd;
@@ -205,7 +382,7 @@ int checkKB_shm(char *kb_shm_name)
 		kb_shm_name = KB_shm_name;
 	}
 
-	KB_shm_fd = shm_open(kb_shm_name, O_RDONLY, 0);
+	KB_shm_fd = openKB_shm(kb_shm_name);
 	if (KB_shm_fd < 0 || close(KB_shm_fd) == -1) {
 		return EXIT_FAILURE;
 	} else {
@@ -222,7 +399,7 @@ int connectKB_shm(char *kb_shm_name)
 	}
 	
 	/* Inicializace sdílené paměti */
-	KB_shm_fd = shm_open(kb_shm_name, O_RDONLY, 0);
+	KB_shm_fd = openKB_shm(kb_shm_name);
 	if (KB_shm_fd < 0)
 	{
 		perror("shm_open");
@@ -338,9 +515,10 @@ char * getVersionFromSrc(char *KB_path)
 	
 	/* Inicializace */
 	StringInitEmpty( &str_buf );
-	version = malloc(sizeof(char) * (VERSION_SIZE + 1));
+	version = calloc(VERSION_SIZE + 1, sizeof(char));
 	if (version == NULL) {
 		perror("malloc");
+		close_file(FILENAME, infile);
 		return NULL;
 	}
 	
@@ -410,11 +588,26 @@ char * getVersionFromBin(char *KB_bin_path)
 		return NULL; \
 	}
 	
-	/* Připojení binárního souboru */
+	/* Připojení binárního souboru (verzi je třeba zkopírovat před jeho odpojením) */
 	CHECK( (KB_bin_fd = open(KB_bin_path, O_RDONLY)) == -1 );
 	CHECK( (KB_bin = mmapKB_shm(KB_bin_fd)) == NULL );
-	version = KBSharedMemVersion(KB_bin);
-	CHECK( disconnectKB_shm(KB_bin, KB_bin_fd) );
+	if (KB_bin->format == KB_SHM_FORMAT)
+	{
+		version = strdup(KBSharedMemVersion(KB_bin) != NULL ? KBSharedMemVersion(KB_bin) : "");
+	}
+	else if (errno == 0)
+	{
+		errno = EINVAL;
+	}
+	if ( disconnectKB_shm(KB_bin, KB_bin_fd) )
+	{
+		free(version);
+		return NULL;
+	}
+	if (version == NULL)
+	{
+		return NULL;
+	}
 	
 	#undef CHECK
 	#undef CHECK_M_FREE
@@ -423,4 +616,9 @@ char * getVersionFromBin(char *KB_bin_path)
 	return version;
 }
 
+void freeVersion(char *version)
+{
+	free(version);
+}
+
 /* konec souboru libKB_shm.c */
@@ -55,6 +55,17 @@ limitations under the License.
 
 #define VERSION_SIZE 20
 
+/**
+ * Formát sdílené paměti (mění se s každou změnou struktur v ní uložených).
+ */
+#define KB_SHM_FORMAT 0x4B420004
+
+/**
+ * Příznaky sloupců v hlavičce ("<TYPE>{FLAGS[PREFIX_OF_VALUE]}NAME").
+ */
+#define KB_FLAG_MULTIPLE_VALUES 'm' /// Sloupec s více hodnotami oddělenými znakem '|'.
+#define KB_FLAG_NUMERIC 'n' /// Číselný sloupec (i když některé hodnoty nejsou čísla).
+
 /*       _\|/_
          (o o)
  +----oOO-{_}-OOo----+
@@ -81,6 +92,14 @@ extern char *KB_shm_name;
  | Struktury a výčtové typy |
  +-------------------------*/
 typedef unsigned short TStrLen;
+typedef unsigned TLayout;
+
+/**
+ * Rozsah řetězce ve sdílené paměti: offset řetězce od začátku sdílené paměti posunutý o KB_SPAN_LENGTH_BITS bitů
+ * a délka řetězce (nejvýše typu TStrLen) v nejnižších KB_SPAN_LENGTH_BITS bitech. Nula znamená, že řetězec neexistuje.
+ */
+typedef size_t TSpan;
+#define KB_SPAN_LENGTH_BITS (sizeof(TStrLen) * CHAR_BIT)
 typedef struct SKBStringVector KBStringVector;
 typedef struct SKBString KBString;
 
@@ -104,6 +123,54 @@ struct SKBStringVector {
 	unsigned capacity;
 };
 
+/**
+ * Rozložení sloupců dat podle typů entit z hlavičky.
+ * Rozložením je řádek hlavičky s typem entity (číslováno od 1, 0 znamená neznámý typ)
+ * a id názvu sloupce je pořadí názvu v \a column_names (číslováno od 1).
+ */
+typedef struct {
+	KBString column_names; /// Různé názvy sloupců ze všech řádků hlavičky.
+	TStrLen *columns; /// Matice [rozložení][id názvu sloupce] -> sloupec dat (od 1, 0 pokud jej typ nemá).
+	TLayout *data_layouts; /// Rozložení každého řádku dat.
+	unsigned num_layouts;
+	unsigned num_data;
+	
+	bool is_offset; /// určuje zda-li ukazatele uvnitř jsou offsety.
+} KBLayouts;
+
+/**
+ * Typ hodnot číselného sloupce.
+ */
+typedef enum {
+	KB_NUMERIC_NONE = 0, /// Sloupec není číselný.
+	KB_NUMERIC_INT = 1, /// Celá čísla (long long), sloupec nemá žádnou chybějící hodnotu.
+	KB_NUMERIC_FLOAT = 2, /// Čísla s plovoucí řádovou čárkou (double), NaN pro chybějící hodnotu a hodnotu, která není číslem.
+} TNumericType;
+
+/**
+ * Hodnota číselného sloupce.
+ */
+typedef union {
+	long long i;
+	double f;
+} TNumeric;
+
+/**
+ * Číselné sloupce dat uložené jako pole hodnot indexovaná řádkem dat (od 1, prvek 0 je 0, u KB_NUMERIC_FLOAT NaN).
+ * Číselným je sloupec, jehož všechny neprázdné hodnoty jsou čísla, nebo sloupec s příznakem KB_FLAG_NUMERIC.
+ * Sloupec s chybějící hodnotou (prázdnou nebo u typu entity, který sloupec nemá) je typu KB_NUMERIC_FLOAT.
+ * Sloupec s příznakem KB_FLAG_MULTIPLE_VALUES číselný není.
+ */
+typedef struct {
+	unsigned *name_ids; /// Id názvu (od 1) každého číselného sloupce.
+	unsigned *types; /// TNumericType každého číselného sloupce.
+	TNumeric *values; /// Pole (num_data + 1) hodnot každého číselného sloupce za sebou.
+	unsigned num_columns;
+	unsigned num_data;
+	
+	bool is_offset; /// určuje zda-li ukazatele uvnitř jsou offsety.
+} KBNumerics;
+
 /**
  * Sdílená paměť
  * Ve sdílené paměti mají všechny ukazatele funkci offsetu od začátku sdílené paměti.
@@ -112,7 +179,10 @@ typedef struct {
 	KBStringVector head;
 	KBStringVector data;
 	size_t capacity;
-	char * version;
+	char * version; /// Řetězec s verzí KB (NULL pokud KB verzi nemá), ve sdílené paměti uložený hned za touto strukturou.
+	KBLayouts layouts;
+	unsigned format; /// KB_SHM_FORMAT démona, který paměť vytvořil.
+	KBNumerics numerics;
 } KBSharedMem;
 
 /*       _\|/_
@@ -171,10 +241,86 @@ char * KBSharedMemHeadFor_Boost(KBSharedMem *kb, char prefix, TStrLen col, unsig
 char * KBSharedMemDataAt(KBSharedMem *kb, unsigned line, TStrLen col);
 
 /**
- * Vrací verzi \a kb.
+ * Vrací verzi \a kb (NULL pokud KB verzi nemá nebo ji démon staršího formátu neuložil do sdílené paměti).
  */
 char * KBSharedMemVersion(KBSharedMem *kb);
 
+/**
+ * Vrací formát \a kb (KB_SHM_FORMAT démona, který ji vytvořil).
+ */
+unsigned KBSharedMemFormat(KBSharedMem *kb);
+
+/**
+ * Číslování id názvů sloupců od 1.
+ * Vrací název sloupce s id \a col_name_id (id jsou společná pro všechny typy entit).
+ */
+char * KBSharedMemColumnName(KBSharedMem *kb, unsigned col_name_id);
+
+/**
+ * Číslování řádků od 1.
+ * Vrací rozložení sloupců řádku dat \a line, tj. řádek hlavičky s typem entity (0 pro neznámý typ).
+ */
+TLayout KBSharedMemDataLayout(KBSharedMem *kb, unsigned line);
+
+/**
+ * Číslování řádků a id názvů sloupců od 1.
+ * Vrací sloupec s id názvu \a col_name_id dat na řádku \a line (NULL pokud jej typ entity nemá).
+ */
+char * KBSharedMemDataFor(KBSharedMem *kb, unsigned line, unsigned col_name_id);
+
+/**
+ * Číslování řádků od 1.
+ * Zapíše do \a dest ukazatele na všechny sloupce dat na řádku \a line (nejvýše \a dest_length sloupců).
+ * @return Vrací počet sloupců řádku (může být větší než \a dest_length), pro neexistující řádek 0.
+ */
+unsigned KBSharedMemDataRow(KBSharedMem *kb, unsigned line, char **dest, unsigned dest_length);
+
+/**
+ * Číslování řádků a id názvů sloupců od 1.
+ * Zapíše do \a dest sloupce s id názvů \a col_name_ids (celkem \a count) dat na řádku \a line
+ * (NULL pro sloupce, které typ entity nemá).
+ */
+void KBSharedMemDataForColumns(KBSharedMem *kb, unsigned line, unsigned *col_name_ids, unsigned count, char **dest);
+
+/**
+ * Číslování řádků a id názvů sloupců od 1.
+ * Zapíše do \a dest sloupec s id názvu \a col_name_id dat na řádcích \a lines (celkem \a count)
+ * (NULL pro řádky, jejichž typ entity sloupec nemá).
+ */
+void KBSharedMemDataForLines(KBSharedMem *kb, unsigned *lines, unsigned count, unsigned col_name_id, char **dest);
+
+/**
+ * Číslování řádků a sloupců od 1.
+ * Vrací rozsah (TSpan) sloupce \a col dat na řádku \a line (0 pokud sloupec neexistuje).
+ */
+TSpan KBSharedMemDataSpanAt(KBSharedMem *kb, unsigned line, unsigned col);
+
+/**
+ * Číslování řádků a id názvů sloupců od 1.
+ * Vrací rozsah (TSpan) sloupce s id názvu \a col_name_id dat na řádku \a line (0 pokud jej typ entity nemá).
+ */
+TSpan KBSharedMemDataSpanFor(KBSharedMem *kb, unsigned line, unsigned col_name_id);
+
+/**
+ * Číslování řádků a id názvů sloupců od 1.
+ * Rozdělí hodnotu sloupce s id názvu \a col_name_id dat na řádku \a line podle oddělovače \a delim a do \a bounds
+ * zapíše offsety začátku a konce každé části od začátku \a kb (nejvýše \a dest_length částí, tj. 2 * \a dest_length offsetů).
+ * @return Vrací počet částí (může být větší než \a dest_length), pro chybějící nebo prázdnou hodnotu 0.
+ */
+unsigned KBSharedMemDataSplitFor(KBSharedMem *kb, unsigned line, unsigned col_name_id, char delim, size_t *bounds, unsigned dest_length);
+
+/**
+ * Vrací počet řádků dat \a kb.
+ */
+unsigned KBSharedMemDataCount(KBSharedMem *kb);
+
+/**
+ * Číslování id názvů sloupců od 1.
+ * Vrací typ (TNumericType) sloupce s id názvu \a col_name_id (KB_NUMERIC_NONE pokud není číselný) a do \a values
+ * uloží offset jeho pole hodnot (KBSharedMemDataCount() + 1 prvků TNumeric indexovaných řádkem) od začátku \a kb.
+ */
+unsigned KBSharedMemNumericFor(KBSharedMem *kb, unsigned col_name_id, size_t *values);
+
 /*       _\|/_
          (o o)
  +----oOO-{_}-OOo------------+
@@ -196,6 +342,11 @@ int connectKBSharedMem(KBSharedMem **dest, int *KB_shm_fd, char *kb_shm_name);
 int disconnectKBSharedMem(KBSharedMem **dest, int *KB_shm_fd);
 
 // Pro jazyky Java, Python, ...
+/*
+ * Název \a kb_shm_name, který obsahuje znak '/' i jinde než na začátku, je cestou k binárnímu souboru s KB
+ * (KB-HEAD.all.bin vytvořený démonem), který se namapuje READ_ONLY přímo ze souboru bez démona a bez kopírování
+ * do sdílené paměti (stránky souboru sdílí všechny procesy přes page cache). Ostatní názvy jsou názvy sdílené paměti.
+ */
 /**
  * Zkontroluje zda je sdílená paměť k dispozici.
  * @return Pokud ano vrací 0, jinak číslo != 0.
@@ -223,15 +374,22 @@ int disconnectKB_shm(KBSharedMem *dest, int KB_shm_fd);
 
 /**
  * Otevře textový soubor \a KB_path s KB a pokusí se přečíst jeho verzi.
- * @return Pokud vše proběhlo v pořádku vrací číslo verze, jinak prázdný řetězec.
+ * @return Pokud vše proběhlo v pořádku vrací verzi (prázdný řetězec pokud KB verzi nemá), jinak NULL.
+ *         Verzi je třeba uvolnit funkcí freeVersion().
  */
 char * getVersionFromSrc(char *KB_path);
 
 /**
  * Otevře binární soubor \a KB_bin_path s KB a pokusí se přečíst jeho verzi.
- * @return Pokud vše proběhlo v pořádku vrací číslo verze, jinak prázdný řetězec.
+ * @return Pokud vše proběhlo v pořádku vrací verzi (prázdný řetězec pokud KB verzi nemá), jinak NULL
+ *         (i pro binární soubor staršího formátu). Verzi je třeba uvolnit funkcí freeVersion().
  */
 char * getVersionFromBin(char *KB_bin_path);
 
+/**
+ * Uvolní verzi vrácenou funkcí getVersionFromSrc() nebo getVersionFromBin().
+ */
+void freeVersion(char *version);
+
 #endif
 /* konec souboru libKB_shm.h */
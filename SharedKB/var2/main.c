@@ -57,6 +57,9 @@ limitations under the License.
  +------------------*/
 char *KB_shm_name = "/decipherKB-daemon_shm";
 int KB_shm_fd = -1;
+// Názvy sloupců, které se uloží jako pole čísel, pokud jsou všechny jejich hodnoty čísla (parametr -n).
+char **numeric_columns = NULL;
+unsigned num_numeric_columns = 0;
 
 /*       _\|/_
          (o o)
@@ -210,6 +213,7 @@ int init_shm(KBSharedMem **KB_shm, char *KB_path)
 				return EXIT_FAILURE;
 			}
 			strncpy(KB_buf.version, str_buf.str + VERSION_PREFIX_LEN, VERSION_SIZE);
+			KB_buf.version[VERSION_SIZE] = '\0';
 			deleteString( &str_buf );
 			CHECK( read_line( &str_buf, infile, &last_letter ) );
 		}
@@ -293,6 +297,22 @@ int init_shm(KBSharedMem **KB_shm, char *KB_path)
 		return EXIT_FAILURE;
 	}
 	
+	/* Předpočítání rozložení sloupců každého řádku dat. */
+	if ( KBLayoutsInit(&KB_buf.layouts, &KB_buf.head, &KB_buf.data) )
+	{
+		perror("KBLayoutsInit");
+		deleteKBSharedMem(&KB_buf);
+		return EXIT_FAILURE;
+	}
+	
+	/* Uložení číselných sloupců jako pole čísel. */
+	if ( KBNumericsInit(&KB_buf.numerics, &KB_buf.layouts, &KB_buf.head, &KB_buf.data, numeric_columns, num_numeric_columns) )
+	{
+		perror("KBNumericsInit");
+		deleteKBSharedMem(&KB_buf);
+		return EXIT_FAILURE;
+	}
+	
 	/* Zkopírování bufferu do sdílené paměti. */
 	if ( copy_KB_to_shm(KB_shm, &KB_buf) == EXIT_FAILURE )
 	{
@@ -362,6 +382,15 @@ int init_shm_from_bin(KBSharedMem **KB_shm, char *KB_bin_path)
 		return EXIT_FAILURE;
 	}
 	
+	/* Binární soubor staršího formátu nelze použít */
+	if ( (size_t) KB_bin_stat.st_size < sizeof(KBSharedMem) || KB_bin->format != KB_SHM_FORMAT )
+	{
+		ERROR("Source binary file has an old format.\nPlease, create it again from the text file.");
+		if (errno == 0) {errno = EINVAL;}
+		CHECK_M_FREE();
+		return EXIT_FAILURE;
+	}
+	
 	/* Inicializace sdílené paměti */
 	KB_shm_fd = shm_open(KB_shm_name, O_RDWR|O_CREAT, 0644);
 	if (KB_shm_fd < 0)
@@ -395,8 +424,77 @@ int init_shm_from_bin(KBSharedMem **KB_shm, char *KB_bin_path)
 	return EXIT_SUCCESS;
 }
 
+/**
+ * Zjistí zda-li je binární soubor znalostní báze \a KB_bin_path aktuální pro znalostní bázi \a KB_path,
+ * tj. má aktuální formát (KB_SHM_FORMAT) a stejnou verzi (řádek "VERSION=" na začátku \a KB_path).
+ * Pokud znalostní báze verzi nemá, musí být binární soubor navíc novější než ona.
+ */
+bool check_bin(char *KB_bin_path, char *KB_path)
+{
+	int old_errno = errno;
+	int KB_bin_fd = -1;
+	KBSharedMem KB_bin;
+	char bin_version[VERSION_SIZE + 1] = "";
+	char version[VERSION_SIZE + 1] = "";
+	const char *VERSION_PREFIX = "VERSION=";
+	const size_t VERSION_PREFIX_LEN = strlen(VERSION_PREFIX);
+	FILE *infile = NULL;
+	String str_buf;
+	int last_letter = 0;
+	struct stat KB_stat;
+	struct stat KB_bin_stat;
+	bool ok = false;
+	
+	/* Formát a verze binárního souboru */
+	KB_bin_fd = open(KB_bin_path, O_RDONLY);
+	if (KB_bin_fd != -1)
+	{
+		if (read(KB_bin_fd, &KB_bin, sizeof(KBSharedMem)) == (ssize_t) sizeof(KBSharedMem) && KB_bin.format == KB_SHM_FORMAT)
+		{
+			ok = (KB_bin.version == NULL || pread(KB_bin_fd, bin_version, VERSION_SIZE, (off_t)(size_t) KB_bin.version) > 0);
+		}
+		close(KB_bin_fd);
+	}
+	
+	/* Verze znalostní báze */
+	if (ok)
+	{
+		ok = false;
+		StringInitEmpty( &str_buf );
+		infile = open_file_to_read(KB_path);
+		if (infile != NULL)
+		{
+			if (read_line( &str_buf, infile, &last_letter ) == EXIT_SUCCESS)
+			{
+				ok = true;
+				if (str_buf.str != NULL && strncmp(VERSION_PREFIX, str_buf.str, VERSION_PREFIX_LEN) == 0)
+				{
+					strncpy(version, str_buf.str + VERSION_PREFIX_LEN, VERSION_SIZE);
+				}
+			}
+			deleteString( &str_buf );
+			close_file(KB_path, infile);
+		}
+	}
+	
+	ok = ok && strcmp(bin_version, version) == 0;
+	
+	/* Bez verze rozhoduje čas poslední změny */
+	if (ok && version[0] == '\0')
+	{
+		ok = stat(KB_bin_path, &KB_bin_stat) == 0 && stat(KB_path, &KB_stat) == 0 && KB_bin_stat.st_mtime > KB_stat.st_mtime;
+	}
+	
+	errno = old_errno;
+	return ok;
+}
+
 /**
  * Alokuje sdílenou paměť ze souboru.
+ * S COPY_TO_DISC_EN se použije binární soubor "KB_path.bin", pokud je aktuální (viz check_bin), jinak se
+ * znalostní báze načte z textového souboru a binární soubor se (pro danou verzi jednou) vytvoří. Binární soubor
+ * se zapisuje do dočasného souboru, který se pak přejmenuje, takže procesy, které jej mají namapovaný přímo
+ * (viz connectKB_shm v libKB_shm.h), nikdy neuvidí rozepsaný obsah.
  * @param KB_shm Ukazatel na sdílenou paměť.
  * @param KB_path Cesta ke znalostní bázi.
  */
@@ -408,30 +506,32 @@ int initKBShm(KBSharedMem **KB_shm, char *KB_path)
 	const char *KB_bin_suffix = ".bin";
 	const size_t KB_path_len = strlen(KB_path);
 	const size_t KB_bin_suffix_len = strlen(KB_bin_suffix);
+	const size_t KB_bin_tmp_suffix_len = 32; // ".PID.tmp"
 	
-	int old_errno = 0;
-	bool KB_bin_exist = false;
-	bool KB_bin_ok = false;
 	int KB_bin_fd = -1;
-	struct stat KB_stat;
-	struct stat KB_bin_stat;
 	char *KB_bin_path = NULL;
+	char *KB_bin_tmp_path = NULL;
 	KBSharedMem *KB_bin = NULL;
 	
-	/* Vytvoření cesty k binárnímu souboru. */
+	/* Vytvoření cesty k binárnímu souboru a k dočasnému souboru pro jeho zápis. */
 	KB_bin_path = malloc( (KB_path_len + KB_bin_suffix_len +1) * sizeof(char) ); // +1 pro znak '\0'
-	if (KB_bin_path == NULL)
+	KB_bin_tmp_path = malloc( (KB_path_len + KB_bin_suffix_len + KB_bin_tmp_suffix_len +1) * sizeof(char) );
+	if (KB_bin_path == NULL || KB_bin_tmp_path == NULL)
 	{
 		perror("malloc");
+		free( KB_bin_path );
+		free( KB_bin_tmp_path );
 		return EXIT_FAILURE;
 	}
 	
 	strcpy(KB_bin_path, KB_path);
 	strcpy(KB_bin_path + KB_path_len, KB_bin_suffix);
+	snprintf(KB_bin_tmp_path, KB_path_len + KB_bin_suffix_len + KB_bin_tmp_suffix_len +1, "%s.%d.tmp", KB_bin_path, (int) getpid());
 	
 	#define CHECK_M_FREE() \
 	{ \
 		FREE( KB_bin_path ); \
+		FREE( KB_bin_tmp_path ); \
 	}
 	
 	#define CHECK(cond) \
@@ -442,38 +542,16 @@ int initKBShm(KBSharedMem **KB_shm, char *KB_path)
 		return EXIT_FAILURE; \
 	}
 	
-	/* Ověření zda-li binární soubor existuje */
-	old_errno = errno;
-	if ( access(KB_bin_path, F_OK) == 0 )
-	{
-		CHECK( access(KB_bin_path, R_OK|W_OK) );
-		
-		KB_bin_exist = true;
-	}
-	errno = old_errno;
-	
-	/* Ověření zda-li binární soubor má větší mtime než textový soubor */
-	if (KB_bin_exist)
-	{
-		CHECK( stat(KB_bin_path, &KB_bin_stat) );
-		CHECK( stat(KB_path, &KB_stat) );
-		
-		if (KB_bin_stat.st_mtime > KB_stat.st_mtime)
-		{
-			KB_bin_ok = true;
-		}
-	}
-	
-	if (KB_bin_ok)
+	if ( check_bin(KB_bin_path, KB_path) )
 	{
 		/* Binární soubor je stále aktuální */
 		CHECK( init_shm_from_bin(KB_shm, KB_bin_path) );
-		FREE( KB_bin_path );
+		CHECK_M_FREE();
 		return EXIT_SUCCESS;
 	}
 	
-	/* Otevření/Vytovoření binárního souboru */
-	CHECK( (KB_bin_fd = open(KB_bin_path, O_RDWR|O_CREAT, 0640)) == -1 );
+	/* Vytvoření dočasného souboru pro binární soubor (čitelný i pro ostatní, stejně jako sdílená paměť) */
+	CHECK( (KB_bin_fd = open(KB_bin_tmp_path, O_RDWR|O_CREAT|O_TRUNC, 0644)) == -1 );
 
 	#undef CHECK
 	#undef CHECK_M_FREE
@@ -482,8 +560,9 @@ int initKBShm(KBSharedMem **KB_shm, char *KB_path)
 	{ \
 		free_all(); \
 		close(KB_bin_fd); \
-		unlink(KB_bin_path); \
+		unlink(KB_bin_tmp_path); \
 		FREE(KB_bin_path); \
+		FREE(KB_bin_tmp_path); \
 	}
 	
 	#define CHECK(cond) \
@@ -513,7 +592,11 @@ int initKBShm(KBSharedMem **KB_shm, char *KB_path)
 	
 	CHECK( munmap(KB_bin, (*KB_shm)->capacity ) );
 	CHECK( close(KB_bin_fd) == -1 );
+	
+	/* Nahrazení binárního souboru najednou */
+	CHECK( rename(KB_bin_tmp_path, KB_bin_path) );
 	FREE( KB_bin_path );
+	FREE( KB_bin_tmp_path );
 	
 	#undef CHECK
 	#undef CHECK_M_FREE
@@ -577,6 +660,7 @@ int main(int argc, char **argv)
 	int status = 0;
 	int opt;
 	struct SArguments arguments = {NULL, NULL};
+	char *requested_columns[argc];
 
 	// Nastavení chování při SIGTERM, SIGINT a SIGQUIT
 	struct sigaction sig_act;
@@ -595,7 +679,8 @@ int main(int argc, char **argv)
 	sigprocmask(SIG_SETMASK, &mask, NULL);
 	
 	// Zpracování argumentů
-	while ((opt = getopt(argc, argv, "b:s:")) != -1) {
+	numeric_columns = requested_columns;
+	while ((opt = getopt(argc, argv, "b:s:n:")) != -1) {
 		switch (opt) {
 			case 'b':
 				arguments.bin_kb_path = optarg;
@@ -604,8 +689,11 @@ int main(int argc, char **argv)
 				arguments.shm_name = optarg;
 				KB_shm_name = arguments.shm_name;
 			break;
+			case 'n':
+				numeric_columns[num_numeric_columns++] = optarg;
+			break;
 			default: /* '?' */
-				fprintf(stderr, "Usage: %s [-s SHM_NAME] [{-b KB-HEAD.all.bin} | KB-HEAD.all]\n",
+				fprintf(stderr, "Usage: %s [-s SHM_NAME] [-n COLUMN]... [{-b KB-HEAD.all.bin} | KB-HEAD.all]\n",
 						argv[0]);
 				exit(EXIT_FAILURE);
 			break;
@@ -0,0 +1,198 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Testy nativních částí SharedKB (rozložení sloupců, hromadné získávání dat, pohledy, číselné sloupce a binární obraz)
+nad malou testovací KB. Démon i knihovna se sestaví přes Makefile.
+
+Spuštění (v adresáři SharedKB/var2):
+	python -m unittest test_KB_shm
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PATH_KB_DAEMON = os.path.join(SCRIPT_DIR, "decipherKB-daemon")
+
+# KB_shm načte libKB_shm.so při importu, proto se importuje až po sestavení (viz setUpModule).
+KB_shm = None
+
+# Testovací KB: typy entit mají sloupce v různém pořadí, {m} je sloupec s více hodnotami a {n} deklarovaný číselný sloupec.
+KB_HEAD = [
+	["<person>ID", "TYPE", "NAME", "{m}ALIAS", "CONFIDENCE", "WIKI HITS", "{n}SCORE", "RANK"],
+	["<location>ID", "TYPE", "LATITUDE", "NAME", "CONFIDENCE", "{m}CODES", "RANK"],
+]
+KB_DATA = [
+	["p:1", "person", "Karel Čapek", "Čapek|K. Čapek", "85", "1200", "7", "2"],
+	["l:2", "location", "50.08", "Praha", "95", "CZ|PRG", "1"],
+	["p:3", "person", "Jan Novák", "", "", "3", "neznámé", "4"],
+	["l:4", "location", "-12.5", "Lima", "40", "PE", "3"],
+]
+
+def write_kb(path, version):
+	with open(path, "w") as f:
+		if version is not None:
+			f.write("VERSION=%s\n" % version)
+		for line in KB_HEAD + [[]] + KB_DATA:
+			f.write("\t".join(line) + "\n")
+
+def nan_list(array):
+	""" Vrátí hodnoty pole jako seznam s None místo NaN (NaN se nerovná sám sobě). """
+	return [None if value != value else value for value in array.tolist()]
+
+def setUpModule():
+	global KB_shm
+	with open(os.devnull, "w") as devnull:
+		subprocess.check_call(["make", "-C", SCRIPT_DIR], stdout=devnull)
+	import KB_shm
+
+
+class KBShmTest(unittest.TestCase):
+	""" KB načtená démonem do sdílené paměti (a jím zapsaný obraz) musí vracet data testovací KB. """
+
+	@classmethod
+	def setUpClass(cls):
+		cls.tmp_dir = tempfile.mkdtemp(prefix="test_KB_shm.")
+		cls.kb_path = os.path.join(cls.tmp_dir, "KB-HEAD.all")
+		cls.image_path = cls.kb_path + ".bin"
+		write_kb(cls.kb_path, "test")
+
+		cls.shm_name = "/test_KB_shm-%d" % os.getpid()
+		cls.daemon = subprocess.Popen([PATH_KB_DAEMON, "-s", cls.shm_name, "-n", "CONFIDENCE", "-n", "LATITUDE", "-n", "RANK", cls.kb_path], stdout=subprocess.PIPE)
+		# démon je připraven, až vypíše "Waiting for signal..."
+		output = ""
+		while "Waiting for signal" not in output:
+			line = cls.daemon.stdout.readline()
+			if not line:
+				cls.daemon.wait()
+				shutil.rmtree(cls.tmp_dir)
+				raise RuntimeError("decipherKB-daemon exited with %s:\n%s" % (cls.daemon.returncode, output))
+			output += line
+
+		cls.kb = KB_shm.KB_shm(cls.shm_name)
+		cls.kb.start()
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.kb.end()
+		cls.daemon.terminate()
+		cls.daemon.wait()
+		shutil.rmtree(cls.tmp_dir)
+
+	def test_layouts(self):
+		kb = self.kb
+		self.assertEqual(kb.version(), "test")
+		self.assertEqual([kb.dataType(line) for line in xrange(1, 5)], ["person", "location", "person", "location"])
+		for col_name in ["NAME", "CONFIDENCE", "ALIAS", "LATITUDE"]:
+			self.assertNotEqual(kb.colNameId(col_name), None)
+		self.assertEqual(kb.colNameId("UNKNOWN"), None)
+
+		# NAME je u osob a míst v jiném sloupci
+		self.assertEqual(kb.dataFor(1, "NAME"), "Karel Čapek")
+		self.assertEqual(kb.dataFor(2, "NAME"), "Praha")
+		self.assertEqual(kb.dataForId(4, kb.colNameId("NAME")), "Lima")
+		# sloupec, který typ entity nemá
+		self.assertEqual(kb.dataFor(1, "LATITUDE"), None)
+		self.assertEqual(kb.dataFor(2, "ALIAS"), None)
+		self.assertEqual(kb.dataFor(1, "UNKNOWN"), None)
+
+	def test_bulk_fetch(self):
+		kb = self.kb
+		for line, row in enumerate(KB_DATA, 1):
+			self.assertEqual(kb.dataRow(line), row)
+		self.assertEqual(kb.dataRow(len(KB_DATA) + 1), [])
+
+		col_names = ("NAME", "CONFIDENCE", "LATITUDE", "UNKNOWN")
+		for line in xrange(1, len(KB_DATA) + 1):
+			self.assertEqual(kb.dataForColumns(line, col_names), tuple(kb.dataFor(line, col_name) for col_name in col_names))
+		self.assertEqual(kb.dataForColumns(2, ("LATITUDE", "NAME")), ("50.08", "Praha"))
+
+		lines = [4, 1, 2, 3, 1]
+		self.assertEqual(kb.dataForLines(lines, "NAME"), ["Lima", "Karel Čapek", "Praha", "Jan Novák", "Karel Čapek"])
+		self.assertEqual(kb.dataForLines(lines, "ALIAS"), [None, "Čapek|K. Čapek", None, "", "Čapek|K. Čapek"])
+		self.assertEqual(kb.dataForLines(lines, "UNKNOWN"), [None] * len(lines))
+
+	def test_views(self):
+		kb = self.kb
+		self.assertEqual(kb.dataViewFor(1, "NAME").tobytes(), "Karel Čapek")
+		self.assertEqual(kb.dataViewAt(2, 4).tobytes(), "Praha")
+		self.assertEqual(kb.dataViewFor(1, "LATITUDE"), None)
+		self.assertTrue(KB_shm.KB_shm.viewEquals(kb.dataViewFor(2, "TYPE"), "location"))
+		self.assertTrue(KB_shm.KB_shm.viewIn(kb.dataViewFor(3, "TYPE"), ["location", "person"]))
+		self.assertFalse(KB_shm.KB_shm.viewIn(None, ["person"]))
+
+		self.assertEqual([view.tobytes() for view in kb.dataViewsFor(1, "ALIAS")], ["Čapek", "K. Čapek"])
+		self.assertEqual([view.tobytes() for view in kb.dataViewsFor(2, "CODES")], ["CZ", "PRG"])
+		self.assertEqual(kb.dataViewsFor(3, "ALIAS"), [])
+		self.assertEqual(kb.dataViewsFor(1, "CODES"), [])
+
+	def test_numerics(self):
+		kb = self.kb
+
+		# vyžádaný celočíselný sloupec bez chybějících hodnot
+		rank = kb.numericColumn("RANK")
+		self.assertEqual(str(rank.dtype), "int64")
+		self.assertEqual(rank.tolist(), [0, 2, 1, 4, 3])
+
+		# vyžádaný sloupec celých čísel s chybějící hodnotou (NaN) je desetinný
+		confidence = kb.numericColumn("CONFIDENCE")
+		self.assertEqual(str(confidence.dtype), "float64")
+		self.assertEqual(nan_list(confidence), [None, 85.0, 95.0, None, 40.0])
+
+		# vyžádaný sloupec s desetinnými čísly (osoby jej nemají)
+		latitude = kb.numericColumn("LATITUDE")
+		self.assertEqual(str(latitude.dtype), "float64")
+		self.assertEqual(nan_list(latitude), [None, None, 50.08, None, -12.5])
+
+		# deklarovaný sloupec s hodnotou, která není číslem
+		score = kb.numericColumn("SCORE")
+		self.assertEqual(str(score.dtype), "float64")
+		self.assertEqual(score[1], 7.0)
+		self.assertTrue(score[3] != score[3]) # NaN
+
+		# nevyžádaný číselný sloupec, sloupce s více hodnotami a textové sloupce číselné nejsou
+		for col_name in ["WIKI HITS", "ALIAS", "CODES", "NAME", "UNKNOWN"]:
+			self.assertEqual(kb.numericColumn(col_name), None, col_name)
+
+	def test_image(self):
+		self.assertTrue(os.path.isfile(self.image_path))
+		self.assertEqual(KB_shm.KB_shm.getVersionFromBin(self.image_path), "test")
+		self.assertTrue(KB_shm.KB_shm.checkImage(self.image_path, self.kb_path))
+
+		# obraz namapovaný přímo ze souboru obsahuje totéž co sdílená paměť démona
+		image = KB_shm.KB_shm(self.image_path)
+		self.assertTrue(image.check())
+		image.start()
+		try:
+			self.assertEqual(image.version(), "test")
+			for line in xrange(1, len(KB_DATA) + 1):
+				self.assertEqual(image.dataRow(line), self.kb.dataRow(line))
+			self.assertEqual(image.dataForLines([2, 4], "NAME"), ["Praha", "Lima"])
+			self.assertEqual(nan_list(image.numericColumn("CONFIDENCE")), nan_list(self.kb.numericColumn("CONFIDENCE")))
+		finally:
+			image.end()
+
+	def test_check_image(self):
+		other_kb_path = os.path.join(self.tmp_dir, "other.all")
+		try:
+			# jiná verze KB
+			write_kb(other_kb_path, "other")
+			self.assertFalse(KB_shm.KB_shm.checkImage(self.image_path, other_kb_path))
+			# KB bez verze se porovnává podle času změny
+			write_kb(other_kb_path, None)
+			self.assertFalse(KB_shm.KB_shm.checkImage(self.image_path, other_kb_path))
+		finally:
+			os.remove(other_kb_path)
+
+		# neexistující obraz a název sdílené paměti místo cesty
+		self.assertFalse(KB_shm.KB_shm.checkImage(self.image_path + ".missing", self.kb_path))
+		self.assertFalse(KB_shm.KB_shm.checkImage(self.shm_name, self.kb_path))
+
+if __name__ == "__main__":
+	unittest.main()
+
+# konec souboru test_KB_shm.py
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set tabstop=4 softtabstop=4 expandtab shiftwidth=4
+
+# Porovná počet matchů z figy (dříve se pro každý vytvářel objekt Entity)
+# s počtem skutečně vytvořených objektů Entity a počtem vyhodnocení
+# línně počítaných atributů (ncr2unicode, kb.people_named) pro každý dokument.
+#
+# Příklad:
+#     ./benchmark_entities.py dokument1.txt dokument2.txt
+
+import sys
+import time
+import argparse
+import ner_cz
+
+counters = {}
+
+def counting(name, function):
+    """ Wraps a function so that each of its calls increments counters[name]. """
+    def wrapper(*args, **kwargs):
+        counters[name] += 1
+        return function(*args, **kwargs)
+    return wrapper
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+', help='Input documents.')
+    parser.add_argument('-l', '--lowercase', action='store_true', default=False, help="Changes all characters in input to the lowercase characters.")
+    arguments = parser.parse_args()
+
+    kb = ner_cz.ner_knowledge_base.KnowledgeBaseCZ(kb_shm_name="/decipherKB-CZ-daemon_shm-999")
+
+    original_get_figa_matches = ner_cz.get_figa_matches
+    def get_figa_matches(*args, **kwargs):
+        matches = original_get_figa_matches(*args, **kwargs)
+        counters["figa matches"] += len(matches)
+        return matches
+
+    ner_cz.get_figa_matches = get_figa_matches
+    ner_cz.Entity.__init__ = counting("Entity objects", ner_cz.Entity.__init__)
+    ner_cz.ncr2unicode = counting("ncr2unicode calls", ner_cz.ncr2unicode)
+    kb.people_named = counting("people_named calls", kb.people_named)
+
+    try:
+        kb.start()
+        kb.initName_dict()
+        kb.initFeatures()
+
+        print("\t".join(["file", "figa matches", "Entity objects", "ncr2unicode calls", "people_named calls", "time [s]"]))
+        for file_name in arguments.files:
+            with open(file_name) as f:
+                input_string = f.read().strip()
+
+            for name in ["figa matches", "Entity objects", "ncr2unicode calls", "people_named calls"]:
+                counters[name] = 0
+
+            start = time.time()
+            ner_cz.recognize(kb, input_string, print_result=False, lowercase=arguments.lowercase)
+            elapsed = time.time() - start
+
+            print("\t".join([file_name] + [str(counters[name]) for name in ["figa matches", "Entity objects", "ncr2unicode calls", "people_named calls"]] + ["%.3f" % elapsed]))
+    finally:
+        kb.end()
+
+if __name__ == "__main__":
+    main()
+
+# konec souboru benchmark_entities.py
@@ -28,11 +28,16 @@ import sys
 
 # Pro debugování:
 import inspect
+import linecache
 import traceback
 import time
 DEBUG_EN = True
+# Je-li DEBUG_EN zapnuto, sample() vrací True jen pro každé DEBUG_SAMPLE-té volání (např. každý N-tý dokument).
+DEBUG_SAMPLE = 1
 #
 
+_sample_counter = 0
+
 # FUNKCE A TŘÍDY:
 
 def print_dbg_en(*args, **kwargs):
@@ -90,6 +95,27 @@ def caller_inspect():
 	return head
 #
 
+def sample():
+	'''
+	Vrací True, pokud je debugování zapnuto a aktuální volání (např. zpracování dokumentu) patří mezi vzorky (každé DEBUG_SAMPLE-té volání).
+	Při vypnutém debugování se počítadlo nemění.
+	'''
+	global _sample_counter
+	
+	if not DEBUG_EN:
+		return False
+	_sample_counter += 1
+	return (_sample_counter - 1) % DEBUG_SAMPLE == 0
+#
+
+def caller_source_line(stack_num=1, line_offset=0):
+	'''
+	Vrací řádek zdrojového kódu volajícího (posunutý o line_offset řádků), např. caller_source_line(line_offset=-1) vrací řádek před voláním.
+	'''
+	frame = sys._getframe(stack_num + 1)
+	return linecache.getline(frame.f_code.co_filename, frame.f_lineno + line_offset)
+#
+
 def cur_traceback():
 	formated_traceback = traceback.format_stack()[:-1]
 	return "".join(formated_traceback)
@@ -14,18 +14,27 @@ import argparse
 import figa.make_automat.natToKB as natToKB
 import figa.sources.marker as figa
 import ner_knowledge_base
-from ner_knowledge_base import KB_MULTIVALUE_DELIM
+from ner_knowledge_base import KB_MULTIVALUE_DELIM, IntSet
 import os
-import unicodedata
 import uuid
 import collections
+import copy
+import bisect
+import io
+import hashlib
+import json
+import signal
+import multiprocessing
+import codecs
+import time
 import dates
+from normalization import remove_accent_str, remove_accent_unicode
 import name_recognizer.data_row as module_data_row
 import name_recognizer.name_recognizer as name_recognizer
 import numpy
 
 # Pro debugování:
-import difflib, linecache, inspect
+import difflib
 
 import logging
 module_logger = logging.getLogger("ner")
@@ -90,40 +99,11 @@ MENTIONS_TYPE = {
 
 display_entity_score = False
 
-ACCENT_REGEX = re.compile(r"COMBINING|HANGUL JUNGSEONG|HANGUL JONGSEONG")
-
 nationalities_forms = natToKB.NatToKB().get_nationalities()
 
-# same as in ner.py
-def unicodedata_name(c):
-    """ Workaround for unicodedata.name(c) in order to deal with ValueError reising for characters without names (all control characters)."""
-
-    try:
-        return unicodedata.name(c)
-    except ValueError:
-        return ""
-
-# same as in ner.py
-def remove_accent_str(input_string):
-    """ Removes accent from the string, e.g. "José Francisco" -> "Jose Francisco". """
-    assert isinstance(input_string, basestring)
-
-    nfkd_form = unicodedata.normalize('NFKD', unicode(input_string))
-    return str("".join([c for c in nfkd_form if not unicodedata.combining(c)]))
-
-# same as in ner.py
-def remove_accent_unicode(_string):
-    """ Removes accents from a string. For example, "Eduard Ovčáček" -> "Eduard Ovcacek". """
-    assert isinstance(_string, basestring)
-    _string = unicode(_string)
-
-    nfkd_form = unicodedata.normalize('NFKD', _string)
-    result = str("".join([c for c in nfkd_form if not ACCENT_REGEX.search(unicodedata_name(c))]))
-    result = result.decode("utf8", "replace")
-    if len(_string) == len(result):
-        return result
-    else:
-        return _string
+def average(values):
+    """ Returns the same value as numpy.average(values) for a short list of numbers without creating an array. """
+    return numpy.float64(sum(values)) / len(values)
 
 # same as in ner.py
 def ncr2unicode(s):
@@ -144,6 +124,77 @@ def ncr2unicode(s):
 	return re.sub(r"&#([xX]?(?:[0-9a-fA-F]+));", replaceEntities, s).encode(sys.getdefaultencoding())
 
 
+class OffsetIndex(object):
+    """
+    Entities grouped by a key (e.g. a sense or a source) and sorted by their
+    start offsets, so the nearest entity of given keys is found by bisection.
+    """
+
+    def __init__(self):
+        self.offsets = {}
+        self.entities = {}
+
+    def add(self, key, entity):
+        """ Adds the entity under the key. """
+        if key not in self.offsets:
+            self.offsets[key] = []
+            self.entities[key] = []
+        offsets = self.offsets[key]
+        i = bisect.bisect_right(offsets, entity.start_offset)
+        offsets.insert(i, entity.start_offset)
+        self.entities[key].insert(i, entity)
+
+    def discard(self, key, entity):
+        """ Removes the entity from the key if it is present. """
+        offsets = self.offsets.get(key)
+        if not offsets:
+            return
+        entities = self.entities[key]
+        i = bisect.bisect_left(offsets, entity.start_offset)
+        while i < len(offsets) and offsets[i] == entity.start_offset:
+            if entities[i] is entity:
+                del offsets[i]
+                del entities[i]
+                return
+            i += 1
+
+    def nearest_predecessor(self, keys, offset, accept=None):
+        """
+        Returns the entity of any of the keys starting nearest before the offset
+        (only entities for which accept(entity) is true are considered).
+        """
+        result = None
+        for key in keys:
+            offsets = self.offsets.get(key)
+            if not offsets:
+                continue
+            entities = self.entities[key]
+            i = bisect.bisect_left(offsets, offset) - 1
+            while i >= 0 and (result is None or offsets[i] > result.start_offset):
+                if accept is None or accept(entities[i]):
+                    result = entities[i]
+                    break
+                i -= 1
+        return result
+
+    def nearest(self, keys, offset):
+        """ Returns the entity of any of the keys starting nearest to the offset (the preceding one on a tie). """
+        result = None
+        result_distance = None
+        for key in keys:
+            offsets = self.offsets.get(key)
+            if not offsets:
+                continue
+            i = bisect.bisect_left(offsets, offset)
+            for j in (i - 1, i):
+                if 0 <= j < len(offsets):
+                    distance = abs(offset - offsets[j])
+                    if result is None or (distance, offsets[j]) < (result_distance, result.start_offset):
+                        result = self.entities[key][j]
+                        result_distance = distance
+        return result
+
+
 # same as in ner.py
 class EntityRegister(object):
     """ A class containing the index of all disambiguated entities. """
@@ -151,6 +202,8 @@ class EntityRegister(object):
     def __init__(self):
         self.id2entity = {}
         self.entity2id = {}
+        # entities of each sense sorted by offsets
+        self.id2offsets = OffsetIndex()
 
     def insert_entity(self, _entity, _id):
         """ Insterts a preferred sense for a given entity into to the entity register. """
@@ -160,19 +213,149 @@ class EntityRegister(object):
         if _entity in self.entity2id:
             sense = self.entity2id[_entity]
             self.id2entity[sense].discard(_entity)
+            self.id2offsets.discard(sense, _entity)
         self.entity2id[_entity] = _id
         if _id not in self.id2entity:
             self.id2entity[_id] = set()
         self.id2entity[_id].add(_entity)
+        self.id2offsets.add(_id, _entity)
 
     def __str__(self):
         return str(self.id2entity)
 
 
+class SentenceIndex(object):
+    """
+    An index of sentence boundaries of a document built in one pass.
+
+    Entity.right_sentence() takes characters to the right of an entity that lie
+    at the same depth of parentheses and stops at the first full stop at that
+    depth. Characters of each depth are therefore stored as one string and the
+    sentence of any offset is found by bisection.
+    """
+
+    def __init__(self, text):
+        assert isinstance(text, unicode)
+
+        # offsets of parentheses and the depth right after each of them
+        self.paren_offsets = []
+        self.paren_depths = []
+        # depth -> (offsets of characters, characters, offsets of full stops in characters)
+        self.levels = {}
+
+        depth = 0
+        offsets = {}
+        chars = {}
+        for offset, char in enumerate(text):
+            if char == ")":
+                depth -= 1
+            elif char == "(":
+                depth += 1
+            else:
+                if depth not in offsets:
+                    offsets[depth] = []
+                    chars[depth] = []
+                offsets[depth].append(offset)
+                chars[depth].append(char)
+                continue
+            self.paren_offsets.append(offset)
+            self.paren_depths.append(depth)
+
+        for depth in offsets:
+            level_text = u"".join(chars[depth])
+            full_stops = [i for i, c in enumerate(level_text) if c == "."]
+            verbs = {}
+            for verb in VERBS:
+                verbs[verb] = []
+                i = level_text.find(verb)
+                while i != -1:
+                    verbs[verb].append(i)
+                    i = level_text.find(verb, i + 1)
+            self.levels[depth] = (offsets[depth], level_text, full_stops, verbs)
+
+    def _bounds(self, offset):
+        """ Returns (level, start, end) of the sentence to the right of the offset. """
+        i = bisect.bisect_left(self.paren_offsets, offset)
+        depth = self.paren_depths[i - 1] if i else 0
+
+        level = self.levels.get(depth)
+        if level is None:
+            return None, 0, 0
+        offsets, level_text, full_stops, verbs = level
+
+        start = bisect.bisect_left(offsets, offset)
+        i = bisect.bisect_left(full_stops, start)
+        end = full_stops[i] + 1 if i < len(full_stops) else len(level_text)
+        return level, start, end
+
+    def right_sentence(self, offset):
+        """ Returns the same sentence as Entity.right_sentence() for an entity ending at the offset. """
+        level, start, end = self._bounds(offset)
+        if level is None:
+            return u""
+        return level[1][start:end]
+
+    def verb_index(self, offset):
+        """ Returns an index of the first verb from VERBS in the right sentence (-1 if there is none). """
+        level, start, end = self._bounds(offset)
+        if level is None:
+            return -1
+        verbs = level[3]
+        for verb in VERBS:
+            positions = verbs[verb]
+            i = bisect.bisect_left(positions, start)
+            if i < len(positions) and positions[i] + len(verb) <= end:
+                return positions[i] - start
+        return -1
+
+
+class OffsetIntervals(object):
+    """
+    A set of character offsets stored as sorted disjoint closed intervals.
+
+    It replaces sets of all covered offsets, so both memory and time depend on
+    the number of intervals instead of the number of covered characters.
+    """
+
+    def __init__(self, intervals=()):
+        """ Creates the set from an iterable of (start, end) pairs (the end is included). """
+        self.starts = []
+        self.ends = []
+
+        for start, end in sorted(i for i in intervals if i[0] <= i[1]):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def overlaps(self, start, end):
+        """ Returns True if any offset from start to end (included) is in the set. """
+        if start > end:
+            return False
+        i = bisect.bisect_right(self.starts, end) - 1
+        return i >= 0 and self.ends[i] >= start
+
+    def add(self, start, end):
+        """ Adds offsets from start to end (included) into the set. """
+        if start > end:
+            return
+        lo = bisect.bisect_left(self.ends, start)
+        hi = bisect.bisect_right(self.starts, end)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+
+    def __len__(self):
+        return len(self.starts)
+
+
 class Entity(object):
     """ A text entity referring to a knowledge base item. """
 
-    def __init__(self, entity_attributes, kb, input_string, input_string_in_unicode, register):
+    def __init__(self, entity_attributes, kb, input_string, input_string_in_unicode, register, sentence_index=None, global_senses=None):
         """
         Creates an entity by parsing a line of figa output from entity_str.
         Entity will be referring to an item of the knowledge base kb.
@@ -182,19 +365,23 @@ class Entity(object):
         input_string - input string
         input_string_in_unicode - input string in Unicode
         register - entity register
+        sentence_index - sentence index of input_string_in_unicode shared by all entities of a document
+        global_senses - if set, possible coreferences are restricted to these senses
+
+        The source text, the nationality flag and possible coreferences are computed on first access.
         """
         assert isinstance(entity_attributes, FigaOutput)
         assert isinstance(kb, ner_knowledge_base.KnowledgeBaseCZ)
         assert isinstance(input_string, str)
         assert isinstance(input_string_in_unicode, unicode)
         assert isinstance(register, EntityRegister)
+        assert isinstance(sentence_index, SentenceIndex) or sentence_index == None
 
         self.next_to_same_type = False
         self.display_score = False
         self.poorly_disambiguated = True
         self.is_coreference = False
         self.is_name = False
-        self.is_nationality = False
 
         self.preferred_sense = None
         self.next_word_begin = None
@@ -212,25 +399,50 @@ class Entity(object):
 
         self.kb = kb
         self.register = register
+        self._sentence_index = sentence_index
+        self._normalized_source = None
+        self._global_senses = global_senses
 
         # getting possible senses (sense 0 marks a coreference)
-        self.senses = set([s for s in entity_attributes.kb_rows if s != 0])
+        self.senses = IntSet(s for s in entity_attributes.kb_rows if s != 0)
 
         # Ofsety jsou vztaženy k unicode.
         self.start_offset = entity_attributes.start_offset
         self.end_offset = entity_attributes.end_offset
         self.begin_of_paragraph = None
 
-        # the source text of the entity
-        self.source = ncr2unicode(entity_attributes.fragment)
-
-        if len(self.senses) == 0:
-            global nationalities_forms
-            if self.source in nationalities_forms:
-                self.is_nationality = True
-
-        # possible coreferences - people whose names are supersets of an entity
-        self.partial_match_senses = self.kb.people_named(remove_accent_unicode(self.source).lower())
+        # the source text of the entity (see Entity.source)
+        self._fragment = entity_attributes.fragment
+        self._source = None
+        self._is_nationality = None
+        self._partial_match_senses = None
+
+    @property
+    def source(self):
+        """ The source text of the entity. """
+        if self._source is None:
+            self._source = ncr2unicode(self._fragment)
+        return self._source
+
+    @property
+    def is_nationality(self):
+        """ True if the entity without any sense is a nationality. """
+        if self._is_nationality is None:
+            self._is_nationality = len(self.senses) == 0 and self.source in nationalities_forms
+        return self._is_nationality
+
+    @property
+    def partial_match_senses(self):
+        """ Possible coreferences - people whose names are supersets of an entity. """
+        if self._partial_match_senses is None:
+            self._partial_match_senses = self.kb.people_named(self.normalized_source)
+            if self._global_senses is not None:
+                self._partial_match_senses = self._partial_match_senses & self._global_senses
+        return self._partial_match_senses
+
+    @partial_match_senses.setter
+    def partial_match_senses(self, value):
+        self._partial_match_senses = value
 
     @classmethod
     def from_data_row(cls, kb, dr, input_string, input_string_in_unicode, register):
@@ -267,26 +479,67 @@ class Entity(object):
         else:
             return self.preferred_sense
 
-    def disambiguate_without_context(self):
-        """ Chooses the correct sense of the entity as the preferred one (without context). """
+    def disambiguate_without_context(self, results=None):
+        """
+        Chooses the correct sense of the entity as the preferred one (without context).
+
+        results - ContextFreeResults of the previous revision of the document (the result is reused if possible)
+        """
 
         # we don't resolve coreference in this step
         if self.source.lower() in PRONOUNS or self.partial_match_senses:
             self.is_coreference = True
             return
 
+        if results is None:
+            self.disambiguate_senses()
+        else:
+            results.disambiguate(self)
+
+    def context_free_key(self):
+        """ Returns everything disambiguate_senses() depends on (the same key means the same result). """
+        verb_index = self.sentence_index.verb_index(self.end_offset)
+        return (self.senses, self.left_context(" během "), verb_index, self.right_sentence() if verb_index != -1 else None)
+
+    def context_free_state(self):
+        """ Returns the result of disambiguate_senses() (see restore_context_free_state()). """
+        preferred_sense = self.preferred_sense if self.has_preferred_sense() else None
+        return (self.senses, tuple(self.candidates), tuple(self.score), tuple(self.static_score), preferred_sense, self.poorly_disambiguated)
+
+    def restore_context_free_state(self, state):
+        """ Sets the result of disambiguate_senses() of an entity with the same context_free_key(). """
+        senses, candidates, score, static_score, preferred_sense, self.poorly_disambiguated = state
+        self.senses = senses
+        self.candidates = list(candidates)
+        self.score = list(score)
+        self.static_score = list(static_score)
+        if preferred_sense is not None:
+            self.set_preferred_sense(preferred_sense)
+
+    def context_state(self):
+        """ Returns the result of disambiguate_with_context() (see restore_context_state()). """
+        preferred_sense = self.preferred_sense if self.has_preferred_sense() else None
+        return (tuple(self.score), tuple(self.static_score), tuple(self.context_score), preferred_sense, self.poorly_disambiguated)
+
+    def restore_context_state(self, state):
+        """ Sets the result of disambiguate_with_context() of an entity of a paragraph with the same key (see ParagraphContextResults). """
+        score, static_score, context_score, preferred_sense, self.poorly_disambiguated = state
+        self.score = list(score)
+        self.static_score = list(static_score)
+        self.context_score = list(context_score)
+        if preferred_sense is not None:
+            self.set_preferred_sense(preferred_sense)
+
+    def disambiguate_senses(self):
+        """ Disambiguates an entity, which is not a coreference, without context. """
 
         # only event can start with word během
         if(self.left_context(" během ")):
-        	self.senses = [s for s in self.senses if self.kb.get_ent_type(s) == "event"]
+        	self.senses = IntSet(s for s in self.senses if self.kb.get_ent_type(s) == "event")
 
         # search for one of verbs in rest of the sentence
         sentence = self.right_sentence()
-        verb_index = -1
-        for verb in VERBS:
-            verb_index = sentence.find(verb)
-            if(verb_index != -1):
-                break
+        verb_index = self.sentence_index.verb_index(self.end_offset)
 
         # if verb is behind entity in sentence try to disambiguate
         # Example: sentence: Washington byl první prezident USA.
@@ -299,24 +552,21 @@ class Entity(object):
             proffesions = []
             for s in self.senses:
                 if(self.kb.get_ent_type(s) in ["person", "person:artist", "person:fictional"]):
-                    proffesions = self.kb.get_data_for(s, "JOBS")
+                    proffesions = [p for p in self.kb.get_jobs(s) if sentence.find(" " + p + " ", verb_index) != -1]
                     if(proffesions):
-                        proffesions = proffesions.split(KB_MULTIVALUE_DELIM)
-                        proffesions = [p for p in proffesions if sentence.find(" " + p + " ", verb_index) != -1]
-                        if(proffesions):
-                            break
+                        break
 
             if(proffesions):
                 new_senses = []
                 for s in self.senses:
                     if self.kb.get_ent_type(s) in ["person", "person:artist", "person:fictional"]:
-                        for proffesion in self.kb.get_data_for(s, "JOBS").split(KB_MULTIVALUE_DELIM):
+                        for proffesion in self.kb.get_jobs(s):
                             if(proffesion in proffesions):
                                 new_senses.append(s)
                                 break
-                self.senses = new_senses
+                self.senses = IntSet(new_senses)
 
-        self.senses = set(self.senses)
+        # candidates are in the ascending order of senses
         self.candidates = list(self.senses)
 
 
@@ -337,9 +587,14 @@ class Entity(object):
 
             self.set_preferred_sense(self.candidates[self.score.index(max(self.score))])
 
-    def disambiguate_with_context(self, context):
-        """ Chooses the correct sense of the entity as the preferred one (with context). """
+    def disambiguate_with_context(self, context, deadline=None):
+        """
+        Chooses the correct sense of the entity as the preferred one (with context).
+
+        deadline - if the Deadline expires, the disambiguation without context is kept
+        """
         assert isinstance(context, Context)
+        assert isinstance(deadline, Deadline) or deadline == None
 
         # we don't resolve coreference in this step
         if self.is_coreference or not self.candidates:
@@ -349,11 +604,16 @@ class Entity(object):
         context.recompute_paragraph_offset(self.start_offset)
 
         # the entity has to be disambiguated
+        scores_without_context = (self.score, self.static_score, self.context_score)
         self.score = []
         self.static_score = []
         self.context_score = []
 
         for i in self.candidates:
+            if deadline is not None and deadline.expired():
+                deadline.degrade("context disambiguation")
+                self.score, self.static_score, self.context_score = scores_without_context
+                return
             ent_type = self.kb.get_ent_type(i)
             static_score = self.kb.get_score(i)
             context_score = 0
@@ -534,21 +794,23 @@ class Entity(object):
             return False
         return text[self.end_offset:self.end_offset + length] == right
 
+    @property
+    def normalized_source(self):
+        """ The source without accents in lowercase (computed once). """
+        if self._normalized_source is None:
+            self._normalized_source = remove_accent_unicode(self.source).lower()
+        return self._normalized_source
+
+    @property
+    def sentence_index(self):
+        """ The sentence index of the input string (built on demand if it was not shared by recognize()). """
+        if self._sentence_index is None:
+            self._sentence_index = SentenceIndex(self.input_string_in_unicode)
+        return self._sentence_index
+
     def right_sentence(self):
-        text = self.input_string_in_unicode[self.end_offset:]
-        collum_count = 0
-        sentence = ""
-
-        for index in range(0, len(text)):
-            if(text[index] ==")"):
-                collum_count -= 1
-            elif(text[index] =="("):
-                collum_count += 1
-            elif(not collum_count):
-                sentence += text[index]
-                if(text[index] == "." ):
-                    break
-        return sentence
+        """ Returns the rest of the sentence behind the entity (without parenthesized text). """
+        return self.sentence_index.right_sentence(self.end_offset)
 
     def left_context(self, left):
         assert isinstance(left, basestring)
@@ -588,11 +850,23 @@ class Entity(object):
 class Context(object):
     """ Information about a context of a processed text. """
 
-    def __init__(self, entities, kb, paragraphs, nationalities):
-        """ Prepares the context from the list of entities disambiguated without the context. """
+    # statistics kept for each paragraph (see paragraph_state())
+    PARAGRAPH_FIELDS = ("mentions", "countries", "country_sum", "people_nationalities", "people_dates", "people", "events", "people_professions", "organisations", "person_static_scores")
+
+    def __init__(self, entities, kb, paragraphs, nationalities, deadline=None, reused_paragraphs=None):
+        """
+        Prepares the context from the list of entities disambiguated without the context.
+
+        deadline - if the Deadline expires, the construction is not finished and "Context construction" is degraded
+                   (the context must not be used then)
+        reused_paragraphs - statistics of paragraphs taken from the previous revision of the document keyed by the start
+                            offset of the paragraph (see paragraph_state()); they are not computed again
+        """
         assert isinstance(entities, list) # list of Entity and dates.Date
         assert isinstance(kb, ner_knowledge_base.KnowledgeBaseCZ)
         assert isinstance(paragraphs, list)
+        assert isinstance(deadline, Deadline) or deadline == None
+        assert isinstance(reused_paragraphs, dict) or reused_paragraphs == None
 
         self.entities = entities
         self.kb = kb
@@ -621,6 +895,9 @@ class Context(object):
         # initializing the paragraph index
         self.paragraph_index = 0
         self.events = {}
+        # scores of person candidates in each paragraph (see prepare_person_scores())
+        self.person_static_scores = {}
+        self.reused_paragraphs = set(reused_paragraphs or ())
 
         # initializing index variables
         par_index = 0
@@ -632,7 +909,24 @@ class Context(object):
 
         # computing statistics for each paragraph
         for par in self.paragraphs:
-            self.mentions[par] = MENTIONS_TYPE # FIXME: Jestli se nemýlím, tak toto je chyba. IHMO by tady mělo být deepcopy(MENTIONS_TYPE)
+            if deadline is not None and deadline.expired():
+                deadline.degrade("Context construction")
+                return
+
+            if par in self.reused_paragraphs:
+                # only the paragraph of each entity is set
+                self.restore_paragraph_state(par, reused_paragraphs[par])
+                while (nat_index < len(nationalities) and nationalities[nat_index].start_offset < self.paragraphs[par_index + 1]):
+                    nat_index += 1
+                while (ent_index < len(entities) and entities[ent_index].start_offset < self.paragraphs[par_index + 1]):
+                    if isinstance(entities[ent_index], Entity):
+                        entities[ent_index].begin_of_paragraph = par
+                    ent_index += 1
+                par_index += 1
+                continue
+
+            # each paragraph counts its own mentions (a shared MENTIONS_TYPE would carry them over to other paragraphs and documents)
+            self.mentions[par] = copy.deepcopy(MENTIONS_TYPE)
             self.countries[par] = {}
             self.people_nationalities[par] = []
             self.people_dates[par] = []
@@ -741,10 +1035,8 @@ class Context(object):
                         for c in ent.candidates:
                             ent_type = ent.kb.get_ent_type(c)
                             if ent_type in ["person", "person:artist", "person:fictional"]:
-                                professions = ent.kb.get_data_for(c, "JOBS")
-                                if(professions):
-                                    professions = professions.split(KB_MULTIVALUE_DELIM)
-                                    [self.people_professions[par].append(p) for p in professions if par_text.find(p) != -1 and p not in self.people_professions[par]]
+                                professions = ent.kb.get_jobs(c)
+                                [self.people_professions[par].append(p) for p in professions if par_text.find(p) != -1 and p not in self.people_professions[par]]
 
                 elif isinstance(ent, dates.Date):
                     if ent.class_type == ent.Type.DATE:
@@ -758,6 +1050,19 @@ class Context(object):
 
         # removing the artificial paragraph
 
+        # precomputing scores of person candidates
+        self.prepare_person_scores(deadline)
+
+    def paragraph_state(self, par):
+        """ Returns a copy of statistics of the paragraph starting at the offset par (see restore_paragraph_state()). """
+        return copy.deepcopy(tuple(getattr(self, field).get(par) for field in self.PARAGRAPH_FIELDS))
+
+    def restore_paragraph_state(self, par, state):
+        """ Sets statistics of the paragraph starting at the offset par to a copy of the result of paragraph_state(). """
+        for field, value in zip(self.PARAGRAPH_FIELDS, copy.deepcopy(state)):
+            if value is not None:
+                getattr(self, field)[par] = value
+
     def recompute_paragraph_offset(self, start_offset):
         """
         Recomputes paragraph offset, if the entity at the start_offset belongs
@@ -817,10 +1122,78 @@ class Context(object):
         return mentioned_in_par_score
 
 
-    def person_percentile(self, candidate):
+    def prepare_person_scores(self, deadline=None):
         """
-        Returns a percentile of references to a candidate person from
-        knowledge base amongst other people.
+        Computes the nationality, date and profession components of person_percentile()
+        for all candidates of all entities of each paragraph at once using KB features.
+        If the deadline expires, "Context construction" is degraded and the scores are not finished.
+        Scores of reused paragraphs are not computed again.
+        """
+        features = self.kb.features
+        if not features:
+            return
+
+        candidates_in_par = {}
+        for ent in self.entities:
+            if isinstance(ent, Entity) and ent.candidates and ent.begin_of_paragraph is not None and ent.begin_of_paragraph not in self.reused_paragraphs:
+                if ent.begin_of_paragraph not in candidates_in_par:
+                    candidates_in_par[ent.begin_of_paragraph] = set()
+                candidates_in_par[ent.begin_of_paragraph].update(c for c in ent.candidates if features.has_line(c))
+
+        date_types = features.value_ids("TYPE", ["person", "artist"])
+
+        for par, candidates in candidates_in_par.iteritems():
+            if deadline is not None and deadline.expired():
+                deadline.degrade("Context construction")
+                return
+
+            candidates = numpy.array(sorted(candidates), dtype=numpy.int64)
+
+            nationality_scores = features.count_values("NATIONALITY", candidates, self.people_nationalities[par])
+            if self.people_nationalities[par]:
+                nationality_scores = nationality_scores * 100 // len(self.people_nationalities[par])
+
+            profession_scores = features.count_values("JOBS", candidates, self.people_professions[par])
+            if self.people_professions[par]:
+                profession_scores = profession_scores * 100 // len(self.people_professions[par])
+
+            date_scores = numpy.zeros(len(candidates), dtype=numpy.int64)
+            if self.people_dates[par]:
+                births = features.ids["DATE OF BIRTH"][candidates]
+                deaths = features.ids["DATE OF DEATH"][candidates]
+                birth_dates = features.vocabularies["DATE OF BIRTH"]
+                death_dates = features.vocabularies["DATE OF DEATH"]
+
+                date_scores = self.count_date_matches(birth_dates, births, par)
+                # dates of a person are a set, so the same date of birth and death is counted once
+                counted_twice = numpy.array([birth_dates[b] != death_dates[d] for b, d in zip(births.tolist(), deaths.tolist())], dtype=bool)
+                date_scores += numpy.where(counted_twice, self.count_date_matches(death_dates, deaths, par), 0)
+                # only people have dates (see KnowledgeBaseCZ.get_dates())
+                date_scores[~numpy.in1d(features.ids["TYPE"][candidates], date_types)] = 0
+                date_scores = date_scores * 100 // len(self.people_dates[par])
+
+            scores = nationality_scores + date_scores + profession_scores
+            self.person_static_scores[par] = dict(zip(candidates.tolist(), scores.tolist()))
+
+    def count_date_matches(self, vocabulary, date_ids, par):
+        """
+        For each date from the array of vocabulary ids returns a number of dates of the paragraph
+        matching it. Each distinct date is compared with the dates of the paragraph only once.
+        """
+        unique_ids, inverse = numpy.unique(date_ids, return_inverse=True)
+        matches = []
+        for date_id in unique_ids.tolist():
+            person_date = vocabulary[date_id]
+            if person_date:
+                matches.append(sum(1 for context_date in self.people_dates[par] if context_date.find(person_date) > -1 or person_date.find(context_date) > -1))
+            else:
+                matches.append(0)
+        return numpy.array(matches, dtype=numpy.int64)[inverse]
+
+    def person_static_score(self, candidate):
+        """
+        Returns the sum of the nationality, date and profession components of person_percentile()
+        for a single candidate.
         """
         assert isinstance(candidate, int)
         par_index = self.paragraphs[self.paragraph_index]
@@ -856,21 +1229,35 @@ class Context(object):
         # computing people_profession_score
         people_profession_score = 0
 
-        person_professions = self.kb.get_data_for(candidate, "JOBS").split(KB_MULTIVALUE_DELIM)
+        person_professions = self.kb.get_jobs(candidate)
         for prof in person_professions:
             if prof in self.people_professions[par_index]:
                 people_profession_score += 1
         if self.people_professions[par_index]:
             people_profession_score = people_profession_score * 100 / len(self.people_professions[par_index])
 
+        return people_nationality_score + people_date_score + people_profession_score
+
+    def person_percentile(self, candidate):
+        """
+        Returns a percentile of references to a candidate person from
+        knowledge base amongst other people.
+        """
+        assert isinstance(candidate, int)
+        par_index = self.paragraphs[self.paragraph_index]
+
+        # nationality, date and profession scores (precomputed by prepare_person_scores())
+        static_score = self.person_static_scores.get(par_index, {}).get(candidate)
+        if static_score is None:
+            static_score = self.person_static_score(candidate)
 
         person_name = [self.kb.get_data_for(candidate, "NAME")]
         mentioned_in_par_score = self.mentioned_in_par(person_name, 'person')
 #        if person_name in self.mentions[par_index]['person']:
 #            mentioned_in_par_score = self.mentions[par_index]['person'][person_name] * 100 / sum(self.mentions[par_index]['person'].values())
 
-        # summing up the scores
-        result = numpy.average([people_nationality_score, people_date_score, people_profession_score, mentioned_in_par_score])
+        # summing up the scores (the same as an average of all four scores)
+        result = numpy.float64(static_score + mentioned_in_par_score) / 4
 
         # storing new max score
         if candidate in self.people_max_scores and result > self.people_max_scores[candidate]:
@@ -887,7 +1274,7 @@ class Context(object):
         if ent_type == "settlement":
             country = [self.kb.get_data_for(candidate, "COUNTRY")]
             country_score = self.mentioned_in_par(country, 'country')
-            mentioned_in_par_score = numpy.average([mentioned_in_par_score, country_score])
+            mentioned_in_par_score = average([mentioned_in_par_score, country_score])
 
         return mentioned_in_par_score
 
@@ -899,7 +1286,7 @@ class Context(object):
         if ent_type == 'watercourse':
             geo = [self.kb.get_data_for(candidate, "SOURCE_LOC")]
             geo_score = self.mentioned_in_par(geo, 'geo')
-            mentioned_in_par_score = numpy.average([mentioned_in_par_score, geo_score])
+            mentioned_in_par_score = average([mentioned_in_par_score, geo_score])
 
         return mentioned_in_par_score
 
@@ -965,7 +1352,7 @@ class Context(object):
             org_date_score = org_date_score * 100 / len(self.people_dates[par_index])
 
 
-        result = numpy.average([mentioned_in_par_score, place_score, org_date_score])
+        result = average([mentioned_in_par_score, place_score, org_date_score])
 
         return result
 
@@ -992,7 +1379,7 @@ class Context(object):
         #if place_score:
         #    place_score = place_score * 100 / self.country_sum[par_index]
 
-        result = numpy.average([mentioned_in_par_score, place_score])
+        result = average([mentioned_in_par_score, place_score])
 
         return result
 
@@ -1020,7 +1407,7 @@ class Context(object):
        #if place_score:
        #    place_score = place_score * 100 / self.country_sum[par_index]
 
-        result = numpy.average([mentioned_in_par_score, place_score])
+        result = average([mentioned_in_par_score, place_score])
 
         return result
 
@@ -1048,7 +1435,7 @@ class Context(object):
         #if place_score:
         #    place_score = place_score * 100 / self.country_sum[par_index]
 
-        result = numpy.average([mentioned_in_par_score, place_score])
+        result = average([mentioned_in_par_score, place_score])
 
         return result
 
@@ -1072,7 +1459,7 @@ class Context(object):
         #if place_score:
         #    place_score = place_score * 100 / self.country_sum[par_index]
 #
-        result = numpy.average([mentioned_in_par_score, place_score])
+        result = average([mentioned_in_par_score, place_score])
 
         return result
 
@@ -1106,7 +1493,7 @@ class Context(object):
         #if place_score:
         #    place_score = place_score * 100 / self.country_sum[par_index]
 #
-        result = numpy.average([mentioned_in_par_score, place_score])
+        result = average([mentioned_in_par_score, place_score])
 
         return result
 
@@ -1123,7 +1510,7 @@ class Context(object):
             places.extend(locations.split(KB_MULTIVALUE_DELIM))
         place_score = self.mentioned_in_par(places, 'geoplace:populatedPlace')
 
-        result = numpy.average([mentioned_in_par_score, place_score])
+        result = average([mentioned_in_par_score, place_score])
         return result
 
     def mountain_pass_percentile(self, candidate):
@@ -1139,7 +1526,7 @@ class Context(object):
             places.extend(locations.split(KB_MULTIVALUE_DELIM))
         place_score = self.mentioned_in_par(places, 'geoplace:populatedPlace')
 
-        result = numpy.average([mentioned_in_par_score, place_score])
+        result = average([mentioned_in_par_score, place_score])
         return result
 
 
@@ -1150,7 +1537,7 @@ class Context(object):
         places = [self.kb.get_data_for(candidate, "COUNTRY")]
         place_score = self.mentioned_in_par(places, 'geoplace:populatedPlace')
 
-        result = numpy.average([mentioned_in_par_score, place_score])
+        result = average([mentioned_in_par_score, place_score])
         return result
 
     def river_percentile(self, candidate):
@@ -1176,7 +1563,7 @@ class Context(object):
             places.extend(locations.split(KB_MULTIVALUE_DELIM))
         place_score = self.mentioned_in_par(places, 'geoplace:populatedPlace')
 
-        result = numpy.average([mentioned_in_par_score, place_score])
+        result = average([mentioned_in_par_score, place_score])
         return result
 
     def waterfall_percentile(self, candidate):
@@ -1198,7 +1585,7 @@ class Context(object):
             places.extend(locations.split(KB_MULTIVALUE_DELIM))
         place_score = self.mentioned_in_par(places, 'geoplace:populatedPlace')
 
-        result = numpy.average([mentioned_in_par_score, place_score])
+        result = average([mentioned_in_par_score, place_score])
         return result
 
 
@@ -1214,12 +1601,14 @@ class Context(object):
         self.before_last_male = None
         self.before_last_female = None
 
+PARAGRAPH_SEPARATOR = re.compile(r"(\r?\n|\r)\1+") # {≥2×LF|≥2×CRLF|≥2×CR} ⇒ nový odstavec
+
 def offsets_of_paragraphs(input_string):
     """ Returns a list of starting offsets of each paragraph in input_string. """
     assert isinstance(input_string, unicode)
 
     result = [0]
-    result.extend((par_match.end() for par_match in re.finditer(r"(\r?\n|\r)\1+", input_string))) # {≥2×LF|≥2×CRLF|≥2×CR} ⇒ nový odstavec
+    result.extend((par_match.end() for par_match in PARAGRAPH_SEPARATOR.finditer(input_string)))
     return result
 
 #example:
@@ -1235,37 +1624,58 @@ def offsets_of_paragraphs(input_string):
 
     """
 
+def prune_candidates(entities, max_candidates):
+    """
+    Keeps only max_candidates candidates with the highest static score for each entity
+    (plus candidates, which are mentioned unambiguously in the document).
+    Returns a number of removed candidates.
+    """
+    assert isinstance(entities, list) # list of Entity
+    assert isinstance(max_candidates, int) and max_candidates > 0
+
+    # senses of entities with exactly one candidate
+    unambiguous_senses = set(e.get_preferred_sense() for e in entities if not e.poorly_disambiguated and e.has_preferred_sense())
+
+    pruned = 0
+    for e in entities:
+        if len(e.candidates) <= max_candidates or len(e.static_score) != len(e.candidates):
+            continue
+
+        best = sorted(range(len(e.candidates)), key=lambda i: e.static_score[i], reverse=True)[:max_candidates]
+        kept = set(best)
+        kept.update(i for i, c in enumerate(e.candidates) if c in unambiguous_senses)
+
+        # the order of candidates is preserved
+        kept = sorted(kept)
+        pruned += len(e.candidates) - len(kept)
+        e.candidates = [e.candidates[i] for i in kept]
+        e.static_score = [e.static_score[i] for i in kept]
+        e.score = [e.score[i] for i in kept]
+
+    return pruned
+
 def fix_poor_disambiguation(entities, context):
     """ Fixes the entity sense if poorly_disambiguated is set to True. """
     assert isinstance(entities, list) # list of Entity
     assert isinstance(context, Context)
 
-    strong_entities = {}
-    strong_entities_by_id = {}
+    strong_entities = OffsetIndex()
+    strong_entities_by_id = OffsetIndex()
     entities = [e for e in entities if isinstance(e, Entity) and not e.is_coreference]
 
     for e in entities:
         if not e.poorly_disambiguated:
-            if e.source not in strong_entities:
-                strong_entities[e.source] = []
-            strong_entities[e.source].append(e.get_preferred_entity())
-
-            if e.get_preferred_sense() not in strong_entities_by_id:
-                strong_entities_by_id[e.get_preferred_sense()] = []
-            strong_entities_by_id[e.get_preferred_sense()].append(e.get_preferred_entity())
+            strong_entities.add(e.source, e.get_preferred_entity())
+            strong_entities_by_id.add(e.get_preferred_sense(), e.get_preferred_entity())
 
     for e in entities:
         if e.poorly_disambiguated:
-            candidates = []
-            for s in e.senses:
-                if s in strong_entities_by_id:
-                    candidates += strong_entities_by_id[s]
+            nearest = strong_entities_by_id.nearest(e.senses, e.start_offset)
+            if nearest is None:
+                nearest = strong_entities.nearest([e.source], e.start_offset)
 
-            if candidates != []:
-                e.set_preferred_sense(get_nearest_entity(e, candidates))
-                e.poorly_disambiguated = False
-            elif e.source in strong_entities:
-                e.set_preferred_sense(get_nearest_entity(e, strong_entities[e.source]))
+            if nearest is not None:
+                e.set_preferred_sense(nearest.preferred_sense)
                 e.poorly_disambiguated = False
 
 def add_unknown_names(kb, entities_and_dates, input_string, input_string_in_unicode, register):
@@ -1302,7 +1712,7 @@ def add_unknown_names(kb, entities_and_dates, input_string, input_string_in_unic
         if assigned:
             name_entities[i].senses = assigned.copy()
         else:
-            name_entities[i].senses = set([-(i+1)])
+            name_entities[i].senses = IntSet([-(i+1)])
 
     # resolving overlapping names
     for ne in name_entities:
@@ -1322,11 +1732,9 @@ def add_unknown_names(kb, entities_and_dates, input_string, input_string_in_unic
         if not (substring or overlapping):
             new_name_entities.append(ne)
         elif overlapping:
-            senses = set()
             for o in overlaps:
-                senses = senses | o.senses
                 entities_and_dates.remove(o)
-            ne.senses = senses.copy()
+            ne.senses = IntSet.union_all(o.senses for o in overlaps)
             new_name_entities.append(ne)
 
     # inserting names into entity list
@@ -1414,14 +1822,10 @@ def resolve_coreferences(entities, context, print_all, register):
                 if e.partial_match_senses:
                     # choosing the candidate with the highest confidence score
                     #sense = sorted(list(e.partial_match_senses), key=lambda candidate: context.kb.get_score(candidate), reverse=True)[0]
-                    candidates = []
-                    for sense in e.partial_match_senses:
-                        candidates += list(register.id2entity[sense])
-
-                    # each candidate has to contain the text of a given entity
-                    candidates = (c for c in candidates if remove_accent_unicode(e.source).lower() in remove_accent_unicode(c.source).lower())
                     # choosing the nearest predecessor candidate for a coreference
-                    entity = get_nearest_predecessor(e, candidates)
+                    # (each candidate has to contain the text of a given entity)
+                    source = e.normalized_source
+                    entity = register.id2offsets.nearest_predecessor(e.partial_match_senses, e.start_offset, lambda c: source in c.normalized_source)
                     if entity:
                         e.set_preferred_sense(entity)
                 elif e.source.lower() in PRONOUNS:
@@ -1439,21 +1843,16 @@ def get_nearest_predecessor(_entity, _candidates):
     assert isinstance(_entity, Entity)
     assert isinstance(_candidates, collections.Iterable) # iterable of Entity
 
-    # sorting candidates according to the distance from a given entity # NOTE: Nešlo by to napsat lépe?
-    candidates = sorted(_candidates, key=lambda candidate: _entity.start_offset - candidate.start_offset)
-    for candidate in candidates:
-        if _entity.start_offset - candidate.start_offset > 0:
-            return candidate
+    predecessors = [c for c in _candidates if _entity.start_offset - c.start_offset > 0]
+    if predecessors:
+        return min(predecessors, key=lambda candidate: _entity.start_offset - candidate.start_offset)
 
 def get_nearest_entity(_entity, _candidates):
     """ Returns the nearest entity for a given entity from a given list of candidates. """
     assert isinstance(_entity, Entity)
     assert isinstance(_candidates, collections.Iterable) # iterable of Entity
 
-    # sorting candidates according to the distance from a given entity
-    candidates = sorted(_candidates, key=lambda candidate: abs(_entity.start_offset - candidate.start_offset))
-
-    return candidates[0].preferred_sense
+    return min(_candidates, key=lambda candidate: abs(_entity.start_offset - candidate.start_offset)).preferred_sense
 
 FigaOutput = collections.namedtuple("FigaOutput", "kb_rows start_offset end_offset fragment flag")
 
@@ -1480,34 +1879,100 @@ def parseFigaOutput(figa_output):
             kb_rows, start_offset, end_offset, name, flag = line.split("\t")
             yield FigaOutput(map(int, kb_rows.split(";")), int(start_offset)-1, int(end_offset), name, flag) # Figa má start_offset+1 (end_offset má dobře).
 
-seek_names = None
+class AutomatonError(Exception):
+    """ An automaton that does not exist or cannot be loaded. """
+    pass
+
+class AutomatonRegistry(object):
+    """ Figa automata of all variants (see create_cedar.sh), each of them is loaded once on its first use. """
+
+    # variants of automata and names of their files (without an extension)
+    VARIANTS = {
+        "default": "automata",
+        "lower": "automata-lower",
+        "uri": "automata-uri",
+    }
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.automata = {}
+        # identifiers of loaded automata (a path and a time of modification)
+        self.ids = {}
+
+    def path(self, variant):
+        """ Returns a path to the automaton of a variant (DARTS is preferred to CEDAR). """
+        path_to_figa_dict = os.path.join(self.directory, self.VARIANTS[variant])
+        if os.path.isfile(path_to_figa_dict + ".dct"):
+            return path_to_figa_dict + ".dct" # DARTS
+        else:
+            return path_to_figa_dict + ".ct" # CEDAR
+
+    def exists(self, variant):
+        return os.path.isfile(self.path(variant))
+
+    def get(self, variant):
+        """ Returns the automaton of a variant (it is loaded if necessary). Raises AutomatonError if it cannot be loaded. """
+        if variant not in self.VARIANTS:
+            raise ValueError("Unknown automaton variant \"%s\" (expected one of %s)." % (variant, ", ".join(sorted(self.VARIANTS))))
+
+        automaton = self.automata.get(variant)
+        if automaton is None:
+            path = self.path(variant)
+            if not self.exists(variant):
+                raise AutomatonError("Automaton of variant \"%s\" does not exist (\"%s\")." % (variant, path))
+            automaton = figa.marker()
+            # figa returns false if the automaton cannot be loaded (it is not cached, so the next call tries again)
+            if not automaton.load_dict(path):
+                raise AutomatonError("Automaton of variant \"%s\" cannot be loaded from \"%s\"." % (variant, path))
+            self.automata[variant] = automaton
+            self.ids[variant] = "%s@%d" % (path, os.path.getmtime(path))
+        return automaton
+
+    def id(self, variant):
+        """ Returns an identifier of the automaton of a variant (it changes when the automaton is rebuilt). """
+        self.get(variant)
+        return self.ids[variant]
+
+    def preload(self):
+        """ Loads automata of all variants available on disk (e.g. before forking worker processes sharing them). """
+        for variant in sorted(self.VARIANTS):
+            if self.exists(variant):
+                try:
+                    self.get(variant)
+                except AutomatonError as e:
+                    # the other variants stay usable, documents with this one fail
+                    module_logger.warning("%s", e, extra={"context": "AutomatonRegistry.preload"})
+
+automata = AutomatonRegistry(os.path.join(os.path.dirname(os.path.realpath(__file__)), "figa"))
 output = None
 
-def get_entities_from_figa(kb, input_string, input_string_in_unicode, lowercase, global_senses, register):
-    """ Returns the list of Entity objects from figa. """ # TODO: Možná by nebylo od věci toto zapouzdřit do třídy jako v "get_entities.py".
-    assert isinstance(kb, ner_knowledge_base.KnowledgeBaseCZ)
-    assert isinstance(input_string, str)
-    assert isinstance(input_string_in_unicode, unicode)
+def automaton_variant(lowercase):
+    """ Returns a variant of the automaton for input processed with or without the lowercase option. """
+    if lowercase:
+        return "lower"
+    else:
+        return "default"
+
+def load_automaton(lowercase):
+    """ Loads the figa automaton (the lowercase one if lowercase is True) unless it is already loaded. """
     assert isinstance(lowercase, bool)
-    assert isinstance(global_senses, set)
-    assert isinstance(register, EntityRegister)
 
-    global seek_names
-    global output
+    automata.get(automaton_variant(lowercase))
+
+def get_figa_matches(input_string, lowercase, variant=None):
+    """
+    Returns the list of FigaOutput tuples of all matches found by figa.
 
-    if not seek_names:
-        seek_names = figa.marker()
+    variant - a variant of the automaton (see AutomatonRegistry.VARIANTS), by default according to lowercase
+    """
+    assert isinstance(input_string, str)
+    assert isinstance(lowercase, bool)
 
-        lower = ""
-        if lowercase:
-            lower = "-lower"
+    global output
 
-        path_to_figa_dict = os.path.dirname(os.path.realpath(__file__)) + "/figa/automata" + lower
-        if os.path.isfile(path_to_figa_dict + ".dct"):
-            path_to_figa_dict += ".dct" # DARTS
-        else:
-            path_to_figa_dict += ".ct" # CEDAR
-        seek_names.load_dict(path_to_figa_dict)
+    if variant is None:
+        variant = automaton_variant(lowercase)
+    seek_names = automata.get(variant)
 
     # getting data from figa
     if lowercase:
@@ -1515,31 +1980,411 @@ def get_entities_from_figa(kb, input_string, input_string_in_unicode, lowercase,
     else:
         output = seek_names.lookup_string(input_string)
 
-    entities = []
-
-    # processing figa output and creating Entity objects
-    for line in parseFigaOutput(output):
-        e = Entity(line, kb, input_string, input_string_in_unicode, register)
-        global_senses.update(e.senses)
-        entities.append(e)
-
-    return entities
+    return list(parseFigaOutput(output))
+
+def split_paragraphs(input_string):
+    """ Returns a list of paragraphs of input_string (including their separators as offsets_of_paragraphs() finds them). """
+    starts = [0]
+    starts.extend(par_match.end() for par_match in PARAGRAPH_SEPARATOR.finditer(input_string))
+    starts.append(len(input_string))
+    return [input_string[start:end] for start, end in zip(starts, starts[1:]) if start < end]
+
+def get_cached_figa_matches(input_string, lowercase, variant, cache):
+    """ Returns the same list as get_figa_matches(), but figa looks up only paragraphs missing in the cache. """
+    assert isinstance(cache, RecognizeCache)
+
+    if variant is None:
+        variant = automaton_variant(lowercase)
+    automaton_id = automata.id(variant)
+
+    matches = []
+    offset = 0
+    for paragraph in split_paragraphs(input_string):
+        key = (hashlib.sha1(paragraph).digest(), automaton_id, lowercase)
+        paragraph_matches = cache.get("figa", key)
+        if paragraph_matches is None:
+            paragraph_matches = get_figa_matches(paragraph, lowercase, variant)
+            cache.put("figa", key, paragraph_matches)
+        # offsets of figa are relative to the paragraph
+        matches.extend(m._replace(start_offset=m.start_offset + offset, end_offset=m.end_offset + offset) for m in paragraph_matches)
+        offset += len(paragraph.decode("utf8", "replace"))
+    return matches
 
 def remove_shorter_entities(entities):
     """ Removing shorter entity from overlapping entities. """
-    assert isinstance(entities, list) # list of Entity
+    assert isinstance(entities, list) # list of Entity or FigaOutput
 
     # figa should always return the longest match first
-    entity_offsets = set()
+    entity_offsets = OffsetIntervals()
     new_entities = []
     for e in entities:
-        current_offset = set(range(e.start_offset, e.end_offset + 1))
-        if current_offset & entity_offsets == set():
-            entity_offsets.update(current_offset)
+        if not entity_offsets.overlaps(e.start_offset, e.end_offset):
+            entity_offsets.add(e.start_offset, e.end_offset)
             new_entities.append(e)
     return new_entities
 
-def recognize(kb, input_string, print_all=False, print_result=True, print_score=False, lowercase=False, remove=False, split_interval=True, find_names=False):
+class Deadline(object):
+    """ A time budget of recognize() for one document and stages skipped because it was exceeded. """
+
+    def __init__(self, seconds):
+        assert seconds > 0
+
+        self.seconds = seconds
+        self.end = time.time() + seconds
+        self.skipped_stages = []
+
+    def expired(self):
+        return time.time() >= self.end
+
+    def degrade(self, stage):
+        """ Records that a stage was skipped (or not finished) because of the exceeded budget. """
+        if stage not in self.skipped_stages:
+            self.skipped_stages.append(stage)
+
+    @property
+    def degraded(self):
+        return bool(self.skipped_stages)
+
+def new_deadline(time_budget):
+    """ Returns a Deadline of a document starting now or None if there is no time budget (in seconds). """
+    if time_budget is None:
+        return None
+    return Deadline(time_budget)
+
+
+class CachedEntity(object):
+    """ An entity or a date of a result stored in RecognizeCache (only its offsets and output are kept). """
+
+    __slots__ = ("start_offset", "end_offset", "output")
+
+    def __init__(self, start_offset, end_offset, output):
+        self.start_offset = start_offset
+        self.end_offset = end_offset
+        self.output = output
+
+    def __str__(self):
+        return self.output
+
+
+class RecognizeCache(object):
+    """
+    A bounded LRU cache of figa matches of paragraphs ("figa") and results of single-paragraph documents ("result"),
+    for documents repeating the same paragraphs. Results of documents with more paragraphs depend on the context
+    of all their paragraphs, so only their figa lookup is cached. A single-paragraph document does not depend on
+    documents recognized before it (each Context counts its own mentions), so its cached result equals a new one.
+    """
+
+    def __init__(self, kb, size=10000):
+        assert isinstance(kb, ner_knowledge_base.KnowledgeBaseCZ)
+        assert isinstance(size, int) and size > 0
+
+        self.kb_version = kb.version()
+        self.size = size
+        self.items = collections.OrderedDict()
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+
+    def get(self, kind, key):
+        """ Returns a cached value (or None) and marks it as recently used. """
+        try:
+            value = self.items.pop((kind, key))
+        except KeyError:
+            self.misses[kind] += 1
+            return None
+        self.hits[kind] += 1
+        self.items[(kind, key)] = value
+        return value
+
+    def put(self, kind, key, value):
+        """ Stores a value and evicts the least recently used one if the cache is full. """
+        self.items.pop((kind, key), None)
+        if len(self.items) >= self.size:
+            self.items.popitem(last=False)
+        self.items[(kind, key)] = value
+
+    def hit_rate(self, kind):
+        lookups = self.hits[kind] + self.misses[kind]
+        return float(self.hits[kind]) / lookups if lookups else 0.0
+
+    def __str__(self):
+        result = ["cache\titems\t%d\t%d" % (len(self.items), self.size)]
+        for kind in ["figa", "result"]:
+            result.append("cache %s\thits\t%d\tmisses\t%d\thit rate\t%.3f" % (kind, self.hits[kind], self.misses[kind], self.hit_rate(kind)))
+        return "\n".join(result)
+
+# the cache used by recognize() (None if disabled, see --cache)
+recognize_cache = None
+
+def result_cache_key(cache, input_string, print_all, print_score, lowercase, remove, split_interval, find_names, max_candidates, automaton):
+    """ Returns a key of the result of recognize() in RecognizeCache, or None if the result depends on a context of more paragraphs. """
+    if PARAGRAPH_SEPARATOR.search(input_string.strip()):
+        return None
+    if automaton is None:
+        automaton = automaton_variant(lowercase)
+    # scores are printed also after the first document with print_score in daemon mode
+    flags = (print_all, print_score or display_entity_score, lowercase, remove, split_interval, find_names, max_candidates)
+    return (hashlib.sha1(input_string).digest(), cache.kb_version, automata.id(automaton), flags)
+
+
+class ContextFreeResults(object):
+    """
+    Results of disambiguation without context of entities of one revision of a document keyed by everything they
+    depend on (see Entity.context_free_key()). Entities of the next revision with the same key reuse them.
+    """
+
+    def __init__(self, previous_results=None):
+        """ previous_results - results of the previous revision (ContextFreeResults.results) """
+        assert isinstance(previous_results, dict) or previous_results == None
+
+        self.previous_results = previous_results or {}
+        self.results = {}
+        # a number of entities with a reused result
+        self.reused = 0
+
+    def disambiguate(self, entity):
+        """ Disambiguates the entity without context unless an entity with the same key has already been disambiguated. """
+        assert isinstance(entity, Entity)
+
+        key = entity.context_free_key()
+        state = self.results.get(key)
+        if state is None:
+            state = self.previous_results.get(key)
+        if state is None:
+            entity.disambiguate_senses()
+            state = entity.context_free_state()
+        else:
+            entity.restore_context_free_state(state)
+            self.reused += 1
+        self.results[key] = state
+
+
+class ParagraphContextResults(object):
+    """
+    Results of disambiguation with context of paragraphs of one revision of a document. Context scores an entity only by
+    statistics of its own paragraph, so they depend only on the text of the paragraph and on its entities (after
+    disambiguation without context and pruning), dates and nationalities (see prepare()). A paragraph of the next
+    revision with the same key reuses the statistics and the disambiguation of its entities. Offsets in the key are
+    relative to the paragraph, so a paragraph moved by an edit before it is reused as well.
+    """
+
+    def __init__(self, previous_results=None):
+        """ previous_results - results of the previous revision (ParagraphContextResults.results) """
+        assert isinstance(previous_results, dict) or previous_results == None
+
+        self.previous_results = previous_results or {}
+        self.results = {}
+        # paragraphs of the document: (start offset, key, entities disambiguated with context, reused result or None)
+        self.paragraphs = []
+
+    @property
+    def reused(self):
+        """ A number of paragraphs with a reused result. """
+        return sum(1 for paragraph in self.paragraphs if paragraph[3] is not None)
+
+    def prepare(self, input_string_in_unicode, paragraphs, entities_and_dates, nationalities):
+        """
+        Computes keys of paragraphs starting at the offsets paragraphs and returns statistics of paragraphs with a result
+        in the previous revision keyed by their start offsets (see Context.restore_paragraph_state()).
+        """
+        ends = paragraphs[1:] + [len(input_string_in_unicode)]
+        items = [[] for par in paragraphs]
+        entities = [[] for par in paragraphs]
+        for e in entities_and_dates:
+            i = bisect.bisect_right(paragraphs, e.start_offset) - 1
+            start = paragraphs[i]
+            if isinstance(e, Entity):
+                items[i].append(("entity", e.start_offset - start, e.end_offset - start, e.is_coreference, e.context_free_state()))
+                # the same entities as disambiguate_with_context() disambiguates
+                if not e.is_coreference and e.candidates:
+                    entities[i].append(e)
+            else:
+                # the date without its offsets
+                items[i].append(("date", e.start_offset - start, e.end_offset - start, unicode(e).split(u"\t", 2)[2]))
+        for nat in nationalities:
+            i = bisect.bisect_right(paragraphs, nat.start_offset) - 1
+            items[i].append(("nationality", nat.start_offset - paragraphs[i], nat.source))
+
+        self.paragraphs = []
+        reused_paragraphs = {}
+        for start, end, paragraph_items, paragraph_entities in zip(paragraphs, ends, items, entities):
+            key = (input_string_in_unicode[start:end], tuple(paragraph_items))
+            result = self.previous_results.get(key)
+            self.paragraphs.append((start, key, paragraph_entities, result))
+            if result is not None:
+                reused_paragraphs[start] = result[0]
+        return reused_paragraphs
+
+    def restore(self):
+        """ Sets the disambiguation with context of entities of reused paragraphs. """
+        for start, key, entities, result in self.paragraphs:
+            if result is not None:
+                for e, state in zip(entities, result[1]):
+                    e.restore_context_state(state)
+
+    def store(self, context):
+        """ Stores results of all paragraphs (before fix_poor_disambiguation and coreferences change entities). """
+        assert isinstance(context, Context)
+
+        for start, key, entities, result in self.paragraphs:
+            if result is None:
+                result = (context.paragraph_state(start), [e.context_state() for e in entities])
+            self.results[key] = result
+
+
+class AnnotationSession(object):
+    """
+    A document recognized revision by revision (e.g. while a record is edited in a cataloguing interface). Figa matches
+    of unchanged paragraphs are taken from a cache, entities reuse their disambiguation without context from the last
+    revision (see ContextFreeResults) and unchanged paragraphs reuse their disambiguation with context (see
+    ParagraphContextResults). The stages depending on other paragraphs (fix_poor_disambiguation, coreferences, unknown
+    names) are computed over the whole document, so the result is the same as the result of recognize().
+    """
+
+    # a number of entries in the cache of figa matches of paragraphs of a session
+    CACHE_SIZE = 1000
+
+    def __init__(self, kb, **options):
+        """ options - keyword arguments of recognize() """
+        assert isinstance(kb, ner_knowledge_base.KnowledgeBaseCZ)
+
+        self.kb = kb
+        self.options = options
+        self.cache = RecognizeCache(kb, self.CACHE_SIZE)
+        # results of disambiguation without context of entities of the last revision
+        self.context_free_results = {}
+        # results of disambiguation with context of paragraphs of the last revision
+        self.paragraph_context_results = {}
+
+    def update(self, input_string, stats=None, deadline=None):
+        """ Returns entities and dates of a new revision of the document (the same as recognize() returns). """
+        assert isinstance(input_string, str)
+
+        context_free = ContextFreeResults(self.context_free_results)
+        paragraph_context = ParagraphContextResults(self.paragraph_context_results)
+        entities_and_dates = recognize(self.kb, input_string, print_result=False, stats=stats, cache=self.cache, deadline=deadline, context_free=context_free, paragraph_context=paragraph_context, **self.options)
+        # a result of a single-paragraph document taken from the cache has not disambiguated anything
+        if context_free.results:
+            self.context_free_results = context_free.results
+        # nor has a revision after the deadline
+        if paragraph_context.results:
+            self.paragraph_context_results = paragraph_context.results
+        return entities_and_dates
+
+
+class SessionRegistry(object):
+    """ Annotation sessions of documents identified by their ids (the least recently used sessions are closed). """
+
+    def __init__(self, kb, max_sessions=1000):
+        self.kb = kb
+        self.max_sessions = max_sessions
+        self.sessions = collections.OrderedDict()
+
+    def get(self, doc_id, **options):
+        """ Returns the session of a document (a new one if there is none or if it was created with other options). """
+        session = self.sessions.pop(doc_id, None)
+        if session is None or session.options != options:
+            if len(self.sessions) >= self.max_sessions:
+                self.sessions.popitem(last=False)
+            session = AnnotationSession(self.kb, **options)
+        self.sessions[doc_id] = session
+        return session
+
+    def close(self, doc_id):
+        self.sessions.pop(doc_id, None)
+
+
+class RecognizeStats(object):
+    """ Durations of stages of recognize() and counters for one document. """
+
+    def __init__(self, kb):
+        assert isinstance(kb, ner_knowledge_base.KnowledgeBaseCZ)
+
+        self.kb = kb
+        self.durations = collections.OrderedDict()
+        self.counters = collections.OrderedDict()
+        self.kb_lookups = kb.lookup_count
+        self.last_time = time.time()
+
+    def lap(self, stage):
+        """ Adds the time elapsed since the previous lap to the duration of the stage. """
+        now = time.time()
+        self.durations[stage] = self.durations.get(stage, 0.0) + now - self.last_time
+        self.last_time = now
+
+    def count(self, counter, value):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def finish(self):
+        """ Stores the number of KB lookups made since the creation of the stats. """
+        self.counters["KB lookups"] = self.kb.lookup_count - self.kb_lookups
+
+    def __str__(self):
+        lines = ["%s\t%.3f ms" % (stage, duration * 1000) for stage, duration in self.durations.iteritems()]
+        lines.append("total\t%.3f ms" % (sum(self.durations.itervalues()) * 1000))
+        lines.extend("%s\t%s" % (counter, value) for counter, value in self.counters.iteritems())
+        return "\n".join(lines)
+
+
+class RecognizeStatsSummary(object):
+    """ Percentiles of stage durations and counters over the last processed documents. """
+
+    def __init__(self, window=10000):
+        self.window = window
+        self.documents = 0
+        self.durations = collections.OrderedDict()
+        self.counters = collections.OrderedDict()
+
+    def add(self, stats):
+        assert isinstance(stats, RecognizeStats)
+
+        self.documents += 1
+        for values, new_values in ((self.durations, stats.durations), (self.counters, stats.counters)):
+            for name, value in new_values.iteritems():
+                if name not in values:
+                    values[name] = collections.deque(maxlen=self.window)
+                values[name].append(value)
+
+    def __str__(self):
+        lines = ["documents\t%s" % self.documents]
+        for stage, durations in self.durations.iteritems():
+            p50, p99 = numpy.percentile(durations, [50, 99]) * 1000
+            lines.append("%s\tp50=%.3f ms\tp99=%.3f ms" % (stage, p50, p99))
+        for counter, values in self.counters.iteritems():
+            p50, p99 = numpy.percentile(values, [50, 99])
+            lines.append("%s\tp50=%s\tp99=%s" % (counter, p50, p99))
+        if recognize_cache is not None:
+            lines.append(str(recognize_cache))
+        return "\n".join(lines)
+
+
+class EntityChangeTracer(object):
+    """ Reports differences in a list of entities between stages of recognize() as unified diffs (for debugging). """
+
+    def __init__(self, enabled=True):
+        """ enabled - if False, report() does nothing (the document is not traced) """
+        self.enabled = enabled
+        self.last_status = None
+
+    def report(self, entities, description=None):
+        """
+        Prints a diff of entities against their last reported status.
+
+        description - a description of the stage responsible for changes (defaults to the source line preceding the call)
+        """
+        if not self.enabled:
+            return
+
+        new_status = [str(e)+"\n" for e in sorted(entities, key=lambda ent: ent.start_offset)]
+        if self.last_status is not None:
+            diff = "".join(difflib.unified_diff(self.last_status, new_status, fromfile='before', tofile='after', n=0))[:-1]
+            if diff:
+                if description is None:
+                    description = debug.caller_source_line(line_offset=-1)
+                print_dbg_en(description, diff, delim="\n", stack_num=2)
+        self.last_status = new_status
+
+
+def recognize(kb, input_string, print_all=False, print_result=True, print_score=False, lowercase=False, remove=False, split_interval=True, find_names=False, max_candidates=None, stats=None, automaton=None, cache=None, deadline=None, context_free=None, paragraph_context=None):
     """
     Prints a list of entities found in input_string.
 
@@ -1550,6 +2395,14 @@ def recognize(kb, input_string, print_all=False, print_result=True, print_score=
     lowercase - the input string is lowercased
     remove - removes accent from the input string
     split_interval - split dates intervals in function dates.find_dates()
+    max_candidates - if set, only this number of candidates with the highest static score is disambiguated with context for each entity
+    stats - RecognizeStats filled with durations of stages and counters
+    automaton - a variant of the figa automaton (see AutomatonRegistry.VARIANTS), by default according to lowercase
+    cache - RecognizeCache for figa matches and results (recognize_cache by default)
+    deadline - Deadline of the document; when it expires, the remaining entities keep their disambiguation without context,
+               the stages depending on context and add_unknown_names are skipped and deadline.skipped_stages says so
+    context_free - ContextFreeResults reusing disambiguation without context of the previous revision of the document
+    paragraph_context - ParagraphContextResults reusing disambiguation with context of unchanged paragraphs of the previous revision
     """
     assert isinstance(kb, ner_knowledge_base.KnowledgeBaseCZ)
     assert isinstance(input_string, str)
@@ -1560,18 +2413,37 @@ def recognize(kb, input_string, print_all=False, print_result=True, print_score=
     assert isinstance(remove, bool)
     assert isinstance(split_interval, bool)
     assert isinstance(find_names, bool)
-
-    def debugChangesInEntities(entities, responsible_line):
-        if debug.DEBUG_EN:
-            global debug_last_status_of_entities
-            if "debug_last_status_of_entities" in globals():
-                new_status_of_entities = [e+"\n" for e in map(str, sorted(entities, key=lambda ent: ent.start_offset))]
-                diff = "".join(difflib.unified_diff(debug_last_status_of_entities, new_status_of_entities, fromfile='before', tofile='after', n=0))[:-1]
-                if diff:
-                    print_dbg_en(responsible_line, diff, delim="\n", stack_num=2)
-                debug_last_status_of_entities = new_status_of_entities
-            else:
-                debug_last_status_of_entities = [e+"\n" for e in map(str, sorted(entities, key=lambda ent: ent.start_offset))]
+    assert max_candidates == None or (isinstance(max_candidates, int) and max_candidates > 0)
+    assert isinstance(stats, RecognizeStats) or stats == None
+    assert automaton == None or automaton in AutomatonRegistry.VARIANTS
+    assert isinstance(cache, RecognizeCache) or cache == None
+    assert isinstance(deadline, Deadline) or deadline == None
+    assert isinstance(context_free, ContextFreeResults) or context_free == None
+    assert isinstance(paragraph_context, ParagraphContextResults) or paragraph_context == None
+
+    if stats is None:
+        stats = RecognizeStats(kb)
+
+    # reusing the result of the same single-paragraph document
+    if cache is None:
+        cache = recognize_cache
+    result_key = None
+    if cache is not None:
+        result_key = result_cache_key(cache, input_string, print_all, print_score, lowercase, remove, split_interval, find_names, max_candidates, automaton)
+        if result_key is not None:
+            entities_and_dates = cache.get("result", result_key)
+            if entities_and_dates is not None:
+                if print_score:
+                    global display_entity_score
+                    display_entity_score = True
+                if print_result:
+                    print(format_entities(entities_and_dates))
+                stats.lap("cached result")
+                stats.finish()
+                return entities_and_dates
+
+    # reporting changes in entities after each stage (only for sampled documents if debugging is enabled)
+    tracer = EntityChangeTracer(debug.sample())
 
     # replacing non-printable characters and semicolon with space characters
     input_string = re.sub("[;\x01-\x08\x0e-\x1f\x0c\x7f]", " ", input_string)
@@ -1583,20 +2455,26 @@ def recognize(kb, input_string, print_all=False, print_result=True, print_score=
 
     # creating entity register
     register = EntityRegister()
-    # a set of all possible senses
-    global_senses = set()
+    # sentence boundaries shared by all entities
+    sentence_index = SentenceIndex(input_string_in_unicode)
+    stats.lap("input preprocessing")
 
-    # getting entities from figa
-    figa_entities = get_entities_from_figa(kb, input_string, input_string_in_unicode, lowercase, global_senses, register)
-    debugChangesInEntities(figa_entities, linecache.getline(__file__, inspect.getlineno(inspect.currentframe())-1))
+    # getting matches from figa (entities are created after removing overlapping matches)
+    if cache is not None:
+        figa_matches = get_cached_figa_matches(input_string, lowercase, automaton, cache)
+    else:
+        figa_matches = get_figa_matches(input_string, lowercase, automaton)
+    stats.count("figa matches", len(figa_matches))
+    stats.lap("figa lookup")
 
-    # retaining only possible coreferences for each entity
-    for e in figa_entities:
-        e.partial_match_senses = e.partial_match_senses & global_senses
+    # a set of all possible senses (possible coreferences of each entity are restricted to them)
+    global_senses = IntSet(s for m in figa_matches for s in m.kb_rows if s != 0)
 
     # removing shorter entity from overlapping entities
-    figa_entities = remove_shorter_entities(figa_entities)
-    debugChangesInEntities(figa_entities, linecache.getline(__file__, inspect.getlineno(inspect.currentframe())-1))
+    figa_matches = remove_shorter_entities(figa_matches)
+    stats.lap("overlap removal")
+    figa_entities = [Entity(m, kb, input_string, input_string_in_unicode, register, sentence_index, global_senses) for m in figa_matches]
+    tracer.report(figa_entities)
 
     # removing entities without any sense
     nationalities = []
@@ -1607,16 +2485,16 @@ def recognize(kb, input_string, print_all=False, print_result=True, print_score=
         elif e.senses or e.partial_match_senses or e.source.lower() in PRONOUNS:
             entities.append(e)
 
-    debugChangesInEntities(entities, "removing entities without any sense")
+    tracer.report(entities, "removing entities without any sense")
+    stats.count("entities", len(entities))
+    stats.lap("Entity construction")
 
     # searches for dates and intervals in the input
     dates_and_intervals = dates.find_dates(input_string_in_unicode, split_interval=split_interval)
 
     # resolving overlapping dates and entities
-    entity_offsets = set()
-    for e in entities:
-        entity_offsets.update(set(range(e.start_offset, e.end_offset + 1)))
-    dates_and_intervals = [d for d in dates_and_intervals if set(range(d.start_offset, d.end_offset + 1)) & entity_offsets == set()]
+    entity_offsets = OffsetIntervals((e.start_offset, e.end_offset) for e in entities)
+    dates_and_intervals = [d for d in dates_and_intervals if not entity_offsets.overlaps(d.start_offset, d.end_offset)]
 
     # merges entities with dates
     entities_and_dates = []
@@ -1625,36 +2503,79 @@ def recognize(kb, input_string, print_all=False, print_result=True, print_score=
 
     # sorts entities and dates according to their start offsets
     entities_and_dates.sort(key=lambda ent : ent.start_offset)
+    stats.count("dates", len(dates_and_intervals))
+    stats.lap("dates")
 
     #for e in entities:
     #    for s in e.senses:
     #        print(e.kb.get_ent_type(s) + "  " + str(e.kb.get_data_for(s,'NAME')) + "  " + e.source)
 
     # disambiguates without context
-    [e.disambiguate_without_context() for e in entities]
-    debugChangesInEntities(entities, linecache.getline(__file__, inspect.getlineno(inspect.currentframe())-1))
-
-    paragraphs = offsets_of_paragraphs(input_string_in_unicode)
-    context = Context(entities_and_dates, kb, paragraphs, nationalities)
-
-    # disambiguates with context
-    [e.disambiguate_with_context(context) for e in entities]
-    debugChangesInEntities(entities, linecache.getline(__file__, inspect.getlineno(inspect.currentframe())-1))
-    fix_poor_disambiguation(entities, context)
-    debugChangesInEntities(entities, linecache.getline(__file__, inspect.getlineno(inspect.currentframe())-1))
-
-    #name_coreferences = [e for e in entities if e.source.lower() not in PRONOUNS]
-    #resolve_coreferences(name_coreferences, context, print_all, register) # Zde se ověřuje, zda-li části jmen jsou odkazy nebo samostatné entity.
-    resolve_coreferences(entities, context, print_all, register)
-    debugChangesInEntities(entities, linecache.getline(__file__, inspect.getlineno(inspect.currentframe())-1))
+    [e.disambiguate_without_context(context_free) for e in entities]
+    tracer.report(entities)
+    if context_free is not None:
+        stats.count("reused disambiguations", context_free.reused)
+    stats.count("candidates", sum(len(e.candidates) for e in entities))
+
+    # keeping only the best candidates for disambiguation with context
+    if max_candidates:
+        candidates_count = sum(len(e.candidates) for e in entities)
+        pruned = prune_candidates(entities, max_candidates)
+        stats.count("pruned candidates", pruned)
+        module_logger.info("Pruned %s of %s candidates (max. %s candidates per entity).", pruned, candidates_count, max_candidates, extra={"context": "recognize"})
+        tracer.report(entities, "keeping only the best candidates for disambiguation with context")
+    stats.lap("context-free disambiguation")
+
+    if deadline is not None and deadline.expired():
+        # only the disambiguation without context is left (coreferences stay unresolved)
+        deadline.degrade("Context construction")
+    else:
+        paragraphs = offsets_of_paragraphs(input_string_in_unicode)
+        reused_paragraphs = None
+        if paragraph_context is not None:
+            reused_paragraphs = paragraph_context.prepare(input_string_in_unicode, paragraphs, entities_and_dates, nationalities)
+            stats.count("reused paragraphs", len(reused_paragraphs))
+        context = Context(entities_and_dates, kb, paragraphs, nationalities, deadline, reused_paragraphs)
+        stats.lap("Context construction")
+
+    # an unfinished context is not used (see Context)
+    if deadline is None or not deadline.degraded:
+        # disambiguates with context
+        if paragraph_context is not None:
+            paragraph_context.restore()
+        for e in entities:
+            if e.begin_of_paragraph in context.reused_paragraphs:
+                continue
+            e.disambiguate_with_context(context, deadline)
+            if deadline is not None and deadline.degraded:
+                break
+        if paragraph_context is not None and (deadline is None or not deadline.degraded):
+            paragraph_context.store(context)
+        tracer.report(entities, "disambiguation with context")
+        stats.lap("context disambiguation")
+        fix_poor_disambiguation(entities, context)
+        tracer.report(entities)
+        stats.lap("fix_poor_disambiguation")
+
+        #name_coreferences = [e for e in entities if e.source.lower() not in PRONOUNS]
+        #resolve_coreferences(name_coreferences, context, print_all, register) # Zde se ověřuje, zda-li části jmen jsou odkazy nebo samostatné entity.
+        if deadline is not None and deadline.expired():
+            deadline.degrade("coreference resolution")
+        else:
+            resolve_coreferences(entities, context, print_all, register)
+            tracer.report(entities)
+            stats.lap("coreference resolution")
 
     # updating entities_and_dates
     entities_and_dates = [e for e in entities_and_dates if isinstance(e, dates.Date) or e in entities]
-    debugChangesInEntities(entities_and_dates, "updating entities_and_dates")
+    tracer.report(entities_and_dates, "updating entities_and_dates")
 
     # finding unknown names
-    if find_names:
+    if find_names and deadline is not None and (deadline.degraded or deadline.expired()):
+        deadline.degrade("add_unknown_names")
+    elif find_names:
         add_unknown_names(kb, entities_and_dates, input_string, input_string_in_unicode, register)
+        stats.lap("add_unknown_names")
 
     # omitting entities without a sense
     if entities_and_dates:
@@ -1666,18 +2587,437 @@ def recognize(kb, input_string, print_all=False, print_result=True, print_score=
                     if isinstance(e, Entity):
                         e.set_preferred_sense(None)
             entities_and_dates = [e for e in entities_and_dates if isinstance(e, dates.Date) or (e.is_coreference and e.partial_match_senses) or (not e.is_coreference and e.senses) or e.is_name]
-    debugChangesInEntities(entities_and_dates, "omitting entities without a sense")
+    tracer.report(entities_and_dates, "omitting entities without a sense")
 
     if print_score:
-        global display_entity_score
         display_entity_score = True
 
+    if deadline is not None:
+        stats.count("degraded documents", int(deadline.degraded))
+        if deadline.degraded:
+            module_logger.warning("Time budget of %s s exceeded, skipped: %s.", deadline.seconds, ", ".join(deadline.skipped_stages), extra={"context": "recognize"})
+            # the result is not complete
+            result_key = None
+
+    if result_key is not None:
+        cache.put("result", result_key, [CachedEntity(e.start_offset, e.end_offset, str(e)) for e in entities_and_dates])
+
     if print_result:
-        print("\n".join(map(str, entities_and_dates)))
+        print(format_entities(entities_and_dates))
+    stats.lap("output")
+    stats.finish()
 
     return entities_and_dates
 
 
+def format_entities(entities_and_dates):
+    """ Returns the output of recognize() for a list of entities and dates (one per line). """
+    return "\n".join(map(str, entities_and_dates))
+
+
+def entity_to_json(output_line, print_score):
+    """ Converts a line of the output of recognize() into a dictionary (for output in JSON). """
+    columns = output_line.split("\t")
+    start_offset, end_offset, entity_type = columns[:3]
+    other = columns[-1]
+    result = {
+        "start_offset": int(start_offset),
+        "end_offset": int(end_offset),
+        "type": entity_type,
+        "text": "\t".join(columns[3:-1]).decode("utf-8"),
+    }
+    if entity_type == "date":
+        result["value"] = other
+    elif entity_type == "interval":
+        result["value"] = other.split(" -- ")
+    elif print_score:
+        result["candidates"] = []
+        for candidate in other.split(";"):
+            if candidate:
+                sense, _, score = candidate.partition(" ")
+                result["candidates"].append({"sense": int(sense), "score": float(score) if score else None})
+    else:
+        result["senses"] = [int(sense) for sense in other.split(";") if sense]
+    return result
+
+def iter_batch_documents(path):
+    """
+    Yields pairs of an id and a text of documents for batch mode. The path is either a directory (ids are relative
+    paths of its files in sorted order) or a file in JSON lines with objects {"id": ..., "text": ...}. Texts are
+    stripped of surrounding whitespace in both cases (as an input file is), so offsets do not depend on the format.
+    """
+    if os.path.isdir(path):
+        file_names = []
+        for directory, subdirectories, files in os.walk(path):
+            subdirectories.sort()
+            file_names.extend(os.path.join(directory, f) for f in sorted(files))
+        for file_name in file_names:
+            with open(file_name) as f:
+                yield os.path.relpath(file_name, path), f.read().strip()
+    else:
+        with open(path) as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if not isinstance(record, dict) or "id" not in record or not isinstance(record.get("text"), basestring):
+                    raise ValueError("Line %s of \"%s\" is not an object with \"id\" and \"text\"." % (line_number, path))
+                text = record["text"]
+                if isinstance(text, unicode):
+                    text = text.encode("utf-8")
+                yield record["id"], text.strip()
+
+# the knowledge base used by worker processes of batch mode, ner_daemon.py and ner_server.py (set before they are forked)
+worker_kb = None
+
+def init_worker():
+    """ Initializes a worker process (interrupts are handled by the main process). """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def create_worker_pool(kb, workers):
+    """ Loads all figa automata and forks worker processes sharing them and the started knowledge base (copy-on-write). """
+    global worker_kb
+
+    worker_kb = kb
+    automata.preload()
+    return multiprocessing.Pool(workers, init_worker)
+
+def recognize_document(input_string, time_budget=None, **options):
+    """
+    Recognizes a document in a worker process (see create_worker_pool()) and returns a tuple (entities and dates,
+    Deadline or None).
+
+    time_budget - seconds for the document (see Deadline)
+    options - keyword arguments of recognize()
+    """
+    global display_entity_score
+
+    deadline = new_deadline(time_budget)
+    # each document decides about printing scores on its own
+    display_entity_score = False
+    return recognize(worker_kb, input_string, print_result=False, deadline=deadline, **options), deadline
+
+def document_result(doc_id, input_string, time_budget=None, **options):
+    """
+    Recognizes a document in a worker process and returns its result for output in JSON, {"id": ..., "entities": [...]}
+    (with skipped stages in "degraded" if the time budget was exceeded) or {"id": ..., "error": ...}.
+    """
+    try:
+        entities_and_dates, deadline = recognize_document(input_string, time_budget, **options)
+        print_score = options.get("print_score", False)
+        result = {"id": doc_id, "entities": [entity_to_json(line, print_score) for line in map(str, entities_and_dates)]}
+        if deadline is not None and deadline.degraded:
+            result["degraded"] = deadline.skipped_stages
+    except Exception as e:
+        result = {"id": doc_id, "error": "%s: %s" % (type(e).__name__, e)}
+    return result
+
+def process_batch_document(job):
+    """ Returns a result of a document in batch mode, a process id of the worker and a time spent on the document. """
+    doc_id, input_string, options, time_budget = job
+
+    start = time.time()
+    result = document_result(doc_id, input_string, time_budget, **options)
+    return result, os.getpid(), time.time() - start
+
+def run_batch(kb, documents, output, workers, time_budget=None, **options):
+    """
+    Recognizes documents (pairs of an id and a text) by worker processes sharing the knowledge base and the figa
+    automata and writes results in JSON lines to the output in the order of the documents. Returns a report with
+    a number of documents per second and a utilisation of each worker.
+
+    time_budget - seconds for each document (a result of a degraded document contains skipped stages, see Deadline)
+    options - keyword arguments of recognize()
+    """
+    pool = create_worker_pool(kb, workers)
+
+    # a bounded number of documents is in progress, results are written in order
+    max_pending = 64 * workers
+    pending = collections.deque()
+    busy_time = collections.Counter()
+    count = 0
+
+    def write_result(async_result):
+        result, pid, duration = async_result.get()
+        busy_time[pid] += duration
+        output.write(json.dumps(result) + "\n")
+
+    start = time.time()
+    try:
+        for doc_id, input_string in documents:
+            pending.append(pool.apply_async(process_batch_document, [(doc_id, input_string, options, time_budget)]))
+            count += 1
+            if len(pending) >= max_pending:
+                write_result(pending.popleft())
+        while pending:
+            write_result(pending.popleft())
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    elapsed = time.time() - start
+
+    report = ["documents: %d" % count, "time [s]: %.3f" % elapsed, "documents/s: %.1f" % (count / elapsed if elapsed else 0.0)]
+    for i, pid in enumerate(sorted(busy_time), 1):
+        report.append("worker %d (pid %d) utilisation: %.1f %%" % (i, pid, 100 * busy_time[pid] / elapsed if elapsed else 0.0))
+    return "\n".join(report)
+
+def iter_paragraphs(stream, chunk_size=1024*1024):
+    """
+    Yields paragraphs (in Unicode, including their separators) of the UTF-8 text read from a stream by chunks.
+    The paragraphs are the same as offsets_of_paragraphs() finds in the whole text with leading and trailing white space
+    stripped (as str.strip() strips it in non-streaming mode).
+    """
+    whitespace = u" \t\n\r\x0b\x0c"
+    decoder = codecs.getincrementaldecoder("utf8")("replace")
+    buffer = u""
+    stripped = False
+    # the last paragraph and white space paragraphs after it are yielded only when it is known that the text goes on
+    pending = []
+    while True:
+        chunk = stream.read(chunk_size)
+        buffer += decoder.decode(chunk, final=not chunk)
+        if not stripped:
+            buffer = buffer.lstrip(whitespace)
+            stripped = bool(buffer)
+
+        start = 0
+        for par_match in PARAGRAPH_SEPARATOR.finditer(buffer):
+            # a separator near the end of the buffer may continue in the next chunk (a line break has up to 2 characters)
+            if par_match.end() + 2 > len(buffer) and chunk:
+                break
+            paragraph = buffer[start:par_match.end()]
+            if paragraph.strip(whitespace):
+                for pending_paragraph in pending:
+                    yield pending_paragraph
+                pending = []
+            pending.append(paragraph)
+            start = par_match.end()
+        buffer = buffer[start:]
+
+        if not chunk:
+            # the rest contains no separator, so it is either the last paragraph or trailing white space
+            if buffer.strip(whitespace):
+                for pending_paragraph in pending:
+                    yield pending_paragraph
+                yield buffer.rstrip(whitespace)
+            elif pending:
+                yield u"".join(pending).rstrip(whitespace)
+            return
+
+def recognize_stream(kb, stream, window_paragraphs=20, context_paragraphs=5, time_budget=None, **options):
+    """
+    Yields output lines of recognize() for a text read from a stream paragraph by paragraph, so memory stays bounded
+    regardless of the length of the text. Offsets in the output are relative to the whole text.
+
+    window_paragraphs - a number of new paragraphs recognized at once
+    context_paragraphs - a number of preceding (already recognized) paragraphs added to a window as its context
+    time_budget - seconds for each window (see Deadline)
+    options - other keyword arguments of recognize()
+    """
+    assert isinstance(window_paragraphs, int) and window_paragraphs > 0
+    assert isinstance(context_paragraphs, int) and context_paragraphs >= 0
+
+    # preceding paragraphs and the offset of the first of them in the whole text
+    context = collections.deque()
+    context_offset = 0
+    window = []
+
+    def recognize_window():
+        context_text = u"".join(context)
+        window_text = context_text + u"".join(window)
+        entities_and_dates = recognize(kb, window_text.encode("utf-8"), print_result=False, deadline=new_deadline(time_budget), **options)
+        for e in entities_and_dates:
+            # entities in the context were already yielded by the previous window
+            if e.start_offset >= len(context_text):
+                start_offset, end_offset, rest = str(e).split("\t", 2)
+                yield "%d\t%d\t%s" % (int(start_offset) + context_offset, int(end_offset) + context_offset, rest)
+
+    for paragraph in iter_paragraphs(stream):
+        window.append(paragraph)
+        if len(window) == window_paragraphs:
+            for line in recognize_window():
+                yield line
+            context.extend(window)
+            while len(context) > context_paragraphs:
+                context_offset += len(context.popleft())
+            window = []
+    if window:
+        for line in recognize_window():
+            yield line
+
+
+# allowed tokens for daemon mode
+DAEMON_TOKENS = set(["NER_NEW_FILE", "NER_END", "NER_NEW_FILE_ALL", "NER_END_ALL", "NER_NEW_FILE_SCORE", "NER_END_SCORE", "NER_NEW_FILE_NAMES", "NER_END_NAMES"])
+
+def daemon_token_options(token):
+    """ Returns keyword arguments of recognize() for a document terminated by a token of daemon mode. """
+    assert token in DAEMON_TOKENS
+
+    if "ALL" in token:
+        return {"print_all": True}
+    elif "SCORE" in token:
+        return {"print_score": True}
+    elif "NAMES" in token:
+        return {"find_names": True}
+    else:
+        return {}
+
+
+# options of a frame header in framed daemon mode and corresponding arguments of recognize()
+FRAME_OPTIONS = {
+    "all": {"print_all": True},
+    "score": {"print_score": True},
+    "names": {"find_names": True},
+    "lowercase": {"lowercase": True},
+    "remove-accent": {"remove": True},
+}
+for variant in AutomatonRegistry.VARIANTS:
+    FRAME_OPTIONS["automaton=" + variant] = {"automaton": variant}
+
+def read_frame_header(stream):
+    """ Returns a length of the payload and a list of options from a frame header, or None at the end of the stream. """
+    header = stream.readline()
+    if not header:
+        return None
+    fields = header.split()
+    if not fields or not fields[0].isdigit():
+        raise ValueError("Invalid frame header %r." % header)
+    return int(fields[0]), fields[1:]
+
+def read_frame_payload(stream, length):
+    """ Reads a payload of a frame into a preallocated buffer (in bulk) and returns it. """
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    received = 0
+    while received < length:
+        count = stream.readinto(view[received:])
+        if not count:
+            raise EOFError("A frame is shorter than its header says (%s of %s bytes)." % (received, length))
+        received += count
+    return str(buffer)
+
+def write_frame(stream, payload, flags=()):
+    """ Writes a payload with a header containing its length (and flags). """
+    stream.write(" ".join(["%d" % len(payload)] + list(flags)) + "\n")
+    stream.write(payload)
+    stream.flush()
+
+def parse_frame_options(options, recognize_options, time_budget):
+    """
+    Updates recognize_options by options of a frame header and returns a tuple (id of a session or None, time budget).
+    Raises ValueError for an unknown option or an invalid budget.
+    """
+    session_id = None
+    for option in options:
+        if option.startswith("budget="):
+            try:
+                time_budget = float(option[len("budget="):])
+            except ValueError:
+                time_budget = None
+            if not time_budget > 0:
+                raise ValueError("A budget in a frame header has to be a positive number (\"%s\")." % option)
+        elif option.startswith("session="):
+            session_id = option[len("session="):]
+        elif option == "end-session":
+            pass
+        elif option in FRAME_OPTIONS:
+            recognize_options.update(FRAME_OPTIONS[option])
+        else:
+            raise ValueError("Unknown option \"%s\" in a frame header." % option)
+    return session_id, time_budget
+
+def run_framed_daemon(kb, arguments, stdin=None, stdout=None):
+    """
+    Daemon mode with length-prefixed frames. The text of a document may contain anything (including tokens of daemon mode).
+
+    A request consists of a header line "<length> [option ...]" and the document of exactly <length> bytes in UTF-8.
+    Options are "all", "score" and "names" (as the tokens NER_NEW_FILE_ALL, ...), "lowercase", "remove-accent",
+    "automaton=<variant>" (see AutomatonRegistry.VARIANTS) or "stats" (the response contains percentiles of durations
+    of stages instead of entities). Options of the command line apply to all documents.
+
+    The option "session=<id>" marks the document as a new revision of the document with the id; figa lookup and
+    disambiguation without context of its unchanged paragraphs are reused (see AnnotationSession). The option
+    "end-session" closes the session after the document is processed.
+
+    The option "budget=<seconds>" sets a time budget of the document instead of --time-budget (see Deadline).
+
+    The response has a header line "<length>" (followed by the flag "degraded" if the time budget was exceeded) and
+    the output of exactly <length> bytes. An invalid option or a failure of recognition gets a response with the flag
+    "error" and the error message as its output; the daemon goes on with the next frame. After an invalid header or
+    a payload shorter than its header says, the frames cannot be found in the rest of the input, so the daemon answers
+    with an "error" frame and ends. The daemon also ends at the end of input.
+
+    stdin, stdout - binary streams of requests and responses (the standard input and output by default)
+    """
+    global display_entity_score
+
+    if stdin is None:
+        stdin = io.open(sys.stdin.fileno(), "rb", closefd=False)
+    if stdout is None:
+        stdout = io.open(sys.stdout.fileno(), "wb", closefd=False)
+    stats_summary = RecognizeStatsSummary()
+    sessions = SessionRegistry(kb)
+    while True:
+        try:
+            header = read_frame_header(stdin)
+            if header is None:
+                break
+            length, options = header
+            input_string = read_frame_payload(stdin, length)
+        except (ValueError, EOFError) as e:
+            # the payload would be read as headers of the next frames
+            write_frame(stdout, str(e), ["error"])
+            break
+
+        if "stats" in options:
+            write_frame(stdout, str(stats_summary))
+            continue
+
+        recognize_options = {"lowercase": arguments.lowercase, "remove": arguments.remove_accent, "automaton": arguments.automaton, "max_candidates": arguments.max_candidates}
+        try:
+            session_id, time_budget = parse_frame_options(options, recognize_options, arguments.time_budget)
+        except ValueError as e:
+            write_frame(stdout, str(e), ["error"])
+            continue
+
+        # each document decides about printing scores on its own
+        display_entity_score = False
+        stats = RecognizeStats(kb)
+        deadline = new_deadline(time_budget)
+        try:
+            if session_id is not None:
+                # a failed revision keeps the results of the last revision in the session
+                entities_and_dates = sessions.get(session_id, **recognize_options).update(input_string, stats, deadline)
+            else:
+                entities_and_dates = recognize(kb, input_string, print_result=False, stats=stats, deadline=deadline, **recognize_options)
+        except Exception as e:
+            write_frame(stdout, "%s: %s" % (type(e).__name__, e), ["error"])
+            continue
+        finally:
+            if session_id is not None and "end-session" in options:
+                sessions.close(session_id)
+        stats.finish()
+        write_frame(stdout, format_entities(entities_and_dates), ["degraded"] if deadline is not None and deadline.degraded else [])
+        stats_summary.add(stats)
+        if arguments.stats:
+            sys.stderr.write("%s\n" % stats)
+
+
+def connect_kb(own_kb_daemon=False):
+    """ Returns the knowledge base (not started yet) connected either to the shared KB daemon or to its own one. """
+    if own_kb_daemon:
+        kb_daemon_run = True
+        while kb_daemon_run:
+            kb_shm_name = "/decipherKB-CZ-daemon_shm-%s" % uuid.uuid4()
+            kb = ner_knowledge_base.KnowledgeBaseCZ(kb_shm_name=kb_shm_name)
+            kb_daemon_run = kb.check()
+    else:
+        kb_shm_name = "/decipherKB-CZ-daemon_shm-999"
+        kb = ner_knowledge_base.KnowledgeBaseCZ(kb_shm_name=kb_shm_name)
+    return kb
+
+
 def main():
     # argument parsing
     parser = argparse.ArgumentParser()
@@ -1685,56 +3025,112 @@ def main():
     group.add_argument('-a', '--all', action='store_true', default=False, dest='all', help='Prints all entities without disambiguation.')
     group.add_argument('-s', '--score', action='store_true', default=False, dest='score', help='Prints all possible senses with respective score values.')
     parser.add_argument('-d', '--daemon-mode', action='store_true', default=False, help='Runs ner.py in daemon mode.')
+    parser.add_argument('--batch', metavar='PATH', help='Recognizes all files of a directory or records {"id": ..., "text": ...} of a file in JSON lines in parallel and writes results in JSON lines in the same order.')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), metavar='N', help='A number of worker processes with --batch (default: a number of CPUs).')
+    parser.add_argument('-o', '--output', help='Writes results of --batch to a given file instead of stdout.')
+    parser.add_argument('--stream', action='store_true', default=False, help='Recognizes the input by windows of paragraphs and prints results incrementally (memory does not grow with the length of the input).')
+    parser.add_argument('--stream-window', type=int, default=20, metavar='N', help='A number of paragraphs recognized at once with --stream (default: 20).')
+    parser.add_argument('--stream-context', type=int, default=5, metavar='N', help='A number of preceding paragraphs used as a context of a window with --stream (default: 5).')
+    parser.add_argument('--framed', action='store_true', default=False, help='Uses length-prefixed frames instead of tokens in daemon mode (see run_framed_daemon()).')
     parser.add_argument('-f', '--file',  help='Uses a given file as as an input.')
     parser.add_argument('-r', '--remove-accent', action='store_true', default=False, help="Removes accent in input.")
     parser.add_argument('-l', '--lowercase', action='store_true', default=False, help="Changes all characters in input to the lowercase characters.")
     parser.add_argument('-n', '--names', action='store_true', default=False, help="Recognizes and prints all names with start and end offsets.")
+    parser.add_argument('--automaton', choices=sorted(AutomatonRegistry.VARIANTS), help="A variant of the figa automaton (by default according to --lowercase).")
     parser.add_argument("--own_kb_daemon", action="store_true", dest="own_kb_daemon", help=("Run own KB daemon although another already running."))
     parser.add_argument("--debug", action="store_true", help="Enable debugging reports.")
+    parser.add_argument("--debug-sample", type=int, default=1, metavar="N", help="Enables debugging reports only for every N-th document (with --debug).")
+    parser.add_argument("--stats", action="store_true", default=False, help="Prints durations of stages and counters of each document to stderr (in daemon mode, percentiles over processed documents are printed to stdout for the NER_STATS token).")
+    parser.add_argument("--max-candidates", type=int, metavar="K", help="Disambiguates with context only K candidates with the highest static score of each entity (a number of pruned candidates is reported on stderr).")
+    parser.add_argument("--time-budget", type=float, metavar="SECONDS", help="A time budget of each document; when it is exceeded, the remaining entities keep their disambiguation without context, later stages are skipped and a warning is printed to stderr.")
+    parser.add_argument("--cache", type=int, default=0, metavar="N", help="Caches figa matches of up to N paragraphs and results of single-paragraph documents (hit rates are printed with --stats or for the NER_STATS token).")
 
     arguments = parser.parse_args()
+
+    if arguments.max_candidates is not None:
+        if arguments.max_candidates < 1:
+            parser.error("argument --max-candidates: must be a positive number")
+        module_logger.setLevel(logging.INFO)
     
+    if arguments.time_budget is not None and arguments.time_budget <= 0:
+        parser.error("argument --time-budget: must be a positive number")
+    if arguments.cache < 0:
+        parser.error("argument --cache: must not be a negative number")
+    if arguments.workers < 1:
+        parser.error("argument --workers: must be a positive number")
+    if arguments.stream_window < 1:
+        parser.error("argument --stream-window: must be a positive number")
+    if arguments.stream_context < 0:
+        parser.error("argument --stream-context: must not be a negative number")
+
     if not debug.DEBUG_EN and arguments.debug:
         debug.DEBUG_EN = True
+    if arguments.debug_sample < 1:
+        parser.error("argument --debug-sample: must be a positive number")
+    debug.DEBUG_SAMPLE = arguments.debug_sample
     
-    # allowed tokens for daemon mode
-    tokens = set(["NER_NEW_FILE", "NER_END", "NER_NEW_FILE_ALL", "NER_END_ALL", "NER_NEW_FILE_SCORE", "NER_END_SCORE", "NER_NEW_FILE_NAMES", "NER_END_NAMES"])
-
     # loading knowledge base
-    if arguments.own_kb_daemon:
-        kb_daemon_run = True
-        while kb_daemon_run:
-            kb_shm_name = "/decipherKB-CZ-daemon_shm-%s" % uuid.uuid4()
-            kb = ner_knowledge_base.KnowledgeBaseCZ(kb_shm_name=kb_shm_name)
-            kb_daemon_run = kb.check()
-    else:
-        kb_shm_name = "/decipherKB-CZ-daemon_shm-999"
-        kb = ner_knowledge_base.KnowledgeBaseCZ(kb_shm_name=kb_shm_name)
+    kb = connect_kb(arguments.own_kb_daemon)
 
     try:
         kb.start()
         kb.initName_dict()
+        kb.initFeatures()
 
-        if arguments.daemon_mode:
-            input_string = ""
+        if arguments.cache:
+            global recognize_cache
+            recognize_cache = RecognizeCache(kb, arguments.cache)
+
+        if arguments.daemon_mode and arguments.framed:
+            run_framed_daemon(kb, arguments)
+        elif arguments.daemon_mode:
+            stats_summary = RecognizeStatsSummary()
+            input_lines = []
             while True:
                 line = sys.stdin.readline().rstrip()
-                if line in tokens:
-                    if "ALL" in line:
-                        recognize(kb, input_string, print_all=True, lowercase=arguments.lowercase, remove=arguments.remove_accent)
-                    elif "SCORE" in line:
-                        recognize(kb, input_string, print_score=True, lowercase=arguments.lowercase, remove=arguments.remove_accent)
-                    elif "NAMES" in line:
-                        recognize(kb, input_string, find_names=True, lowercase=arguments.lowercase, remove=arguments.remove_accent)
-                    else:
-                        recognize(kb, input_string, print_all=False, lowercase=arguments.lowercase, remove=arguments.remove_accent)
+                if line == "NER_STATS":
+                    # percentiles of durations of stages over processed documents
+                    print(stats_summary)
                     print(line)
                     sys.stdout.flush()
-                    input_string = ""
+                elif line in DAEMON_TOKENS:
+                    input_string = "".join(input_lines)
+                    stats = RecognizeStats(kb)
+                    recognize(kb, input_string, lowercase=arguments.lowercase, remove=arguments.remove_accent, max_candidates=arguments.max_candidates, stats=stats, automaton=arguments.automaton, deadline=new_deadline(arguments.time_budget), **daemon_token_options(line))
+                    print(line)
+                    sys.stdout.flush()
+                    stats_summary.add(stats)
+                    if arguments.stats:
+                        sys.stderr.write("%s\n" % stats)
+                    input_lines = []
                     if "END" in line:
                         break
                 else:
-                    input_string += line + "\n"
+                    input_lines.append(line + "\n")
+        elif arguments.batch:
+            # recognizing documents of a directory or JSON lines in parallel
+            if arguments.output:
+                output = open(arguments.output, "w")
+            else:
+                output = sys.stdout
+            try:
+                report = run_batch(kb, iter_batch_documents(arguments.batch), output, arguments.workers, arguments.time_budget, print_all=arguments.all, print_score=arguments.score, lowercase=arguments.lowercase, remove=arguments.remove_accent, find_names=arguments.names, max_candidates=arguments.max_candidates, automaton=arguments.automaton)
+            finally:
+                if arguments.output:
+                    output.close()
+            sys.stderr.write("%s\n" % report)
+        elif arguments.stream:
+            # recognizing input data by windows of paragraphs
+            if arguments.file:
+                stream = io.open(arguments.file, "rb")
+            else:
+                stream = io.open(sys.stdin.fileno(), "rb", closefd=False)
+            with stream:
+                for line in recognize_stream(kb, stream, arguments.stream_window, arguments.stream_context, arguments.time_budget, print_all=arguments.all, print_score=arguments.score, lowercase=arguments.lowercase, remove=arguments.remove_accent, find_names=arguments.names, max_candidates=arguments.max_candidates, automaton=arguments.automaton):
+                    print(line)
+                    sys.stdout.flush()
+            if arguments.stats and recognize_cache is not None:
+                sys.stderr.write("%s\n" % recognize_cache)
         else:
             # reading input data from file
             if arguments.file:
@@ -1744,7 +3140,10 @@ def main():
             else:
                 input_string = sys.stdin.read()
             input_string = input_string.strip()
-            recognize(kb, input_string, print_all=arguments.all, print_score=arguments.score, lowercase=arguments.lowercase, remove=arguments.remove_accent, find_names=arguments.names)
+            stats = RecognizeStats(kb)
+            recognize(kb, input_string, print_all=arguments.all, print_score=arguments.score, lowercase=arguments.lowercase, remove=arguments.remove_accent, find_names=arguments.names, max_candidates=arguments.max_candidates, stats=stats, automaton=arguments.automaton, deadline=new_deadline(arguments.time_budget))
+            if arguments.stats:
+                sys.stderr.write("%s\n" % stats)
     finally:
         kb.end()
 
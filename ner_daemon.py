@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set tabstop=4 softtabstop=4 expandtab shiftwidth=4
+
+# Daemon ner_cz.py obsluhující klienty přes unixový socket pomocí skupiny
+# pracovních procesů. KB ve sdílené paměti, automaty figy i name_dict se
+# načtou jen jednou v hlavním procesu a pracovní procesy je po fork() sdílejí
+# (copy-on-write), takže paměť se s počtem procesů nenásobí.
+#
+# Protokol je stejný jako u "ner_cz.py --daemon-mode": klient posílá řádky
+# dokumentu ukončené tokenem (NER_NEW_FILE, NER_END, NER_NEW_FILE_ALL, ...)
+# a pro každý dokument dostane výstup ner_cz.py následovaný tímto tokenem.
+# Dokumenty jednoho spojení se zpracovávají paralelně, odpovědi se ale vrací
+# v pořadí, v jakém dokumenty přišly. Token NER_END* ukončí spojení.
+#
+# Příklad:
+#     ./ner_daemon.py --socket /tmp/ner_cz.sock --workers 8 &
+#     (cat dokument.txt; echo NER_END) | socat - UNIX-CONNECT:/tmp/ner_cz.sock
+
+import sys
+import os
+import argparse
+import threading
+import Queue
+import SocketServer
+import multiprocessing
+import ner_cz
+
+def create_pool(started_kb, workers):
+    """ Loads everything shared by worker processes (name_dict, features of KB and all figa automata) and forks them. """
+    started_kb.initName_dict()
+    started_kb.initFeatures()
+    return ner_cz.create_worker_pool(started_kb, workers)
+
+def process_document(job):
+    """ Returns the output of ner_cz.py for a document. It is called in a worker process. """
+    input_string, options = job
+    entities_and_dates = ner_cz.recognize_document(input_string, **options)[0]
+    return ner_cz.format_entities(entities_and_dates)
+
+
+class DaemonRequestHandler(SocketServer.StreamRequestHandler):
+    """ Reads documents of one connection and writes their results in the same order. """
+
+    def handle(self):
+        # results of submitted documents in order of their arrival (None terminates the writer)
+        results = Queue.Queue()
+        writer = threading.Thread(target=self.write_results, args=(results,))
+        writer.start()
+
+        try:
+            lines = []
+            for line in self.rfile:
+                line = line.rstrip()
+                if line in ner_cz.DAEMON_TOKENS:
+                    options = dict(self.server.options, **ner_cz.daemon_token_options(line))
+                    input_string = "".join(lines)
+                    results.put((self.server.pool.apply_async(process_document, [(input_string, options)]), line))
+                    lines = []
+                    if "END" in line:
+                        break
+                else:
+                    lines.append(line + "\n")
+        finally:
+            results.put(None)
+            writer.join()
+
+    def write_results(self, results):
+        while True:
+            item = results.get()
+            if item is None:
+                break
+            result, token = item
+            try:
+                try:
+                    self.wfile.write(result.get() + "\n")
+                except Exception as e:
+                    sys.stderr.write("ERROR: %s\n" % e)
+                    # the client gets an error line instead of the output of the document
+                    self.wfile.write("ERROR: %s\n" % e)
+                finally:
+                    # the token is written even after an error, otherwise the client would wait for it forever
+                    self.wfile.write(token + "\n")
+                    self.wfile.flush()
+            except Exception as e:
+                sys.stderr.write("ERROR: %s\n" % e)
+
+
+class DaemonServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """ Accepts connections on a unix socket and dispatches their documents to a pool of worker processes. """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, pool, options):
+        SocketServer.UnixStreamServer.__init__(self, socket_path, DaemonRequestHandler)
+        self.pool = pool
+        self.options = options
+
+
+def main():
+    # argument parsing
+    parser = argparse.ArgumentParser(description="Runs ner_cz.py in daemon mode with a pool of worker processes serving clients on a unix socket.")
+    parser.add_argument("-S", "--socket", required=True, help="A path of the unix socket.")
+    parser.add_argument("-w", "--workers", type=int, default=multiprocessing.cpu_count(), help="A number of worker processes (default: a number of CPUs).")
+    parser.add_argument("-r", "--remove-accent", action="store_true", default=False, help="Removes accent in input.")
+    parser.add_argument("-l", "--lowercase", action="store_true", default=False, help="Changes all characters in input to the lowercase characters.")
+    parser.add_argument("--own_kb_daemon", action="store_true", dest="own_kb_daemon", help=("Run own KB daemon although another already running."))
+    parser.add_argument("--max-candidates", type=int, metavar="K", help="Disambiguates with context only K candidates with the highest static score of each entity.")
+    parser.add_argument("--time-budget", type=float, metavar="SECONDS", help="A time budget of each document; when it is exceeded, the remaining entities keep their disambiguation without context.")
+
+    arguments = parser.parse_args()
+
+    if arguments.workers < 1:
+        parser.error("argument -w/--workers: must be a positive number")
+    if arguments.max_candidates is not None and arguments.max_candidates < 1:
+        parser.error("argument --max-candidates: must be a positive number")
+    if arguments.time_budget is not None and arguments.time_budget <= 0:
+        parser.error("argument --time-budget: must be a positive number")
+
+    options = {
+        "lowercase": arguments.lowercase,
+        "remove": arguments.remove_accent,
+        "max_candidates": arguments.max_candidates,
+        "time_budget": arguments.time_budget,
+    }
+
+    main_kb = ner_cz.connect_kb(arguments.own_kb_daemon)
+
+    try:
+        # everything is loaded before forking the workers, so they share it
+        main_kb.start()
+        pool = create_pool(main_kb, arguments.workers)
+        try:
+            if os.path.exists(arguments.socket):
+                os.remove(arguments.socket)
+            server = DaemonServer(arguments.socket, pool, options)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+                os.remove(arguments.socket)
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        main_kb.end()
+
+if __name__ == "__main__":
+    main()
+
+# konec souboru ner_daemon.py
@@ -7,9 +7,12 @@ import re
 import imp
 import cPickle as pickle
 import subprocess
-import unicodedata
 import tempfile
 import time
+import shutil
+import numpy
+
+import normalization
 
 # Pro debugování:
 from debug import print_dbg, print_dbg_en
@@ -19,8 +22,14 @@ DIRPATH_KB_DAEMON = os.path.abspath(os.path.join(SCRIPT_DIR, "SharedKB/var2"))
 PATH_KB_DAEMON = os.path.abspath(os.path.join(DIRPATH_KB_DAEMON, "decipherKB-daemon"))
 PATH_KB = os.path.abspath(os.path.join(SCRIPT_DIR, "KB-HEAD.all"))
 #PATH_KB = "KB-HEAD.all"
+# Binární obraz KB vytvořený démonem (jednou pro každou verzi KB), který lze namapovat přímo ze souboru.
+PATH_KB_IMAGE = PATH_KB + ".bin"
+# Adresář s předpočítanými příznaky pro disambiguaci (doplní se verze KB, čas změny a velikost souboru KB).
+PATH_FEATURES = os.path.join(SCRIPT_DIR, "ner_features-%s-%d-%d")
 
 KB_MULTIVALUE_DELIM = "|"
+# Sloupce bez příznaku {n}, které démon uloží jako pole čísel, pokud jsou všechny jejich hodnoty čísla (viz get_score()).
+KB_NUMERIC_COLUMNS = ["CONFIDENCE"]
 
 # # Timeouty v sekundách:
 Timeout_SharedKB_start = 300
@@ -29,10 +38,92 @@ Timeout_process_exists = 10
 reload(sys)
 sys.setdefaultencoding("utf-8")
 
-def remove_accent(_string):
-    """Removes accents from a string. For example, Eduard Ovčáček -> Eduard Ovcacek."""
-    nkfd_form = unicodedata.normalize('NFKD', unicode(_string))
-    return str("".join([c for c in nkfd_form if not unicodedata.combining(c)]))
+# Removes accents from a string. For example, Eduard Ovčáček -> Eduard Ovcacek.
+remove_accent = normalization.remove_accent_str
+
+class IntSet(object):
+	'''
+	An immutable set of integers (lines of KB) stored as a sorted NumPy array.
+
+	It takes a fraction of the memory of a set of Python ints and its intersection and union
+	are done by NumPy on whole arrays. Iteration yields Python ints in ascending order.
+	IntSets with the same values are equal and have the same hash (an IntSet is never equal
+	to a set or a frozenset), so an IntSet can be a part of a dictionary key.
+	'''
+
+	__slots__ = ("values",)
+
+	def __init__(self, values=()):
+		if isinstance(values, IntSet):
+			self.values = values.values
+		elif isinstance(values, numpy.ndarray):
+			self.values = numpy.unique(values.astype(numpy.int32))
+		else:
+			self.values = numpy.unique(numpy.fromiter(values, dtype=numpy.int32))
+
+	@classmethod
+	def _from_sorted(cls, values):
+		result = cls.__new__(cls)
+		result.values = values
+		return result
+
+	@classmethod
+	def union_all(cls, sets):
+		'''
+		Returns a union of all given IntSets.
+		'''
+		arrays = [s.values for s in sets if len(s)]
+		if not arrays:
+			return cls()
+		return cls(numpy.concatenate(arrays))
+
+	def __getstate__(self):
+		return self.values
+
+	def __setstate__(self, state):
+		self.values = state
+
+	def __len__(self):
+		return len(self.values)
+
+	def __iter__(self):
+		return iter(self.values.tolist())
+
+	def __eq__(self, other):
+		return isinstance(other, IntSet) and numpy.array_equal(self.values, other.values)
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __hash__(self):
+		return hash(self.values.tobytes())
+
+	def __contains__(self, value):
+		i = numpy.searchsorted(self.values, value)
+		return i < len(self.values) and self.values[i] == value
+
+	def __and__(self, other):
+		if not isinstance(other, IntSet):
+			other = IntSet(other)
+		return IntSet._from_sorted(numpy.intersect1d(self.values, other.values, assume_unique=True))
+
+	__rand__ = __and__
+
+	def __or__(self, other):
+		if not isinstance(other, IntSet):
+			other = IntSet(other)
+		return IntSet._from_sorted(numpy.union1d(self.values, other.values))
+
+	__ror__ = __or__
+
+	def copy(self):
+		return IntSet._from_sorted(self.values)
+
+	def __repr__(self):
+		return "IntSet(%r)" % self.values.tolist()
+
+EMPTY_INT_SET = IntSet()
+
 
 class KnowledgeBaseCZ(object):
 	'''
@@ -48,6 +139,9 @@ class KnowledgeBaseCZ(object):
 		self.kb_shm_name = kb_shm_name
 		self.kb_shm = KB_shm.KB_shm(self.kb_shm_name, KB_MULTIVALUE_DELIM)
 		self.kb_daemon = None
+		self.features = None
+		# Počet dotazů do KB (pro statistiky ner_cz.py).
+		self.lookup_count = 0
 
 	def start(self):
 		'''
@@ -56,6 +150,12 @@ class KnowledgeBaseCZ(object):
 
 		kb_daemon_run = self.check()
 
+		# Bez běžícího démona se aktuální obraz KB namapuje přímo ze souboru (hned a bez kopírování do sdílené paměti).
+		# Jen pokud nebyla zadána sdílená paměť, explicitně zadaná se nenahrazuje.
+		if self.kb_shm_name is None and not kb_daemon_run and self.kb_shm.checkImage(PATH_KB_IMAGE, PATH_KB):
+			self.__init__(PATH_KB_IMAGE)
+			return self.start()
+
 		try:
 			if(self.kb_shm_name == None):
 				if(kb_daemon_run):
@@ -129,6 +229,11 @@ class KnowledgeBaseCZ(object):
 
 			file_namedict.close()
 			file_fragments.close()
+
+			# Soubor PATH_NAMEDICT vytvořený starší verzí obsahuje množiny.
+			for name, lines in self.name_dict.iteritems():
+				if not isinstance(lines, IntSet):
+					self.name_dict[name] = IntSet(lines)
 		else:
 			file_namedict = open(PATH_NAMEDICT, 'wb')
 			file_fragments = open(PATH_FRAGMENTS, 'wb')
@@ -155,11 +260,14 @@ class KnowledgeBaseCZ(object):
 					for name in names:
 						name = remove_accent(name).lower()
 						if name not in self.name_dict:
-							self.name_dict[name] = set([line])
+							self.name_dict[name] = [line]
 						else:
-							self.name_dict[name].add(line)
+							self.name_dict[name].append(line)
 				line += 1
 				text = self.get_data_at(line, 1)
+
+			for name, lines in self.name_dict.iteritems():
+				self.name_dict[name] = IntSet(lines)
 			pickle.dump(self.name_dict, file_namedict, pickle.HIGHEST_PROTOCOL)
 			pickle.dump(self.fragments, file_fragments, pickle.HIGHEST_PROTOCOL)
 
@@ -167,6 +275,20 @@ class KnowledgeBaseCZ(object):
 			file_fragments.close()
 
 
+	def initFeatures(self):
+		'''
+		Loads features used for disambiguation as memory-mapped NumPy arrays (see KbFeatures).
+		The arrays are stored in a directory named by the version of KB, the modification time and size
+		of the KB file and the format of the arrays, so they are built once per KB (even for a KB without a version).
+		'''
+		kb_stat = os.stat(PATH_KB)
+		path_features = "%s-%d" % (PATH_FEATURES % (self.version(), int(kb_stat.st_mtime), kb_stat.st_size), KbFeatures.FORMAT)
+
+		self.features = None
+		if not KbFeatures.exists(path_features):
+			KbFeatures.build(self, path_features)
+		self.features = KbFeatures(path_features)
+
 	def get_subnames(self, whole_names, ent_type, line):
 		'''
 		From a list of whole names for a given person, it creates a set of all possible subnames.
@@ -270,6 +392,7 @@ class KnowledgeBaseCZ(object):
 		Číslování řádků i sloupců od 1.
 		'''
 
+		self.lookup_count += 1
 		return self.kb_shm.dataAt(line, col)
 
 	def get_data_for(self, line, col_name):
@@ -277,8 +400,38 @@ class KnowledgeBaseCZ(object):
 		Číslování řádků od 1.
 		'''
 
+		self.lookup_count += 1
+		if self.features and col_name in KbFeatures.COLUMNS and self.features.has_line(line):
+			return self.features.value(col_name, line)
 		return self.kb_shm.dataFor(line, col_name)
 
+	def get_data_row(self, line):
+		'''
+		Vrátí seznam všech sloupců řádku line jedním dotazem do KB.
+		Číslování řádků od 1.
+		'''
+
+		self.lookup_count += 1
+		return self.kb_shm.dataRow(line)
+
+	def get_data_for_columns(self, line, col_names):
+		'''
+		Vrátí tuple hodnot sloupců col_names řádku line jedním dotazem do KB (None pro sloupce, které typ entity nemá).
+		Číslování řádků od 1.
+		'''
+
+		self.lookup_count += 1
+		return self.kb_shm.dataForColumns(line, col_names)
+
+	def get_data_for_lines(self, lines, col_name):
+		'''
+		Vrátí seznam hodnot sloupce col_name pro každý z řádků lines jedním dotazem do KB.
+		Číslování řádků od 1.
+		'''
+
+		self.lookup_count += 1
+		return self.kb_shm.dataForLines(lines, col_name)
+
 	def get_head_at(self, line, col):
 		'''
 		Číslování řádků i sloupců od 1.
@@ -306,22 +459,8 @@ class KnowledgeBaseCZ(object):
 		Parametr delim umožňuje změnit oddělovač sloupců.
 		'''
 
-		text_line = ""
-		col = 1
-		text = self.get_data_at(line, col)
-
-		if text != None:
-			text_line += text
-			col += 1
-			text = self.get_data_at(line, col)
-
-		while text != None:
-			text_line += delim
-			text_line += text
-			col += 1
-			text = self.get_data_at(line, col)
-
-		return (col-1, text_line)
+		row = self.get_data_row(line)
+		return (len(row), delim.join(row))
 
 	def get_complete_head(self, ent_type, ent_subtype, delim='\t'):
 		'''
@@ -352,35 +491,29 @@ class KnowledgeBaseCZ(object):
 		Parametr delim umožňuje změnit oddělovač sloupců.
 		'''
 
-		text_line = ""
-		col = 1
 		ent_type = self.get_ent_type(line)
 		ent_subtype = self.get_ent_subtype(line)
-		text_head = self.get_head_for(ent_type, ent_subtype, col)
-		text_data = self.get_data_at(line, col)
 
-		if (text_head != None) and (text_data != None):
-			text_line += text_head + ": " + text_data
-			col += 1
+		text_lines = []
+		for col, text_data in enumerate(self.get_data_row(line), 1):
 			text_head = self.get_head_for(ent_type, ent_subtype, col)
-			text_data = self.get_data_at(line, col)
+			if text_head == None:
+				break
+			text_lines.append(text_head + ": " + text_data)
 
-		while (text_head != None) and (text_data != None):
-			text_line += "\n"
-			text_line += text_head + ": " + text_data
-			col += 1
-			text_head = self.get_head_for(ent_type, ent_subtype, col)
-			text_data = self.get_data_at(line, col)
-
-		return (col - 1, text_line)
+		return (len(text_lines), "\n".join(text_lines))
 
 	def get_ent_type(self, line):
 		"""Returns a type of an entity at the line of the knowledge base"""
 
+		self.lookup_count += 1
+		if self.features and self.features.has_line(line):
+			return self.features.value("TYPE", line)
 		return self.kb_shm.dataType(line)
 
 	def get_ent_subtype(self, line):
 		"""Returns a subtype of an entity at the line of the knowledge base"""
+		self.lookup_count += 1
 		return self.kb_shm.dataSubtype(line)
 
 	def people_named(self, subname):
@@ -388,13 +521,29 @@ class KnowledgeBaseCZ(object):
 		Returns all names (KB ids) containing a given subname.
 		"""
 
-		return self.name_dict.get(subname, set())
+		return self.name_dict.get(subname, EMPTY_INT_SET)
 
 	def get_score(self, line):
 		"""
 		Returns disambiguation score based on Wikipedia statistics and score based on other metrics.
 		"""
 
+		# CONFIDENCE uložená démonem jako pole čísel (NaN pokud hodnota chybí nebo není číslem, pak rozhodne text KB)
+		confidence = self.kb_shm.numericColumn("CONFIDENCE")
+		if confidence is not None and isinstance(line, (int, long)) and 0 < line < len(confidence):
+			self.lookup_count += 1
+			# item() vrací přímo číslo Pythonu a NaN se nerovná sám sobě (rychlejší než NumPy skaláry a numpy.isnan)
+			result = confidence.item(line)
+			if result == result:
+				# celočíselný sloupec vrací int, skóre je ale vždy float (jako z textu KB)
+				return float(result)
+
+		if self.features and self.features.has_line(line):
+			self.lookup_count += 1
+			result = self.features.confidence[line]
+			if not numpy.isnan(result):
+				return float(result)
+
 		result = self.get_data_for(line, "CONFIDENCE")
 
 		try:
@@ -425,8 +574,214 @@ class KnowledgeBaseCZ(object):
 		return set()
 
 	def get_nationalities(self, line):
+		if self.features and self.features.has_line(line):
+			self.lookup_count += 1
+			# an empty column gives [""] as split() of the text does
+			return self.features.values("NATIONALITY", line) or [""]
 		return self.get_data_for(line, "NATIONALITY").split(KB_MULTIVALUE_DELIM)
 
+	def get_jobs(self, line):
+		"""Returns a list of professions of an entity (empty if there is none)."""
+		if self.features and self.features.has_line(line):
+			self.lookup_count += 1
+			return self.features.values("JOBS", line)
+		jobs = self.get_data_for(line, "JOBS")
+		return jobs.split(KB_MULTIVALUE_DELIM) if jobs else []
+
+	def get_years(self, line):
+		"""Returns a tuple (year of birth, year of death) of a person, unknown years are 0."""
+		if self.features and self.features.has_line(line):
+			self.lookup_count += 1
+			return (int(self.features.years_of_birth[line]), int(self.features.years_of_death[line]))
+		return (KbFeatures.parse_year(self.get_data_for(line, "DATE OF BIRTH")), KbFeatures.parse_year(self.get_data_for(line, "DATE OF DEATH")))
+
+
+class KbFeatures(object):
+	'''
+	Features of KB entities used for disambiguation stored as NumPy arrays indexed by a line of KB.
+
+	Single-valued columns are stored as ids into a vocabulary (id 0 stands for a missing column),
+	multi-valued columns as ids in one array with per-line offsets into it (value of line L are
+	ids[offsets[L]:offsets[L+1]]). CONFIDENCE is stored as float (NaN if it is missing or not
+	a number) and years of birth and death as integers (0 if unknown).
+	'''
+
+	# a format of the stored arrays (features of another format are built again)
+	FORMAT = 2
+
+	COLUMNS = ("TYPE", "GENDER", "DATE OF BIRTH", "DATE OF DEATH")
+	MULTIVALUE_COLUMNS = ("NATIONALITY", "JOBS")
+
+	FILE_VOCABULARIES = "vocabularies.pkl"
+
+	REGEX_YEAR = re.compile(r"^\s*(-?[0-9]+)")
+
+	def __init__(self, path):
+		'''
+		Loads arrays from the directory path (created by KbFeatures.build()) as memory-mapped.
+		'''
+
+		def load(name):
+			return numpy.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+
+		with open(os.path.join(path, self.FILE_VOCABULARIES), "rb") as f:
+			self.vocabularies = pickle.load(f)
+
+		self.ids = {}
+		self.offsets = {}
+		for col_name in self.COLUMNS:
+			self.ids[col_name] = load(self._file_name(col_name))
+		for col_name in self.MULTIVALUE_COLUMNS:
+			self.ids[col_name] = load(self._file_name(col_name))
+			self.offsets[col_name] = load(self._file_name(col_name) + "-offsets")
+		self.confidence = load("confidence")
+		self.years_of_birth = load("years_of_birth")
+		self.years_of_death = load("years_of_death")
+		self.line_count = len(self.confidence)
+		self.value2id = {}
+
+	@staticmethod
+	def _file_name(col_name):
+		return col_name.lower().replace(" ", "_")
+
+	@classmethod
+	def exists(cls, path):
+		return os.path.isfile(os.path.join(path, cls.FILE_VOCABULARIES))
+
+	@classmethod
+	def parse_year(cls, date):
+		'''
+		Returns a year of the date in the format of KB (e.g. "1918-10-28"), 0 if there is none.
+		'''
+		if date:
+			match = cls.REGEX_YEAR.match(date)
+			if match:
+				return int(match.group(1))
+		return 0
+
+	@classmethod
+	def build(cls, kb, path):
+		'''
+		Exports features of all lines of kb into the directory path.
+		'''
+
+		vocabularies = {}
+		value2id = {}
+		ids = {}
+		offsets = {}
+		for col_name in cls.COLUMNS + cls.MULTIVALUE_COLUMNS:
+			vocabularies[col_name] = [None]
+			value2id[col_name] = {None: 0}
+			ids[col_name] = [0]
+		for col_name in cls.MULTIVALUE_COLUMNS:
+			ids[col_name] = []
+			offsets[col_name] = [0, 0]
+		confidence = [numpy.nan]
+		years_of_birth = [0]
+		years_of_death = [0]
+
+		def intern(col_name, value):
+			if value not in value2id[col_name]:
+				value2id[col_name][value] = len(vocabularies[col_name])
+				vocabularies[col_name].append(value)
+			return value2id[col_name][value]
+
+		line = 1
+		text = kb.get_data_at(line, 1)
+		while text != None:
+			for col_name in cls.COLUMNS:
+				if col_name == "TYPE":
+					value = kb.kb_shm.dataType(line)
+				else:
+					value = kb.kb_shm.dataFor(line, col_name)
+				ids[col_name].append(intern(col_name, value))
+
+			for col_name in cls.MULTIVALUE_COLUMNS:
+				value = kb.kb_shm.dataFor(line, col_name)
+				if value:
+					ids[col_name].extend(intern(col_name, v) for v in value.split(KB_MULTIVALUE_DELIM))
+				offsets[col_name].append(len(ids[col_name]))
+
+			value = kb.kb_shm.dataFor(line, "CONFIDENCE")
+			try:
+				confidence.append(float(value) if value else numpy.nan)
+			except ValueError:
+				confidence.append(numpy.nan)
+
+			years_of_birth.append(cls.parse_year(vocabularies["DATE OF BIRTH"][ids["DATE OF BIRTH"][-1]]))
+			years_of_death.append(cls.parse_year(vocabularies["DATE OF DEATH"][ids["DATE OF DEATH"][-1]]))
+
+			line += 1
+			text = kb.get_data_at(line, 1)
+
+		# Pro případ souběžného sestavení se příznaky zapíší do dočasného adresáře a ten se přejmenuje.
+		path_tmp = tempfile.mkdtemp(prefix=os.path.basename(path) + ".", dir=os.path.dirname(path))
+		try:
+			def save(name, values, dtype):
+				numpy.save(os.path.join(path_tmp, name + ".npy"), numpy.array(values, dtype=dtype))
+
+			for col_name in cls.COLUMNS:
+				save(cls._file_name(col_name), ids[col_name], numpy.int32)
+			for col_name in cls.MULTIVALUE_COLUMNS:
+				save(cls._file_name(col_name), ids[col_name], numpy.int32)
+				save(cls._file_name(col_name) + "-offsets", offsets[col_name], numpy.int64)
+			save("confidence", confidence, numpy.float64)
+			save("years_of_birth", years_of_birth, numpy.int32)
+			save("years_of_death", years_of_death, numpy.int32)
+
+			with open(os.path.join(path_tmp, cls.FILE_VOCABULARIES), "wb") as f:
+				pickle.dump(vocabularies, f, pickle.HIGHEST_PROTOCOL)
+
+			os.rename(path_tmp, path)
+		except OSError:
+			if not cls.exists(path):
+				raise
+		finally:
+			if os.path.isdir(path_tmp):
+				shutil.rmtree(path_tmp)
+
+	def has_line(self, line):
+		return isinstance(line, (int, long)) and 0 < line < self.line_count
+
+	def value(self, col_name, line):
+		return self.vocabularies[col_name][self.ids[col_name][line]]
+
+	def values(self, col_name, line):
+		vocabulary = self.vocabularies[col_name]
+		offsets = self.offsets[col_name]
+		return [vocabulary[i] for i in self.ids[col_name][offsets[line]:offsets[line + 1]]]
+
+	def value_ids(self, col_name, values):
+		'''
+		Returns an array of vocabulary ids of given values (values missing in the vocabulary are omitted).
+		'''
+		if col_name not in self.value2id:
+			self.value2id[col_name] = dict((v, i) for i, v in enumerate(self.vocabularies[col_name]))
+		value2id = self.value2id[col_name]
+		return numpy.array([value2id[v] for v in values if v in value2id], dtype=numpy.int32)
+
+	def count_values(self, col_name, lines, values):
+		'''
+		For each line from the array lines returns how many values of the multi-valued column are among given values.
+		'''
+		lines = numpy.asarray(lines, dtype=numpy.int64)
+		wanted = self.value_ids(col_name, values)
+		if not len(lines) or not len(wanted):
+			return numpy.zeros(len(lines), dtype=numpy.int64)
+
+		offsets = self.offsets[col_name]
+		starts = offsets[lines]
+		lengths = offsets[lines + 1] - starts
+		total = lengths.sum()
+		if not total:
+			return numpy.zeros(len(lines), dtype=numpy.int64)
+
+		# indices of all values of all lines in one array
+		owners = numpy.repeat(numpy.arange(len(lines)), lengths)
+		positions = numpy.arange(total) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths) + numpy.repeat(starts, lengths)
+		hits = numpy.in1d(self.ids[col_name][positions], wanted)
+		return numpy.bincount(owners[hits], minlength=len(lines))
+
 
 class KbDaemon(object):
 	def __init__(self, kb_shm_name=None):
@@ -437,10 +792,11 @@ class KbDaemon(object):
 		self.kb_shm_name = kb_shm_name
 
 	def start(self):
+		numeric_args = [arg for col_name in KB_NUMERIC_COLUMNS for arg in ("-n", col_name)]
 		if self.kb_shm_name:
-			self.ps = subprocess.Popen([PATH_KB_DAEMON, "-s", self.kb_shm_name, PATH_KB], stdout=self.stdout, stderr=self.stderr)
+			self.ps = subprocess.Popen([PATH_KB_DAEMON, "-s", self.kb_shm_name] + numeric_args + [PATH_KB], stdout=self.stdout, stderr=self.stderr)
 		else:
-			self.ps = subprocess.Popen([PATH_KB_DAEMON, PATH_KB], stdout=self.stdout, stderr=self.stderr)
+			self.ps = subprocess.Popen([PATH_KB_DAEMON] + numeric_args + [PATH_KB], stdout=self.stdout, stderr=self.stderr)
 
 		output = ""
 		try:
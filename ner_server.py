@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set tabstop=4 softtabstop=4 expandtab shiftwidth=4
+
+# Server ner_cz.py s požadavky a odpověďmi ve formátu JSON dostupný přes
+# unixový socket i přes HTTP na localhostu. Rozpoznávání probíhá ve skupině
+# pracovních procesů z ner_daemon.py, vlákna serveru pouze čtou požadavky
+# a zapisují odpovědi, takže vstup/výstup nikdy neblokuje rozpoznávání.
+#
+# Požadavek je objekt JSON s dokumentem a volitelnými příznaky:
+#     {"id": 1, "text": "...", "all": false, "score": false, "names": false,
+#      "lowercase": false, "remove_accent": false, "automaton": "default",
+#      "time_budget": 2.5}
+# Položka "automaton" volí variantu automatu figy (default, lower, uri); bez ní
+# se použije automat podle "lowercase". Všechny varianty jsou načtené jednou
+# a sdílené všemi pracovními procesy. Položka "time_budget" je časový limit
+# dokumentu v sekundách; po jeho překročení si zbylé entity ponechají
+# disambiguaci bez kontextu a odpověď obsahuje seznam vynechaných kroků
+# v položce "degraded". Na požadavek, na který pracovní proces neodpoví do
+# --request-timeout sekund (např. protože proces skončil), nebo jehož
+# zpracování selže, přijde odpověď s položkou "error".
+# Odpověď obsahuje stejné "id" a seznam entit (nebo položku "error"):
+#     {"id": 1, "entities": [{"start_offset": 62, "end_offset": 84,
+#      "type": "kb", "text": "Tomáš Garrigue Masaryk", "senses": [33550]}]}
+#
+# Přes unixový socket posílá klient požadavky po řádcích (jeden objekt JSON
+# na řádek) a může jich poslat více najednou; odpovědi přichází po řádcích
+# v pořadí, v jakém byly dokončeny, a spárují se podle "id". Přes HTTP se
+# posílá jeden požadavek metodou POST na /recognize.
+#
+# Příklad:
+#     ./ner_server.py --socket /tmp/ner_cz.sock --http-port 8080 &
+#     curl -d '{"id": 1, "text": "Edvard Beneš"}' http://localhost:8080/recognize
+
+import os
+import argparse
+import json
+import threading
+import time
+import Queue
+import SocketServer
+import BaseHTTPServer
+import multiprocessing
+import ner_cz
+import ner_daemon
+
+# flags of a request and corresponding arguments of ner_cz.recognize()
+REQUEST_FLAGS = [
+    ("all", "print_all"),
+    ("score", "print_score"),
+    ("names", "find_names"),
+    ("lowercase", "lowercase"),
+    ("remove_accent", "remove"),
+]
+
+# an error response to a request without a response of a worker in time (a worker which died never answers)
+TIMEOUT_ERROR = "No response of a worker in %s s."
+
+class RequestError(Exception):
+    """ An invalid request. """
+    pass
+
+def parse_request(raw_request, default_options):
+    """ Returns a job for process_request() from a request in JSON. """
+    try:
+        request = json.loads(raw_request)
+    except ValueError as e:
+        raise RequestError("Invalid JSON: %s" % e)
+    if not isinstance(request, dict):
+        raise RequestError("A request has to be a JSON object.")
+
+    request_id = request.get("id")
+    text = request.get("text")
+    if not isinstance(text, basestring):
+        raise RequestError("A request has to contain a \"text\" string.")
+    if isinstance(text, unicode):
+        text = text.encode("utf-8")
+
+    options = dict(default_options)
+    for flag, argument in REQUEST_FLAGS:
+        if flag in request:
+            if not isinstance(request[flag], bool):
+                raise RequestError("A flag \"%s\" has to be a boolean." % flag)
+            options[argument] = request[flag]
+    if "automaton" in request:
+        if request["automaton"] not in ner_cz.AutomatonRegistry.VARIANTS:
+            raise RequestError("Unknown automaton variant \"%s\" (expected one of %s)." % (request["automaton"], ", ".join(sorted(ner_cz.AutomatonRegistry.VARIANTS))))
+        try:
+            # automata are loaded before the workers are forked, so this only checks that the variant is available
+            ner_cz.automata.get(request["automaton"])
+        except ner_cz.AutomatonError as e:
+            raise RequestError(str(e))
+        options["automaton"] = request["automaton"]
+    if "time_budget" in request:
+        if isinstance(request["time_budget"], bool) or not isinstance(request["time_budget"], (int, long, float)) or request["time_budget"] <= 0:
+            raise RequestError("A \"time_budget\" has to be a positive number of seconds.")
+        options["time_budget"] = request["time_budget"]
+
+    return (request_id, text, options)
+
+def process_request(job):
+    """ Returns a response to a request. It is called in a worker process of ner_daemon. """
+    request_id, input_string, options = job
+    return ner_cz.document_result(request_id, input_string, **options)
+
+def failed_response(request_id, async_result):
+    """ Returns an error response to a request whose worker raised an exception (the result is ready). """
+    try:
+        async_result.get(0)
+    except Exception as e:
+        return {"id": request_id, "error": "%s: %s" % (type(e).__name__, e)}
+
+
+class JsonRequestHandler(SocketServer.StreamRequestHandler):
+    """ Reads requests of one connection (one per line) and writes responses as soon as they are done. """
+
+    # seconds between checks of workers, which failed or did not answer in time
+    POLL_INTERVAL = 0.5
+
+    def handle(self):
+        # messages for the writer: ("pending", index, request id, AsyncResult) for a submitted request, ("done", index,
+        # response) for a response and finally a number of requests (it terminates the writer)
+        messages = Queue.Queue()
+        writer = threading.Thread(target=self.write_responses, args=(messages,))
+        writer.start()
+
+        submitted = 0
+        try:
+            for raw_request in self.rfile:
+                if not raw_request.strip():
+                    continue
+                index = submitted
+                submitted += 1
+                try:
+                    job = parse_request(raw_request, self.server.options)
+                except RequestError as e:
+                    messages.put(("done", index, {"id": None, "error": str(e)}))
+                else:
+                    # the callback is called only for a result; a worker which raised or died is found by the writer
+                    callback = lambda response, index=index: messages.put(("done", index, response))
+                    async_result = self.server.pool.apply_async(process_request, [job], callback=callback)
+                    messages.put(("pending", index, job[0], async_result))
+        finally:
+            messages.put(submitted)
+            writer.join()
+
+    def write_responses(self, messages):
+        # submitted requests without a response: index -> (request id, AsyncResult, time limit)
+        pending = {}
+        # indices of requests with a response (a response of a worker after its time limit is dropped)
+        answered = set()
+        submitted = None
+        while submitted is None or len(answered) < submitted:
+            try:
+                message = messages.get(timeout=self.POLL_INTERVAL if pending else None)
+            except Queue.Empty:
+                message = None
+
+            responses = []
+            if isinstance(message, int):
+                submitted = message
+            elif message is not None and message[0] == "pending":
+                kind, index, request_id, async_result = message
+                if index not in answered:
+                    pending[index] = (request_id, async_result, time.time() + self.server.request_timeout)
+            elif message is not None:
+                kind, index, response = message
+                if index not in answered:
+                    pending.pop(index, None)
+                    responses.append((index, response))
+
+            now = time.time()
+            for index, (request_id, async_result, time_limit) in pending.items():
+                if async_result.ready() and not async_result.successful():
+                    responses.append((index, failed_response(request_id, async_result)))
+                elif now > time_limit:
+                    responses.append((index, {"id": request_id, "error": TIMEOUT_ERROR % self.server.request_timeout}))
+                else:
+                    continue
+                del pending[index]
+
+            for index, response in responses:
+                answered.add(index)
+                try:
+                    self.wfile.write(json.dumps(response) + "\n")
+                    self.wfile.flush()
+                except IOError:
+                    # the client has closed the connection, remaining responses are dropped
+                    pass
+
+
+class JsonUnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """ Accepts connections with requests in JSON on a unix socket. """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, pool, options, request_timeout):
+        SocketServer.UnixStreamServer.__init__(self, socket_path, JsonRequestHandler)
+        self.pool = pool
+        self.options = options
+        self.request_timeout = request_timeout
+
+
+class HttpRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Handles requests in JSON sent by POST to /recognize. """
+
+    protocol_version = "HTTP/1.1"
+    # headers and a body of a response are written separately (delayed ACK would hold the body)
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        if self.path != "/recognize":
+            self.send_json(404, {"id": None, "error": "Unknown path \"%s\"." % self.path})
+            return
+
+        raw_request = self.rfile.read(int(self.headers.getheader("Content-Length", 0)))
+        try:
+            job = parse_request(raw_request, self.server.options)
+        except RequestError as e:
+            self.send_json(400, {"id": None, "error": str(e)})
+            return
+
+        async_result = self.server.pool.apply_async(process_request, [job])
+        try:
+            response = async_result.get(self.server.request_timeout)
+        except multiprocessing.TimeoutError:
+            response = {"id": job[0], "error": TIMEOUT_ERROR % self.server.request_timeout}
+        except Exception:
+            response = failed_response(job[0], async_result)
+        self.send_json(500 if "error" in response else 200, response)
+
+    def send_json(self, code, response):
+        body = json.dumps(response)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class JsonHttpServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Accepts requests in JSON over HTTP on localhost. """
+
+    daemon_threads = True
+
+    def __init__(self, port, pool, options, request_timeout):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", port), HttpRequestHandler)
+        self.pool = pool
+        self.options = options
+        self.request_timeout = request_timeout
+
+
+def main():
+    # argument parsing
+    parser = argparse.ArgumentParser(description="Runs ner_cz.py as a server with requests in JSON on a unix socket and/or over HTTP on localhost.")
+    parser.add_argument("-S", "--socket", help="A path of the unix socket.")
+    parser.add_argument("-p", "--http-port", type=int, help="A port of the HTTP server on localhost.")
+    parser.add_argument("-w", "--workers", type=int, default=multiprocessing.cpu_count(), help="A number of worker processes (default: a number of CPUs).")
+    parser.add_argument("-r", "--remove-accent", action="store_true", default=False, help="Removes accent in input unless a request says otherwise.")
+    parser.add_argument("-l", "--lowercase", action="store_true", default=False, help="Changes all characters in input to the lowercase characters unless a request says otherwise.")
+    parser.add_argument("--own_kb_daemon", action="store_true", dest="own_kb_daemon", help=("Run own KB daemon although another already running."))
+    parser.add_argument("--max-candidates", type=int, metavar="K", help="Disambiguates with context only K candidates with the highest static score of each entity.")
+    parser.add_argument("--time-budget", type=float, metavar="SECONDS", help="A time budget of each document unless a request says otherwise.")
+    parser.add_argument("--request-timeout", type=float, default=300.0, metavar="SECONDS", help="A request without a response of a worker in SECONDS (e.g. because the worker died) gets an error response (default: 300).")
+
+    arguments = parser.parse_args()
+
+    if arguments.socket is None and arguments.http_port is None:
+        parser.error("at least one of arguments -S/--socket and -p/--http-port is required")
+    if arguments.workers < 1:
+        parser.error("argument -w/--workers: must be a positive number")
+    if arguments.max_candidates is not None and arguments.max_candidates < 1:
+        parser.error("argument --max-candidates: must be a positive number")
+    if arguments.time_budget is not None and arguments.time_budget <= 0:
+        parser.error("argument --time-budget: must be a positive number")
+    if arguments.request_timeout <= 0:
+        parser.error("argument --request-timeout: must be a positive number")
+
+    options = {
+        "print_all": False,
+        "print_score": False,
+        "find_names": False,
+        "lowercase": arguments.lowercase,
+        "remove": arguments.remove_accent,
+        "max_candidates": arguments.max_candidates,
+        "automaton": None,
+        "time_budget": arguments.time_budget,
+    }
+
+    kb = ner_cz.connect_kb(arguments.own_kb_daemon)
+
+    try:
+        kb.start()
+        pool = ner_daemon.create_pool(kb, arguments.workers)
+        servers = []
+        try:
+            if arguments.socket is not None:
+                if os.path.exists(arguments.socket):
+                    os.remove(arguments.socket)
+                servers.append(JsonUnixServer(arguments.socket, pool, options, arguments.request_timeout))
+            if arguments.http_port is not None:
+                servers.append(JsonHttpServer(arguments.http_port, pool, options, arguments.request_timeout))
+
+            for server in servers:
+                thread = threading.Thread(target=server.serve_forever)
+                thread.daemon = True
+                thread.start()
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
+        finally:
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+            if arguments.socket is not None and os.path.exists(arguments.socket):
+                os.remove(arguments.socket)
+            pool.terminate()
+            pool.join()
+    finally:
+        kb.end()
+
+if __name__ == "__main__":
+    main()
+
+# konec souboru ner_server.py
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set tabstop=4 softtabstop=4 expandtab shiftwidth=4
+
+# Zátěžový test serveru ner_server.py. Pro každou zadanou souběžnost pošle
+# daný počet požadavků s dokumenty ze zadaných souborů (každý klient má své
+# spojení a posílá požadavky jeden po druhém) a vypíše propustnost a latence.
+#
+# Příklad:
+#     ./ner_server_loadtest.py --socket /tmp/ner_cz.sock -c 1,2,4,8 -n 200 dokument*.txt
+#     ./ner_server_loadtest.py --http-port 8080 -c 1,2,4,8 -n 200 dokument*.txt
+
+import sys
+import argparse
+import json
+import socket
+import threading
+import time
+import httplib
+
+class UnixClient(object):
+    """ A client sending requests one by one over a unix socket. """
+
+    def __init__(self, socket_path):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socket_path)
+        self.rfile = self.socket.makefile("rb")
+
+    def request(self, body):
+        self.socket.sendall(body + "\n")
+        return json.loads(self.rfile.readline())
+
+    def close(self):
+        self.rfile.close()
+        self.socket.close()
+
+
+class HttpClient(object):
+    """ A client sending requests one by one over a persistent HTTP connection. """
+
+    def __init__(self, port):
+        self.connection = httplib.HTTPConnection("127.0.0.1", port)
+
+    def request(self, body):
+        self.connection.request("POST", "/recognize", body, {"Content-Type": "application/json"})
+        return json.loads(self.connection.getresponse().read())
+
+    def close(self):
+        self.connection.close()
+
+
+def percentile(sorted_values, percent):
+    """ Returns the percentile of sorted values (the nearest rank), None if there are no values. """
+    if not sorted_values:
+        return None
+    index = int(round(percent / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+def run(create_client, documents, requests, concurrency, flags):
+    """ Sends requests by concurrent clients and returns latencies of requests, a number of errors and the total time. """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(xrange(requests))
+
+    def client_loop():
+        client = create_client()
+        try:
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    break
+                request = dict(flags, id=i, text=documents[i % len(documents)])
+                start = time.time()
+                response = client.request(json.dumps(request))
+                latency = time.time() - start
+                with lock:
+                    latencies.append(latency)
+                    if "error" in response:
+                        errors[0] += 1
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=client_loop) for i in xrange(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.time() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures throughput and latency of ner_server.py for various numbers of concurrent clients.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-S", "--socket", help="A path of the unix socket of the server.")
+    group.add_argument("-p", "--http-port", type=int, help="A port of the HTTP server on localhost.")
+    parser.add_argument("-c", "--concurrency", default="1,2,4,8", help="Comma separated numbers of concurrent clients (default: 1,2,4,8).")
+    parser.add_argument("-n", "--requests", type=int, default=100, help="A number of requests for each concurrency (default: 100).")
+    parser.add_argument("-a", "--all", action="store_true", default=False, help="Sends requests with the flag \"all\".")
+    parser.add_argument("-s", "--score", action="store_true", default=False, help="Sends requests with the flag \"score\".")
+    parser.add_argument("files", nargs="+", help="Documents sent in requests (repeatedly).")
+    arguments = parser.parse_args()
+
+    documents = []
+    for file_name in arguments.files:
+        with open(file_name) as f:
+            documents.append(f.read().decode("utf-8"))
+
+    if arguments.socket is not None:
+        create_client = lambda: UnixClient(arguments.socket)
+    else:
+        create_client = lambda: HttpClient(arguments.http_port)
+    flags = {"all": arguments.all, "score": arguments.score}
+
+    print("\t".join(["concurrency", "requests", "errors", "time [s]", "requests/s", "p50 [ms]", "p90 [ms]", "p99 [ms]", "max [ms]"]))
+    for concurrency in map(int, arguments.concurrency.split(",")):
+        latencies, errors, elapsed = run(create_client, documents, arguments.requests, concurrency, flags)
+        latencies.sort()
+        row = [concurrency, len(latencies), errors, "%.3f" % elapsed, "%.1f" % (len(latencies) / elapsed)]
+        # no latencies if all requests failed (or none was sent)
+        row.extend("n/a" if not latencies else "%.1f" % (1000 * percentile(latencies, p)) for p in (50, 90, 99, 100))
+        print("\t".join(map(str, row)))
+        sys.stdout.flush()
+
+if __name__ == "__main__":
+    main()
+
+# konec souboru ner_server_loadtest.py
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set tabstop=4 softtabstop=4 expandtab shiftwidth=4
+
+# Odstraňování diakritiky sdílené skripty ner_cz.py a ner_knowledge_base.py.
+#
+# Rozhodnutí, zda se má znak po NFKD rozkladu vypustit, se pro každý znak
+# spočítá jen jednou a uloží do překladové tabulky pro unicode.translate().
+# Výsledky pro krátké řetězce (jména, fragmenty) se navíc ukládají do omezené
+# LRU cache, protože se stejná jména v dávce opakují tisíckrát.
+
+import sys
+import re
+import unicodedata
+import collections
+
+ACCENT_REGEX = re.compile(r"COMBINING|HANGUL JUNGSEONG|HANGUL JONGSEONG")
+
+# maximal length of a string stored in a cache (longer strings are whole documents)
+CACHE_MAX_STRING_LENGTH = 256
+# maximal number of strings stored in each cache
+CACHE_SIZE = 100000
+
+def unicodedata_name(c):
+    """ Workaround for unicodedata.name(c) in order to deal with ValueError reising for characters without names (all control characters)."""
+
+    try:
+        return unicodedata.name(c)
+    except ValueError:
+        return ""
+
+class DeletionTable(dict):
+    """
+    A translation table for unicode.translate() deleting characters for which
+    is_deleted(character) is True. Each character is decided on its first occurrence.
+    """
+
+    def __init__(self, is_deleted):
+        super(DeletionTable, self).__init__()
+        self.is_deleted = is_deleted
+
+    def __missing__(self, ordinal):
+        if self.is_deleted(unichr(ordinal)):
+            value = None
+        else:
+            value = ordinal
+        self[ordinal] = value
+        return value
+
+# characters with a name of combining character
+NAMED_ACCENT_TABLE = DeletionTable(lambda c: bool(ACCENT_REGEX.search(unicodedata_name(c))))
+# characters of a combining class
+COMBINING_TABLE = DeletionTable(lambda c: bool(unicodedata.combining(c)))
+
+class LruCache(object):
+    """ A bounded cache of results of a function of one string argument (the least recently used results are evicted). """
+
+    def __init__(self, function, size=CACHE_SIZE, max_string_length=CACHE_MAX_STRING_LENGTH):
+        self.function = function
+        self.size = size
+        self.max_string_length = max_string_length
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, string):
+        if len(string) > self.max_string_length:
+            return self.function(string)
+
+        try:
+            result = self.cache.pop(string)
+            self.hits += 1
+        except KeyError:
+            result = self.function(string)
+            self.misses += 1
+            if len(self.cache) >= self.size:
+                self.cache.popitem(last=False)
+        self.cache[string] = result
+        return result
+
+    def clear(self):
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+def _remove_accent_str(input_string):
+    nfkd_form = unicodedata.normalize('NFKD', unicode(input_string))
+    return nfkd_form.translate(COMBINING_TABLE).encode(sys.getdefaultencoding())
+
+def _remove_accent_unicode(_string):
+    _string = unicode(_string)
+
+    nfkd_form = unicodedata.normalize('NFKD', _string)
+    result = nfkd_form.translate(NAMED_ACCENT_TABLE)
+    if len(_string) == len(result):
+        return result
+    else:
+        return _string
+
+remove_accent_str = LruCache(_remove_accent_str)
+remove_accent_str.__doc__ = """ Removes accent from the string, e.g. "José Francisco" -> "Jose Francisco". Returns str. """
+
+remove_accent_unicode = LruCache(_remove_accent_unicode)
+remove_accent_unicode.__doc__ = """ Removes accents from a string. For example, "Eduard Ovčáček" -> "Eduard Ovcacek". Returns unicode (the original string if the number of characters would change). """
+
+# konec souboru normalization.py
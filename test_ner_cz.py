@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set tabstop=4 softtabstop=4 expandtab shiftwidth=4
+
+"""
+Regresní testy ner_cz.py nad malou testovací KB (vyžaduje sestavený SharedKB a figa).
+
+Spuštění:
+    python -m unittest test_ner_cz
+"""
+
+import argparse
+import collections
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import ner_knowledge_base
+import ner_cz
+
+# Testovací KB (sloupce oddělené tabulátorem, hlavička typů je ukončena prázdným řádkem).
+KB_FIXTURE = """VERSION=test
+<person>ID	TYPE	NAME	GENDER	DATE OF BIRTH	DATE OF DEATH	{m}NATIONALITY	{m}JOBS	CONFIDENCE
+<location>ID	TYPE	NAME	COUNTRY	CONFIDENCE
+
+p:1	person	Tomáš Garrigue Masaryk	M	1850-03-07	1937-09-14	česká|rakouská	politik|filozof|sociolog	90
+p:2	person	Jan Masaryk	M	1886-09-14	1948-03-10	česká	politik|diplomat	70
+p:3	person	Karel Čapek	M	1890-01-09	1938-12-25	česká	spisovatel|novinář	85
+p:4	person	Neznámý Masaryk	M	1918	1918		herec	5
+p:5	person	Bez Údajů	F					1
+p:6	person	Alice Masaryková	F	1879-05-03	1966-11-29	česká|americká	sociolog	40
+l:7	location	Praha	Česko	95
+l:8	location	Nula	Česko	0
+l:9	location	Bez Jistoty	Česko	
+"""
+
+class FixtureKBTestCase(unittest.TestCase):
+    """ Testy nad malou testovací KB (KB_FIXTURE) s vlastním démonem. """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp(prefix="test_ner_cz.")
+        cls.saved_paths = (ner_knowledge_base.PATH_KB, ner_knowledge_base.PATH_KB_IMAGE, ner_knowledge_base.PATH_FEATURES)
+
+        ner_knowledge_base.PATH_KB = os.path.join(cls.tmp_dir, "KB-HEAD.all")
+        ner_knowledge_base.PATH_KB_IMAGE = ner_knowledge_base.PATH_KB + ".bin"
+        ner_knowledge_base.PATH_FEATURES = os.path.join(cls.tmp_dir, "ner_features-%s-%d-%d")
+        with open(ner_knowledge_base.PATH_KB, "w") as f:
+            f.write(KB_FIXTURE)
+
+        cls.kb = ner_knowledge_base.KnowledgeBaseCZ("/test_ner_cz-%d" % os.getpid())
+        cls.kb.start()
+        cls.kb.initFeatures()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.kb.end()
+        ner_knowledge_base.PATH_KB, ner_knowledge_base.PATH_KB_IMAGE, ner_knowledge_base.PATH_FEATURES = cls.saved_paths
+        shutil.rmtree(cls.tmp_dir)
+
+
+class PersonScoresTest(FixtureKBTestCase):
+    """ Skóre osob počítané po odstavcích z příznaků KB musí odpovídat výpočtu pro jednoho kandidáta z textu KB. """
+
+    def make_entity(self, start_offset, candidates, text):
+        figa_output = ner_cz.FigaOutput(candidates, start_offset, start_offset + 1, "x", "F")
+        entity = ner_cz.Entity(figa_output, self.kb, text.encode("utf-8"), text, ner_cz.EntityRegister())
+        entity.candidates = list(candidates)
+        return entity
+
+    def test_batch_equals_scalar(self):
+        text = u"x" * 200
+        paragraphs = [0, 100]
+        context = ner_cz.Context([], self.kb, paragraphs, [])
+
+        # kontext odstavců: národnosti, data a profese
+        context.people_nationalities[0] = ["česká"]
+        context.people_dates[0] = ["1850", "1937-09-14", "1918"]
+        context.people_professions[0] = ["politik", "sociolog"]
+        context.people_nationalities[100] = ["americká", "rakouská", "česká"]
+        context.people_dates[100] = []
+        context.people_professions[100] = ["herec"]
+
+        entities = [
+            self.make_entity(10, [1, 2, 4], text),
+            self.make_entity(20, [3, 5], text),
+            self.make_entity(110, [1, 2, 3, 4, 5, 6], text),
+        ]
+        for ent in entities:
+            ent.begin_of_paragraph = 0 if ent.start_offset < 100 else 100
+        context.entities = entities
+
+        context.prepare_person_scores()
+        self.assertEqual(sorted(context.person_static_scores), [0, 100])
+
+        checked = 0
+        features = self.kb.features
+        try:
+            for paragraph_index, par in enumerate([0, 100]):
+                context.paragraph_index = paragraph_index
+                for candidate, score in sorted(context.person_static_scores[par].items()):
+                    # výpočet pro jednoho kandidáta přímo z textu KB (bez příznaků)
+                    self.kb.features = None
+                    expected = context.person_static_score(candidate)
+                    self.kb.features = features
+                    self.assertEqual(score, expected, "candidate %d in paragraph %d: %r != %r" % (candidate, par, score, expected))
+                    checked += 1
+        finally:
+            self.kb.features = features
+
+        self.assertEqual(checked, 3 + 2 + 6)
+
+    def test_expired_deadline(self):
+        text = u"x" * 200
+        context = ner_cz.Context([], self.kb, [0, 100], [])
+        context.entities = [self.make_entity(10, [1, 2], text), self.make_entity(110, [3], text)]
+        for ent in context.entities:
+            ent.begin_of_paragraph = 0 if ent.start_offset < 100 else 100
+
+        deadline = ner_cz.Deadline(1e-9)
+        context.prepare_person_scores(deadline)
+        self.assertEqual(context.person_static_scores, {})
+        self.assertEqual(deadline.skipped_stages, ["Context construction"])
+
+    def test_mentions_per_paragraph(self):
+        text = u"x" * 200
+        entities = [self.make_entity(10, [1], text), self.make_entity(110, [3], text), self.make_entity(120, [3], text)]
+        for ent in entities:
+            ent.set_preferred_sense(ent.candidates[0])
+            ent.poorly_disambiguated = False
+
+        # zmínky se počítají v každém odstavci každého kontextu zvlášť
+        for i in xrange(2):
+            context = ner_cz.Context(entities, self.kb, [0, 100], [])
+            self.assertEqual(context.mentions[0]["person"], {"Tomáš Garrigue Masaryk": 1})
+            self.assertEqual(context.mentions[100]["person"], {"Karel Čapek": 2})
+        self.assertEqual(ner_cz.MENTIONS_TYPE["person"], {})
+
+    def test_reused_paragraph(self):
+        text = u"x" * 200
+        entities = [self.make_entity(10, [1, 2, 4], text), self.make_entity(110, [3], text), self.make_entity(120, [3, 5], text)]
+        entities[1].set_preferred_sense(3)
+        entities[1].poorly_disambiguated = False
+        context = ner_cz.Context(entities, self.kb, [0, 100], [])
+
+        # převzatý odstavec má stejné statistiky jako spočítaný a jeho entity znají svůj odstavec
+        reused = {100: context.paragraph_state(100)}
+        for ent in entities:
+            ent.begin_of_paragraph = None
+        reused_context = ner_cz.Context(entities, self.kb, [0, 100], [], reused_paragraphs=reused)
+        for par in [0, 100]:
+            self.assertEqual(reused_context.paragraph_state(par), context.paragraph_state(par))
+        self.assertEqual([ent.begin_of_paragraph for ent in entities], [0, 100, 100])
+        self.assertEqual(reused_context.reused_paragraphs, set([100]))
+
+
+class ScoreTest(FixtureKBTestCase):
+    """ Skóre z číselného sloupce, z příznaků i z textu KB je float, jen chybějící CONFIDENCE dává 0. """
+
+    def test_score(self):
+        kb_shm = self.kb.kb_shm
+        numerics = kb_shm.numeric_Boost
+        features = self.kb.features
+        try:
+            for source in ["numeric column", "features", "text"]:
+                self.assertEqual([repr(self.kb.get_score(line)) for line in [7, 8, 9]], ["95.0", "0.0", "0"], source)
+                if source == "numeric column":
+                    kb_shm.numeric_Boost = {}
+                else:
+                    self.kb.features = None
+        finally:
+            kb_shm.numeric_Boost = numerics
+            self.kb.features = features
+
+
+class FramedDaemonTest(FixtureKBTestCase):
+    """ Rámcový daemon odpovídá na chybný rámec rámcem "error" a nikdy nečte dokument jako hlavičku. """
+
+    ARGUMENTS = argparse.Namespace(lowercase=False, remove_accent=False, automaton=None, max_candidates=None, time_budget=None, stats=False)
+
+    def setUp(self):
+        self.saved_recognize = ner_cz.recognize
+
+    def tearDown(self):
+        ner_cz.recognize = self.saved_recognize
+
+    def run_daemon(self, requests):
+        """ Vrátí odpovědi daemonu na požadavky jako seznam dvojic (příznaky, výstup). """
+        stdout = io.BytesIO()
+        ner_cz.run_framed_daemon(self.kb, self.ARGUMENTS, io.BytesIO(requests), stdout)
+        stdout.seek(0)
+        responses = []
+        while True:
+            header = ner_cz.read_frame_header(stdout)
+            if header is None:
+                return responses
+            length, flags = header
+            responses.append((flags, ner_cz.read_frame_payload(stdout, length)))
+
+    def test_invalid_header(self):
+        ner_cz.recognize = lambda kb, input_string, **options: []
+        # dokument za neplatnou hlavičkou by se četl jako další rámce
+        responses = self.run_daemon("x 5\n1 all\nPraha\n5\nPraha")
+        self.assertEqual(len(responses), 1)
+        self.assertEqual(responses[0][0], ["error"])
+
+    def test_short_payload(self):
+        ner_cz.recognize = lambda kb, input_string, **options: []
+        responses = self.run_daemon("5\nPraha10\nPraha")
+        self.assertEqual([flags for flags, output in responses], [[], ["error"]])
+
+    def test_recognize_error(self):
+        def recognize(kb, input_string, **options):
+            if input_string == "chyba":
+                raise RuntimeError("test")
+            return []
+        ner_cz.recognize = recognize
+
+        # selhání dokumentu (i v relaci) neukončí daemon
+        responses = self.run_daemon("5\nchyba5 session=1\nchyba5 session=1\nPraha5\nPraha")
+        self.assertEqual(responses, [(["error"], "RuntimeError: test"), (["error"], "RuntimeError: test"), ([], ""), ([], "")])
+
+
+class KnowledgeBaseStartTest(unittest.TestCase):
+    """ Obraz KB se namapuje místo démona jen tehdy, když nebyla zadána sdílená paměť. """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="test_ner_cz.")
+        self.saved_paths = (ner_knowledge_base.PATH_KB, ner_knowledge_base.PATH_KB_IMAGE)
+        ner_knowledge_base.PATH_KB = os.path.join(self.tmp_dir, "KB-HEAD.all")
+        ner_knowledge_base.PATH_KB_IMAGE = ner_knowledge_base.PATH_KB + ".bin"
+        with open(ner_knowledge_base.PATH_KB, "w") as f:
+            f.write(KB_FIXTURE)
+
+    def tearDown(self):
+        ner_knowledge_base.PATH_KB, ner_knowledge_base.PATH_KB_IMAGE = self.saved_paths
+        shutil.rmtree(self.tmp_dir)
+
+    def start_kb(self, kb_shm_name=None):
+        kb = ner_knowledge_base.KnowledgeBaseCZ(kb_shm_name)
+        kb.start()
+        self.addCleanup(kb.end)
+        return kb
+
+    def test_explicit_shm_name(self):
+        # démon zapíše obraz KB při prvním načtení
+        self.start_kb("/test_ner_cz-image-%d" % os.getpid()).end()
+        self.assertTrue(os.path.isfile(ner_knowledge_base.PATH_KB_IMAGE))
+
+        kb_shm_name = "/test_ner_cz-explicit-%d" % os.getpid()
+        kb = self.start_kb(kb_shm_name)
+        self.assertEqual(kb.kb_shm_name, kb_shm_name)
+        self.assertNotEqual(kb.kb_daemon, None)
+        self.assertEqual(kb.get_data_for(7, "NAME"), "Praha")
+
+        kb = self.start_kb()
+        self.assertEqual(kb.kb_shm_name, ner_knowledge_base.PATH_KB_IMAGE)
+        self.assertEqual(kb.kb_daemon, None)
+        self.assertEqual(kb.get_data_for(7, "NAME"), "Praha")
+        # CONFIDENCE je celočíselný sloupec, skóre je ale float
+        self.assertEqual(repr(kb.get_score(7)), "95.0")
+
+
+class IterParagraphsTest(unittest.TestCase):
+    """ Odstavce čtené z proudu po částech musí být stejné jako odstavce celého textu po str.strip(). """
+
+    TEXTS = [
+        "Karel Čapek\n\nJosef Čapek\n",
+        "\n\n  Praha\r\n\r\nBrno\n\n\n",
+        "Praha\n\n \t\n\n  \n",
+        "Praha\n\nBrno\n\n  Ostrava  ",
+        "Praha\n\n \n\nBrno\n\n",
+        "jeden odstavec",
+        " \n\n ",
+        "",
+    ]
+
+    def test_strip(self):
+        for text in self.TEXTS:
+            expected = ner_cz.split_paragraphs(text.strip().decode("utf-8"))
+            for chunk_size in [1, 2, 3, 7, 1024]:
+                actual = list(ner_cz.iter_paragraphs(io.BytesIO(text), chunk_size))
+                self.assertEqual(actual, expected, "%r by %d: %r != %r" % (text, chunk_size, actual, expected))
+
+
+class IntSetTest(unittest.TestCase):
+    """ IntSet se chová jako neměnná množina celých čísel použitelná v klíči slovníku. """
+
+    def test_set_operations(self):
+        a = ner_knowledge_base.IntSet([5, 1, 3, 1])
+        self.assertEqual(list(a), [1, 3, 5])
+        self.assertEqual(len(a), 3)
+        self.assertTrue(3 in a and 4 not in a)
+        self.assertEqual(list(a & [3, 5, 7]), [3, 5])
+        self.assertEqual(list([0, 1] | a), [0, 1, 3, 5])
+        self.assertEqual(list(ner_knowledge_base.IntSet.union_all([a, ner_knowledge_base.IntSet([-1])])), [-1, 1, 3, 5])
+        self.assertFalse(ner_knowledge_base.IntSet())
+
+    def test_equality(self):
+        a = ner_knowledge_base.IntSet([1, 3])
+        b = ner_knowledge_base.IntSet(iter([3, 1]))
+        self.assertTrue(a == b and not a != b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertEqual({(a, "x"): 1}[(b, "x")], 1)
+        self.assertNotEqual(a, ner_knowledge_base.IntSet([1]))
+        # množina se stejnými čísly není IntSet
+        self.assertNotEqual(a, set([1, 3]))
+
+
+# Odstavce testovacího dokumentu pro testy nad skutečnou KB.
+PARAGRAPHS = [
+    "Tomáš Garrigue Masaryk byl prvním prezidentem Československa. Narodil se 7. března 1850 v Hodoníně.",
+    "Jeho syn Jan Masaryk byl ministrem zahraničí. On zemřel v Praze 10. března 1948.",
+    "Karel Čapek napsal hru R.U.R. a román Válka s mloky. Masaryk s ním vedl Hovory.",
+    "Masaryk a Čapek se poprvé setkali v Praze",
+]
+
+@unittest.skipUnless(os.path.isfile(ner_knowledge_base.PATH_KB) and ner_cz.automata.exists("default"), "requires KB-HEAD.all and the figa automaton")
+class RecognizeTestCase(unittest.TestCase):
+    """ Společný základ testů nad skutečnou KB a automatem figy. """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.kb = ner_cz.connect_kb()
+        cls.kb.start()
+        cls.kb.initName_dict()
+        cls.kb.initFeatures()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.kb.end()
+
+    def tearDown(self):
+        ner_cz.display_entity_score = False
+
+    def recognize(self, input_string, **options):
+        """ Vrátí výstup recognize() dokumentu. """
+        ner_cz.display_entity_score = False
+        return ner_cz.format_entities(ner_cz.recognize(self.kb, input_string, print_result=False, **options))
+
+
+class RecognizeTest(RecognizeTestCase):
+    """ Výstup dokumentu nesmí záviset na dokumentech zpracovaných před ním. """
+
+    def check_repeated_documents(self, **options):
+        documents = ["\n\n".join(PARAGRAPHS), PARAGRAPHS[2], PARAGRAPHS[1] + "\n\n" + PARAGRAPHS[3], PARAGRAPHS[2]]
+        expected = [self.recognize(document, **options) for document in documents]
+        for i in xrange(2):
+            self.assertEqual([self.recognize(document, **options) for document in documents], expected)
+        self.assertEqual(expected[1], expected[3])
+
+    def test_repeated_documents(self):
+        self.check_repeated_documents(print_score=True)
+
+    def test_stream(self):
+        text = "\n\n".join(PARAGRAPHS)
+        expected = self.recognize(text)
+        for padding in ["", "\n", "\n\n  \n\n \n"]:
+            # okno přes celý text musí dát stejný výstup jako nestreamovaný režim (s str.strip())
+            ner_cz.display_entity_score = False
+            actual = "\n".join(ner_cz.recognize_stream(self.kb, io.BytesIO(padding + text + padding), window_paragraphs=len(PARAGRAPHS)))
+            self.assertEqual(actual, expected)
+
+    def test_cache(self):
+        documents = [PARAGRAPHS[2], "\n\n".join(PARAGRAPHS), PARAGRAPHS[0], PARAGRAPHS[2], PARAGRAPHS[1] + "\n\n" + PARAGRAPHS[2], PARAGRAPHS[0], PARAGRAPHS[2]]
+        for options in [{}, {"print_score": True}]:
+            expected = [self.recognize(document, **options) for document in documents]
+
+            # výsledky z cache musí být stejné jako bez ní (--cache)
+            ner_cz.recognize_cache = ner_cz.RecognizeCache(self.kb, 100)
+            try:
+                self.assertEqual([self.recognize(document, **options) for document in documents], expected)
+                self.assertEqual(ner_cz.recognize_cache.hits["result"], 3)
+                self.assertTrue(ner_cz.recognize_cache.hits["figa"] > 0)
+            finally:
+                ner_cz.recognize_cache = None
+
+
+class AnnotationSessionTest(RecognizeTestCase):
+    """ Každá verze dokumentu rozpoznaná v AnnotationSession musí mít stejný výstup jako recognize() celé verze. """
+
+    @classmethod
+    def revisions(cls):
+        """ Vrátí verze dokumentu: změna, vložení, smazání a přesun odstavců a změna věty přes hranici odstavce. """
+        p = PARAGRAPHS
+        return ["\n\n".join(paragraphs) for paragraphs in [
+            p,
+            p,
+            [p[0], p[1].replace("ministrem zahraničí", "diplomatem"), p[2], p[3]],
+            [p[0], "Edvard Beneš byl druhým prezidentem.", p[1], p[2], p[3]],
+            [p[1], p[2], p[3]],
+            [p[3] + ".", p[2], p[1]],
+            [p[3], p[2] + " Masaryk byl filozof", "byl politik."],
+            [p[0]],
+        ]]
+
+    def check_revisions(self, **options):
+        session = ner_cz.AnnotationSession(self.kb, **options)
+        reused = collections.Counter()
+        for i, revision in enumerate(self.revisions()):
+            expected = self.recognize(revision, **options)
+            ner_cz.display_entity_score = False
+            stats = ner_cz.RecognizeStats(self.kb)
+            actual = ner_cz.format_entities(session.update(revision, stats))
+            self.assertEqual(actual, expected, "revision %d:\n%s\n!=\n%s" % (i, actual, expected))
+            reused.update(stats.counters)
+        # nezměněné (i posunuté) odstavce převzaly disambiguaci bez kontextu i s kontextem z minulé verze
+        self.assertTrue(reused["reused disambiguations"] > 0)
+        self.assertTrue(reused["reused paragraphs"] > 0)
+
+    def test_revisions(self):
+        self.check_revisions()
+
+    def test_revisions_with_scores(self):
+        self.check_revisions(print_score=True)
+
+    def test_revisions_with_pruning(self):
+        self.check_revisions(max_candidates=2)
+
+    def test_revision_after_degraded_revision(self):
+        session = ner_cz.AnnotationSession(self.kb)
+        revisions = self.revisions()
+
+        deadline = ner_cz.Deadline(1e-9)
+        session.update(revisions[0], deadline=deadline)
+        self.assertTrue(deadline.degraded)
+
+        # výsledek nedokončené verze se do další verze nepřenese
+        for revision in revisions[:2]:
+            expected = self.recognize(revision)
+            ner_cz.display_entity_score = False
+            self.assertEqual(ner_cz.format_entities(session.update(revision)), expected)
+
+if __name__ == "__main__":
+    unittest.main()
+
+# konec souboru test_ner_cz.py